@@ -0,0 +1,172 @@
+import os
+import time
+
+import openai
+
+from ingest.utils import content_hash, count_tokens
+from telemetry import count, observe, span
+
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+ANSWER_MODEL = os.getenv("ANSWER_MODEL", "gpt-4")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ANSWER_CONTEXT_TOKENS", "3000"))  # tokens of retrieved context
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "512"))
+
+SYSTEM_PROMPT = (
+    "You answer questions using only the numbered context passages provided. "
+    "Cite passages like [1]. If the context does not contain the answer, say so."
+)
+
+# Metadata that identifies the segment a chunk's char offsets are relative to
+_SEGMENT_KEYS = ("doc_id", "filename", "page", "start", "source")
+
+
+def _segment(metadata):
+    return tuple(metadata.get(k) for k in _SEGMENT_KEYS)
+
+
+def merge_overlapping(hits):
+    """
+    Collapse hybrid-search hits ({"id", "score", "payload"}) that repeat
+    text: exact duplicates are dropped, and chunks of the same segment whose
+    character ranges overlap or touch are stitched into one passage (keeping
+    the best score). Returns passages {"text", "score", "metadata", "ids"}
+    sorted by score, best first.
+    """
+    seen_text = set()
+    spans = {}  # segment -> [passage]
+    for hit in sorted(hits, key=lambda h: h["score"], reverse=True):
+        payload = hit["payload"] or {}
+        text = payload.get("text", "")
+        digest = content_hash(text)
+        if not text.strip() or digest in seen_text:
+            continue
+        seen_text.add(digest)
+        metadata = payload.get("metadata", {})
+        spans.setdefault(_segment(metadata), []).append(
+            {
+                "text": text,
+                "score": hit["score"],
+                "metadata": metadata,
+                "ids": [hit["id"]],
+                "start": metadata.get("char_start"),
+                "end": metadata.get("char_end"),
+            }
+        )
+
+    passages = []
+    for group in spans.values():
+        located = sorted((p for p in group if p["start"] is not None), key=lambda p: p["start"])
+        passages.extend(p for p in group if p["start"] is None)
+        current = None
+        for p in located:
+            if current is not None and p["start"] <= current["end"]:
+                if p["end"] > current["end"]:
+                    current["text"] += p["text"][current["end"] - p["start"] :]
+                    current["end"] = p["end"]
+                current["score"] = max(current["score"], p["score"])
+                current["ids"].extend(p["ids"])
+            else:
+                current = p
+                passages.append(current)
+    passages.sort(key=lambda p: p["score"], reverse=True)
+    return passages
+
+
+def pack_context(hits, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Choose the passages to put in the prompt: overlapping hits are merged
+    (`merge_overlapping`), then passages are added best score first while
+    they fit in `budget` tokens; ones that do not fit are skipped in favour
+    of smaller ones further down. If even the best passage is too long, it is
+    cut to the budget. Returns [{"n", "text", "score", "metadata", "ids", "tokens"}].
+    """
+    packed, used = [], 0
+    for passage in merge_overlapping(hits):
+        tokens = count_tokens(passage["text"])
+        if used + tokens > budget:
+            if packed:
+                continue
+            passage["text"] = passage["text"][: len(passage["text"]) * budget // tokens]
+            tokens = count_tokens(passage["text"])
+        packed.append({**passage, "n": len(packed) + 1, "tokens": tokens})
+        used += tokens
+        if used >= budget:
+            break
+    return packed
+
+
+def _label(metadata):
+    parts = [metadata.get("filename") or ""]
+    if metadata.get("page"):
+        parts.append(f"p.{metadata['page']}")
+    if metadata.get("start") is not None:
+        parts.append(f"{metadata['start']:.0f}s")
+    return " ".join(p for p in parts if p)
+
+
+def build_messages(question, context):
+    """
+    Chat messages for `question` over packed context passages.
+    """
+    passages = "\n\n".join(
+        f"[{c['n']}] ({_label(c['metadata'])})\n{c['text']}" for c in context
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context:\n{passages}\n\nQuestion: {question}"},
+    ]
+
+
+def generate_answer(
+    question,
+    hits,
+    on_token=None,
+    budget=CONTEXT_TOKEN_BUDGET,
+    model=ANSWER_MODEL,
+    max_tokens=ANSWER_MAX_TOKENS,
+):
+    """
+    Answer `question` from hybrid-search hits, streaming the completion:
+    `on_token(text_so_far)` is called as each delta arrives, so a UI can
+    render the answer while it is generated.
+
+    Returns {"answer", "context", "context_tokens", "ttft", "seconds"}, with
+    time-to-first-token and total latency in seconds, measured from the call.
+    """
+    start = time.perf_counter()
+    context = pack_context(hits, budget)
+    if not context:
+        return {"answer": "", "context": [], "context_tokens": 0, "ttft": None, "seconds": 0.0}
+
+    with span("answer.generate", model=model, passages=len(context)):
+        count("rag_external_calls_total", service="openai", op="chat")
+        stream = openai.chat.completions.create(
+            model=model,
+            messages=build_messages(question, context),
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        answer, ttft = "", None
+        for event in stream:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+                observe("rag_answer_ttft_seconds", ttft, model=model)
+            answer += delta
+            if on_token is not None:
+                on_token(answer)
+    count("rag_tokens_total", sum(c["tokens"] for c in context), model=model, kind="context")
+
+    return {
+        "answer": answer,
+        "context": context,
+        "context_tokens": sum(c["tokens"] for c in context),
+        "ttft": ttft,
+        "seconds": time.perf_counter() - start,
+    }
@@ -1,223 +1,113 @@
+import argparse
 import sys
-import openai
 
 print(">>> Python Path:", sys.executable)
 
-from ingest.text import extract_text_from_pdf
-from ingest.image_ocr import extract_text_from_image
-from ingest.audio_transcribe import transcribe_audio
-from extract.entity_graph_builder import extract_entities_and_relationships
+from ingest.pipeline import ingest_directory
+from retrieval.hybrid_search import hybrid_search
+import telemetry
 
 
-if __name__ == "__main__":
-    # --- PDF Test ---
-    pdf_data = extract_text_from_pdf("data/sample_files/sample.pdf")
-    # print("\nPDF METADATA:", pdf_data["metadata"])
-    # print("PDF TEXT:", pdf_data["text"][:500])
-
-    # --- Image Test ---
-    image_data = extract_text_from_image("data/sample_files/sample_image.jpg")
-    print("\nIMAGE METADATA:", image_data["metadata"])
-    print("IMAGE TEXT:", image_data["text"][:500])
-
-    # --- Audio Test ---
-    audio_data = transcribe_audio("data/sample_files/sample_audio.mp3")
-    print("\nAUDIO METADATA:", audio_data["metadata"])
-    print("AUDIO TEXT:", audio_data["text"][:500])
-
-    # --- Entity Extraction Test (choose one source) ---
-    sample_text = pdf_data["text"]  # Or use image_data["text"], audio_data["text"]
-    graph = extract_entities_and_relationships(sample_text)
-
-    print("\nENTITIES:", graph["entities"])
-    print("RELATIONSHIPS:")
-    for rel in graph["relationships"]:
-        print("-", rel)
-
-
-from graphdb.neo4j_setup import connect_to_neo4j, insert_graph_data, close_connection
-
-# Connect to Neo4j
-connect_to_neo4j("bolt://localhost:7687", "neo4j", "strongpassword123")
-
-# Insert to Neo4j
-insert_graph_data(graph["entities"], graph["relationships"])
-
-# Close connection
-close_connection()
-
-
-from vectordb.qdrant_setup import init_collection, add_document, search
-import uuid
-
-# --- Initialize vector store
-init_collection()
-
-# --- Choose a text block (e.g., from PDF)
-doc_text = pdf_data["text"]
-doc_meta = pdf_data["metadata"]
-
-# --- Add to Qdrant
-doc_id = str(uuid.uuid4())  # Generate a valid UUID for the document ID
-add_document(id=doc_id, text=doc_text, metadata=doc_meta)
-
-
-from graphdb.neo4j_setup import get_related_entities
-from neo4j import GraphDatabase
+def print_hybrid_search(
+    user_query: str, source_node: str, relation_type: str = None, answer: bool = False
+):
+    """
+    Run a hybrid query and print the fused hits with per-stage timings, and
+    optionally stream a generated answer.
+    """
+    print(f"\n--- Hybrid Search for '{user_query}' via '{source_node}' ---")
+    response = hybrid_search(user_query, source_node or None, relation_type)
 
-driver = GraphDatabase.driver(
-    "bolt://localhost:7687", auth=("neo4j", "strongpassword123")
-)
+    if response["entities"]:
+        print("Entities from Neo4j:", response["entities"])
+    print("\nHYBRID RESULTS:")
+    for hit in response["results"]:
+        text_payload = hit["payload"].get("text", "<no text>")
+        page = hit["payload"].get("metadata", {}).get("page")
+        cite = f" [p.{page}]" if page else ""
+        print(f"– Score {hit['score']:.4f} {hit['ranks']}{cite} | {text_payload[:120]}…")
 
+    timings = ", ".join(f"{k} {v:.0f}ms" for k, v in response["timings"].items())
+    print(f"\nTimings: {timings}")
+    if response["cache"]:
+        print(f"Served from query cache ({response['cache']} match)")
+    failed = {k: v for k, v in response["status"].items() if v != "ok"}
+    if failed:
+        print("⚠️ Degraded stages:", failed)
 
-from graphdb.neo4j_setup import connect_to_neo4j, get_related_entities, close_connection
-from vectordb.qdrant_setup import search
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MinShould
-from qdrant_client import QdrantClient
+    if answer:
+        from answer_gen.generate_answer import generate_answer
 
-from sentence_transformers import SentenceTransformer
+        print("\nANSWER:")
+        printed = 0
 
+        def on_token(text):
+            nonlocal printed
+            print(text[printed:], end="", flush=True)
+            printed = len(text)
 
-# -----------------------
-# 1) A small Neo4j helper
-# -----------------------
-class Neo4jConnector:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-
-    def close(self):
-        self.driver.close()
-
-    def get_related_entities(self, source_name, relation_type=None):
-        """
-        Return a list of node-names connected from `source_name`.
-        If relation_type is None, return all outgoing neighbors.
-        """
-        with self.driver.session() as session:
-            if relation_type:
-                cypher = f"""
-                MATCH (a {{name: $src}})-[r:`{relation_type}`]->(b)
-                RETURN DISTINCT b.name AS name
-                """
-                result = session.run(cypher, src=source_name)
-            else:
-                cypher = """
-                MATCH (a {name: $src})-[r]->(b)
-                RETURN DISTINCT b.name AS name
-                """
-                result = session.run(cypher, src=source_name)
-
-            return [record["name"] for record in result]
+        result = generate_answer(user_query, response["results"], on_token=on_token)
+        if result["ttft"] is not None:
+            print(f"\n\nFirst token {result['ttft']:.2f}s, total {result['seconds']:.2f}s")
 
 
 # -----------------------
-# 2) The hybrid_search function
+# CLI
 # -----------------------
-def hybrid_search(user_query: str, source_node: str, relation_type: str = None):
-    """
-    1) Look up neighbors of `source_node` in Neo4j.
-    2) Force-include `source_node` itself.
-    3) Wrap each in wildcard '*…*' and build a Filter.
-    4) Compute query_vector from user_query.
-    5) Call Qdrant search with that filter.
-    6) Print Neo4j list + Qdrant hits.
-    """
-    print(f"\n--- Hybrid Search for '{user_query}' via '{source_node}' ---")
-
-    # 1) Neo4j lookup
-    connector = Neo4jConnector("bolt://localhost:7687", "neo4j", "strongpassword123")
-    try:
-        related = connector.get_related_entities(source_node, None)
-        print("Entities from Neo4j:", related)
-        # Always include the source itself so "*source_node*" will match at least one chunk
-        if source_node not in related:
-            related.insert(0, source_node)
-        print("Entities from Neo4j:", related)
-    except Exception as e:
-        print("❌ Neo4j error:", e)
-        related = []
-    finally:
-        connector.close()
-
-    # 2) Build a Qdrant Filter with one FieldCondition per entity, each wildcarded
-    if related:
-        must_conditions = []
-        for ent in related:
-            wildcard = f"*{ent}*"
-            must_conditions.append(
-                FieldCondition(key="text", match=MatchValue(value=wildcard))
-            )
-        qdrant_filter = Filter(
-            should=must_conditions,
-            must=None,
-            must_not=None,
-            min_should=MinShould(conditions=must_conditions, min_count=1),
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multimodal RAG backend")
+    parser.add_argument("--trace", help="Enable telemetry and append spans to this JSON-lines file")
+    parser.add_argument("--metrics", help="Enable telemetry and write Prometheus metrics here at exit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Ingest a directory of PDFs, images, audio and video")
+    ingest.add_argument("root", nargs="?", default="data/sample_files")
+    ingest.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    ingest.add_argument("--no-graph", action="store_true", help="Skip entity extraction and Neo4j")
+    ingest.add_argument("--restart", action="store_true", help="Ignore the checkpoint and ingest everything")
+
+    search_cmd = commands.add_parser("search", help="Run a hybrid graph + vector query")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--node", default="", help="Graph node to expand from")
+    search_cmd.add_argument("--relation", default=None, help="Only follow this relation type")
+    search_cmd.add_argument("--answer", action="store_true", help="Stream an answer from the hits")
+
+    commands.add_parser(
+        "reindex-keywords", help="Rebuild the local BM25 index from the Qdrant collection"
+    )
+    commands.add_parser("health", help="Check the Neo4j and Qdrant connections")
+
+    args = parser.parse_args(argv)
+    if args.trace or args.metrics:
+        telemetry.enable(trace_log=args.trace, metrics_file=args.metrics)
+    telemetry.serve_metrics()  # no-op unless enabled with METRICS_PORT set
+    if args.command == "ingest":
+        stats = ingest_directory(
+            args.root, workers=args.workers, graph=not args.no_graph, resume=not args.restart
         )
-    else:
-        # If no Neo4j entities or error, do a pure semantic search (no filter)
-        qdrant_filter = None
-    # print("drant_filter")
-    # print(qdrant_filter)
-
-    # 3) Compute query_vector
-
-
-    def get_openai_embedding(text):
-            response = openai.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
-            return response.data[0].embedding
-
-    query_vector = get_openai_embedding(user_query)
-
-    # 4) Qdrant client + search
-    client = QdrantClient(host="localhost", port=6333)
-    try:
-        results = client.search(
-            collection_name="rag_chunks",
-            query_vector=query_vector,
-            limit=5,
-            query_filter=None,  # pass the Filter object here
-        )
-        print("\nQDRANT RESULTS:")
-        for hit in results:
-            text_payload = hit.payload.get("text", "<no text>")
-            print(f"– Score {hit.score:.3f} | {text_payload[:120]}…")
-    except Exception as e:
-        print("❌ Qdrant search error:", e)
+        return 1 if stats["failed"] else 0
+    if args.command == "reindex-keywords":
+        from retrieval.keyword_search import build_from_qdrant
+        from clients import get_qdrant_client
+        from vectordb.qdrant_setup import COLLECTION_NAME
+
+        count = build_from_qdrant(get_qdrant_client(), COLLECTION_NAME)
+        print(f"Indexed {count} chunks for keyword search")
+        return 0
+    if args.command == "search":
+        print_hybrid_search(args.query, args.node, args.relation, args.answer)
+        return 0
+    if args.command == "health":
+        from clients import health_check
+
+        status = health_check()
+        for backend, result in status.items():
+            mark = "✅" if result["ok"] else "❌"
+            print(f"{mark} {backend}: {result['latency_ms']:.1f} ms {result.get('error', '')}")
+        return 0 if all(result["ok"] for result in status.values()) else 1
 
 
-# -----------------------
-# 3) Usage examples
-# -----------------------
-
-# Example A: filter on “Hybrid Search”
-# hybrid_search(user_query="What do cats like", source_node="cow")
-
-# Example B: filter on “knowledge graph”
-hybrid_search(
-    user_query="What is a searchable knowledge graph?", source_node="knowledge graph"
-)
-
-# Example C: filter on the full long title (copy exactly from your chunk)
-long_title = "Multimodal Enterprise RAG – Leveraging Knowledge Graphs and Hybrid Search"
-hybrid_search(user_query="Describe this RAG challenge", source_node=long_title)
-
-
-# Example usage
-# hybrid_search(
-#     user_query="What is this 72-Hour Technical Challenge about?",
-#     structured_filter_source="Multimodal Enterprise RAG – Leveraging Knowledge Graphs and Hybrid Search",
-#     relation_type=None,
-# )
-# hybrid_search(
-#     user_query="Describe the RAG system workflow",
-#     source_node="Enterprise Retrieval-Augmented Generation (RAG) system",
-#     relation_type=None,
-# )
-# hybrid_search(
-#     user_query="What is this 72-Hour Technical Challenge about?",
-#     structured_filter_source="Multimodal Enterprise RAG – Leveraging Knowledge Graphs and Hybrid Search",
-#     relation_type=None,
-# )
+if __name__ == "__main__":
+    # e.g. python backend/app.py ingest data/sample_files
+    #      python backend/app.py search "What is a searchable knowledge graph?" --node "knowledge graph"
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Process-wide database clients.
+
+One pooled Neo4j driver and one Qdrant client are created on first use and
+shared by every module, request and Streamlit rerun in the process, so
+connection setup is paid once instead of on every query.
+"""
+import os
+import threading
+import time
+
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")  # Docker default
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASS = os.getenv("NEO4J_PASS", "strongpassword123")  # match your docker run password
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "50"))
+NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "10"))  # seconds
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "1") == "1"
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))  # seconds
+
+_lock = threading.Lock()
+_neo4j_driver = None
+_neo4j_auth = None
+_qdrant_client = None
+
+
+def get_neo4j_driver(uri=None, user=None, password=None):
+    """
+    Return the shared Neo4j driver, creating it (with a bounded connection
+    pool) on first use. Passing different credentials replaces the driver.
+    """
+    global _neo4j_driver, _neo4j_auth
+    auth = (uri or NEO4J_URI, user or NEO4J_USER, password or NEO4J_PASS)
+    with _lock:
+        if _neo4j_driver is not None and _neo4j_auth != auth:
+            _neo4j_driver.close()
+            _neo4j_driver = None
+        if _neo4j_driver is None:
+            from neo4j import GraphDatabase
+
+            _neo4j_driver = GraphDatabase.driver(
+                auth[0],
+                auth=auth[1:],
+                max_connection_pool_size=NEO4J_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUIRE_TIMEOUT,
+            )
+            _neo4j_auth = auth
+        return _neo4j_driver
+
+
+def get_qdrant_client():
+    """
+    Return the shared Qdrant client, using gRPC when the grpc package is
+    installed (and QDRANT_PREFER_GRPC is not 0), otherwise REST.
+    """
+    global _qdrant_client
+    with _lock:
+        if _qdrant_client is None:
+            from qdrant_client import QdrantClient
+
+            try:
+                import grpc  # noqa: F401
+
+                prefer_grpc = QDRANT_PREFER_GRPC
+            except ImportError:
+                prefer_grpc = False
+            _qdrant_client = QdrantClient(
+                host=QDRANT_HOST,
+                port=QDRANT_PORT,
+                grpc_port=QDRANT_GRPC_PORT,
+                prefer_grpc=prefer_grpc,
+                timeout=QDRANT_TIMEOUT,
+            )
+        return _qdrant_client
+
+
+def _timed_check(check):
+    start = time.perf_counter()
+    try:
+        check()
+        return {"ok": True, "latency_ms": (time.perf_counter() - start) * 1000}
+    except Exception as e:
+        return {"ok": False, "latency_ms": (time.perf_counter() - start) * 1000, "error": str(e)}
+
+
+def health_check():
+    """
+    Ping both backends over their pooled connections.
+    Returns {"neo4j": {"ok", "latency_ms"[, "error"]}, "qdrant": {...}}.
+    """
+    return {
+        "neo4j": _timed_check(lambda: get_neo4j_driver().verify_connectivity()),
+        "qdrant": _timed_check(lambda: get_qdrant_client().get_collections()),
+    }
+
+
+def close_clients(neo4j=True, qdrant=True):
+    """
+    Close the shared clients (e.g. at CLI exit). They are recreated on next use.
+    """
+    global _neo4j_driver, _neo4j_auth, _qdrant_client
+    with _lock:
+        if neo4j and _neo4j_driver is not None:
+            _neo4j_driver.close()
+            _neo4j_driver, _neo4j_auth = None, None
+        if qdrant and _qdrant_client is not None:
+            _qdrant_client.close()
+            _qdrant_client = None
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: token-aware chunker vs. the original word/sentence chunker.
+
+Run from backend/:
+    python -m eval.bench_chunker --sizes 1 4 8
+"""
+import argparse
+import random
+import re
+import time
+
+from ingest.utils import chunk_text_with_offsets, count_tokens
+
+
+def legacy_chunk_text(text, chunk_size=500, overlap=50):
+    """
+    The previous ingest.utils.chunk_text, kept verbatim for comparison:
+    sizes in whitespace words, overlap in sentences.
+    """
+    sentences = re.split(r"(?<=[.!?]) +", text)
+    chunks = []
+    current_chunk = []
+
+    total_length = 0
+    for sentence in sentences:
+        sentence_len = len(sentence.split())
+        if total_length + sentence_len > chunk_size:
+            chunks.append(" ".join(current_chunk))
+            current_chunk = current_chunk[-overlap:] if overlap else []
+            total_length = sum(len(s.split()) for s in current_chunk)
+        current_chunk.append(sentence)
+        total_length += sentence_len
+
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+
+    return chunks
+
+
+def make_text(megabytes, seed=0):
+    """
+    Generate roughly `megabytes` MB of sentence-structured filler text.
+    """
+    rng = random.Random(seed)
+    words = [
+        "graph", "vector", "retrieval", "knowledge", "entity", "relation", "chunk",
+        "embedding", "index", "query", "document", "pipeline", "latency", "the",
+        "a", "of", "and", "to", "with", "enterprise", "multimodal", "search",
+    ]
+    target = int(megabytes * 1024 * 1024)
+    parts, size = [], 0
+    while size < target:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 30)))
+        sentence = sentence.capitalize() + rng.choice(".!?") + " "
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def bench(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4], help="input sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for mb in args.sizes:
+        text = make_text(mb)
+        legacy_time, legacy_chunks = bench(legacy_chunk_text, text, args.repeat)
+        new_time, new_chunks = bench(chunk_text_with_offsets, text, args.repeat)
+        legacy_max = max(count_tokens(c) for c in legacy_chunks)
+        new_max = max(c["tokens"] for c in new_chunks)
+        print(
+            f"{mb:>5.1f} MB | legacy {legacy_time:7.3f}s {len(legacy_chunks):6d} chunks "
+            f"(max {legacy_max} tokens) | token-aware {new_time:7.3f}s "
+            f"{len(new_chunks):6d} chunks (max {new_max} tokens) | "
+            f"{mb / new_time:6.2f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cold-start latency of the CLI and of the Streamlit app's imports.
+
+Each measurement runs in a fresh interpreter, so nothing is shared between
+runs (the OS file cache still is). Run from backend/:
+    python -m eval.startup_time --runs 5 --json startup.json
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _ui_imports():
+    """
+    The import statements at the top level of ui-app.py, as one script.
+    Importing ui-app itself would execute the Streamlit page.
+    """
+    with open(os.path.join(BACKEND_DIR, "ui-app.py")) as f:
+        tree = ast.parse(f.read())
+    nodes = [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(n) for n in nodes)
+
+
+def _time_command(cmd, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _slowest_imports(code, top):
+    """
+    Parse `python -X importtime` output into the `top` slowest modules
+    (cumulative microseconds).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        # Nested imports are indented two spaces per level past the one after "|"
+        if not name[1:].startswith(" "):
+            rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": us / 1000} for us, name in rows[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start latency")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    targets = {
+        "cli": [sys.executable, "app.py", "--help"],
+        "streamlit_imports": [sys.executable, "-c", _ui_imports()],
+    }
+    import_code = {"cli": "import app", "streamlit_imports": _ui_imports()}
+
+    results = {}
+    for name, cmd in targets.items():
+        samples = _time_command(cmd, args.runs)
+        results[name] = {
+            "median_s": statistics.median(samples),
+            "min_s": min(samples),
+            "max_s": max(samples),
+            "slowest_imports": _slowest_imports(import_code[name], args.top),
+        }
+        print(f"{name:>18}: median {results[name]['median_s']:.3f}s over {args.runs} runs")
+        for row in results[name]["slowest_imports"]:
+            print(f"{'':>20}{row['cumulative_ms']:9.1f} ms  {row['module']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,559 @@
+"""
+Offline benchmark: ingestion throughput, per-stage query latency and
+retrieval quality, with no network services.
+
+OpenAI is replaced by deterministic fakes (hashed bag-of-words embeddings,
+rule-based entity extraction, canned streamed answers), Qdrant by the local
+vector index (VECTOR_BACKEND=local) and Neo4j by an in-memory driver that
+answers the Cypher this repo sends. Every run writes to a fresh cache
+directory, so runs do not share state. Run from backend/:
+    python -m eval.test --json bench.json
+    python -m eval.test --json new.json --baseline bench.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from types import SimpleNamespace
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "data", "sample_files")
+QUERIES_PATH = os.path.join(BACKEND_DIR, "eval", "queries.json")
+EMBEDDING_DIM = 1536  # matches the local index and the Qdrant collection
+
+# A baseline is flagged when p95 latency grows by more than this fraction
+# or recall/MRR drops by more than QUALITY_TOLERANCE
+LATENCY_TOLERANCE = 0.2
+QUALITY_TOLERANCE = 0.01
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ENTITY = re.compile(r"\b[A-Z][A-Za-z0-9]+(?:\s+[A-Z][A-Za-z0-9]+)*")
+_NOT_ENTITIES = frozenset(
+    "A An The This That These Those It Its In On At Of To For And Or But If When While "
+    "There Both Unlike During Interestingly Unfortunately However Before Within".split()
+)
+
+
+# --- fake OpenAI --------------------------------------------------------
+
+
+@lru_cache(maxsize=None)
+def _feature(token):
+    digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+    return digest % EMBEDDING_DIM, 1.0 if digest >> 63 else -1.0
+
+
+def fake_embedding(text):
+    """
+    Deterministic stand-in for an embedding: signed feature hashing of the
+    text's lowercased words (with a trailing plural "s" dropped), L2-normalized.
+    Texts sharing words get similar vectors, so retrieval quality is measurable.
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in _WORD.findall(text.casefold()):
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        index, sign = _feature(word)
+        vector[index] += sign
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def fake_extraction(text):
+    """
+    Rule-based stand-in for the extraction model's JSON reply: capitalized
+    phrases are entities, and consecutive entities in a sentence are related.
+    """
+    entities, relationships = {}, []
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        found = [m.group(0) for m in _ENTITY.finditer(sentence) if m.group(0) not in _NOT_ENTITIES]
+        for name in found:
+            entities.setdefault(name, None)
+        relationships.extend(
+            {"source": a, "relation": "co_occurs_with", "target": b}
+            for a, b in zip(found, found[1:])
+            if a != b
+        )
+    return json.dumps({"entities": list(entities), "relationships": relationships})
+
+
+def _completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _FakeEmbeddings:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, model, input):
+        time.sleep(self.latency)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=fake_embedding(t)) for i, t in enumerate(input)]
+        )
+
+
+class _FakeCompletions:
+    """
+    Answers by quoting the first context passage, streamed word by word.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, model, messages, stream=False, **kwargs):
+        time.sleep(self.latency)
+        lines = messages[-1]["content"].split("\n")
+        passage = lines[2] if len(lines) > 2 else ""
+        answer = "According to [1], " + " ".join(passage.split()[:40])
+        if not stream:
+            return _completion(answer)
+        return (
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+            for word in answer.split()
+        )
+
+
+class _FakeAsyncOpenAI:
+    latency = 0.0
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def _create(self, model, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _completion(fake_extraction(messages[-1]["content"].split('"""')[1]))
+
+
+# --- fake Neo4j ---------------------------------------------------------
+
+
+class _FakeResult:
+    def __init__(self, records):
+        self._records = records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def data(self):
+        return list(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def consume(self):
+        return None
+
+
+class _FakeSession:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, **params):
+        return self._driver.run(query, **params)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return fn(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+    def close(self):
+        pass
+
+
+class FakeNeo4jDriver:
+    """
+    In-memory stand-in for the Neo4j driver. It answers the fixed set of
+    Cypher statements sent by neo4j_setup and graph_snapshot; any other
+    query raises, so a new one is noticed instead of silently ignored.
+    """
+
+    def __init__(self):
+        self.entities = set()
+        self.relationships = set()  # (source, relation, target, extra)
+        self.mentions = set()  # (entity, chunk id)
+        self._lock = threading.Lock()
+
+    def session(self, **kwargs):
+        return _FakeSession(self)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, query, **params):
+        q = " ".join(query.split())
+        with self._lock:
+            if q.startswith("RETURN 1"):
+                return _FakeResult([{"test": 1}])
+            if q.startswith("CREATE CONSTRAINT") or q.startswith("CREATE INDEX"):
+                return _FakeResult([])
+            if "MERGE (:Entity" in q:
+                self.entities.update(params["names"])
+                return _FakeResult([])
+            if "MERGE (a)-[r:RELATION" in q:
+                written = 0
+                for row in params["rows"]:
+                    if row["source"] in self.entities and row["target"] in self.entities:
+                        self.relationships.add(
+                            (row["source"], row["relation"], row["target"], row["extra"])
+                        )
+                        written += 1
+                return _FakeResult([{"written": written}])
+            if "MERGE (e)-[:MENTIONED_IN]" in q:
+                for row in params["rows"]:
+                    if row["name"] in self.entities:
+                        self.mentions.update((row["name"], c) for c in row["chunks"])
+                return _FakeResult([])
+            if q.startswith("MATCH (e:Entity) RETURN"):
+                return _FakeResult([{"name": name} for name in sorted(self.entities)])
+            if q.startswith("MATCH (a:Entity)-[r]->(b:Entity)"):
+                return _FakeResult(
+                    [
+                        {"source": s, "relation": r, "target": t}
+                        for s, r, t, _ in sorted(self.relationships)
+                    ]
+                )
+            if q.startswith("MATCH (e:Entity)-[:MENTIONED_IN]->(c:Chunk)"):
+                return _FakeResult([{"name": n, "chunk": c} for n, c in sorted(self.mentions)])
+        raise NotImplementedError(f"FakeNeo4jDriver does not handle: {q[:80]}")
+
+
+def install_fakes(latency=0.0):
+    """
+    Point the backend at the fakes: OpenAI module attributes are replaced
+    (so the real retry, cache and batching code still runs), and the Neo4j
+    setup hands out a FakeNeo4jDriver. `latency` seconds are slept per API
+    call to model network round trips.
+    """
+    import openai
+
+    import graphdb.neo4j_setup as neo4j_setup
+
+    openai.embeddings = _FakeEmbeddings(latency)
+    openai.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+    _FakeAsyncOpenAI.latency = latency
+    openai.AsyncOpenAI = _FakeAsyncOpenAI
+    driver = FakeNeo4jDriver()
+    neo4j_setup.get_neo4j_driver = lambda *args, **kwargs: driver
+    return driver
+
+
+# --- measurements -------------------------------------------------------
+
+
+def percentiles(samples):
+    """
+    p50/p95/p99, mean and count of latency samples (ms).
+    """
+    values = np.asarray(samples, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": p50, "p95": p95, "p99": p99, "mean": values.mean(), "n": len(values)}
+
+
+def ingest_files(paths):
+    """
+    Run each file through the pipeline's own stages (extraction, vector
+    store, graph) in-process, timing every stage. Returns per-file rows.
+    """
+    from ingest.pipeline import _setup_graph_stage, _setup_vector_stage, extract_file, file_kind
+    from retrieval.vector_search import get_local_index
+
+    vector_stage, commit = _setup_vector_stage()
+    graph_stage, _ = _setup_graph_stage()
+    index = get_local_index()
+    rows = []
+    for path in paths:
+        row = {"file": os.path.basename(path), "kind": file_kind(path), "bytes": os.path.getsize(path)}
+        try:
+            start = time.perf_counter()
+            result = extract_file(path)
+            row["extract_s"] = time.perf_counter() - start
+            row["chars"] = len(result["text"])
+            if result.get("errors"):
+                raise ValueError("; ".join(result["errors"]))
+            if not result["text"].strip():
+                # Extractors report their own failures and return no text
+                raise ValueError("no text extracted")
+            before = len(index)
+            start = time.perf_counter()
+            vector_stage(path, result)
+            row["vector_s"] = time.perf_counter() - start
+            row["chunks"] = len(index) - before
+            start = time.perf_counter()
+            graph_stage(path, result)
+            row["graph_s"] = time.perf_counter() - start
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        rows.append(row)
+    commit()
+    return rows
+
+
+def summarize_ingestion(rows):
+    """
+    Per-modality totals and throughput (files/s and MB/s end to end,
+    chunks/s through the vector stage).
+    """
+    summary = {}
+    for row in rows:
+        s = summary.setdefault(
+            row["kind"],
+            {"files": 0, "failed": 0, "bytes": 0, "chars": 0, "chunks": 0,
+             "extract_s": 0.0, "vector_s": 0.0, "graph_s": 0.0, "errors": []},
+        )
+        if "error" in row:
+            s["failed"] += 1
+            s["errors"].append(f"{row['file']}: {row['error']}")
+            continue
+        s["files"] += 1
+        for key in ("bytes", "chars", "chunks", "extract_s", "vector_s", "graph_s"):
+            s[key] += row[key]
+    for s in summary.values():
+        total = s["extract_s"] + s["vector_s"] + s["graph_s"]
+        s["seconds"] = total
+        s["files_per_sec"] = s["files"] / total if total else 0.0
+        s["mb_per_sec"] = s["bytes"] / 1e6 / total if total else 0.0
+        s["chunks_per_sec"] = s["chunks"] / s["vector_s"] if s["vector_s"] else 0.0
+    return summary
+
+
+def _normalize(text):
+    return " ".join(text.casefold().split())
+
+
+def relevant_chunks(queries):
+    """
+    For each query, the IDs of indexed chunks containing any of its
+    evidence strings (case- and whitespace-insensitive).
+    """
+    from retrieval.vector_search import get_local_index
+
+    index = get_local_index()
+    chunks = [
+        (point_id, _normalize((payload or {}).get("text", "")))
+        for point_id, payload in zip(index.ids, index.payloads)
+        if point_id is not None
+    ]
+    return [
+        {point_id for point_id, text in chunks if any(_normalize(e) in text for e in q["evidence"])}
+        for q in queries
+    ]
+
+
+def run_queries(queries, relevant, k, repeat, warmup):
+    """
+    Run every query `repeat` times (after `warmup` untimed rounds), with a
+    streamed answer each time. Returns (latency samples per stage, per-query
+    quality rows from the first timed round, count of degraded stages).
+    """
+    from answer_gen.generate_answer import generate_answer
+    from retrieval.hybrid_search import hybrid_search
+
+    for _ in range(warmup):
+        for q in queries:
+            hybrid_search(q["query"], q.get("node"), top_k=k)
+
+    samples, quality, degraded = {}, [], 0
+    for round_ in range(repeat):
+        for q, rel in zip(queries, relevant):
+            response = hybrid_search(q["query"], q.get("node"), top_k=k)
+            for stage, ms in response["timings"].items():
+                samples.setdefault(stage, []).append(ms)
+            degraded += sum(status != "ok" for status in response["status"].values())
+            answer = generate_answer(q["query"], response["results"])
+            if answer["ttft"] is not None:
+                samples.setdefault("answer_ttft", []).append(answer["ttft"] * 1000)
+                samples.setdefault("answer", []).append(answer["seconds"] * 1000)
+            if round_:
+                continue
+            ranked = [hit["id"] for hit in response["results"]]
+            row = {"query": q["query"], "modality": q.get("modality"), "relevant": len(rel)}
+            if rel:
+                first = next((i for i, doc_id in enumerate(ranked, start=1) if doc_id in rel), None)
+                row["recall"] = len(rel.intersection(ranked)) / len(rel)
+                row["rr"] = 1 / first if first else 0.0
+                row["rank"] = first
+            quality.append(row)
+    return samples, quality, degraded
+
+
+def summarize_quality(rows, k):
+    """
+    Mean recall@k and MRR over queries with at least one relevant chunk,
+    overall and per modality. Queries whose evidence was not ingested (e.g.
+    the extractor for that modality is unavailable) are counted as skipped.
+    """
+    def mean(rows, key):
+        return float(np.mean([r[key] for r in rows])) if rows else None
+
+    scored = [r for r in rows if "recall" in r]
+    by_modality = {}
+    for r in scored:
+        by_modality.setdefault(r["modality"], []).append(r)
+    return {
+        "k": k,
+        "recall_at_k": mean(scored, "recall"),
+        "mrr": mean(scored, "rr"),
+        "evaluated": len(scored),
+        "skipped": [r["query"] for r in rows if "recall" not in r],
+        "modalities": {
+            m: {"recall_at_k": mean(rs, "recall"), "mrr": mean(rs, "rr"), "queries": len(rs)}
+            for m, rs in by_modality.items()
+        },
+        "queries": rows,
+    }
+
+
+def compare(results, baseline):
+    """
+    Print changes against an earlier results file; returns the regressions.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for stage, stats in results["latency_ms"].items():
+        old = baseline.get("latency_ms", {}).get(stage)
+        if not old:
+            continue
+        change = (stats["p95"] - old["p95"]) / old["p95"] if old["p95"] else 0.0
+        flag = change > LATENCY_TOLERANCE
+        if flag:
+            regressions.append(f"{stage} p95 {old['p95']:.1f} -> {stats['p95']:.1f} ms")
+        print(f"{'⚠️' if flag else '  '} {stage:>14} p95 {old['p95']:8.1f} -> {stats['p95']:8.1f} ms ({change:+.0%})")
+    for metric in ("recall_at_k", "mrr"):
+        new, old = results["quality"][metric], baseline.get("quality", {}).get(metric)
+        if new is None or old is None:
+            continue
+        flag = new < old - QUALITY_TOLERANCE
+        if flag:
+            regressions.append(f"{metric} {old:.3f} -> {new:.3f}")
+        print(f"{'⚠️' if flag else '  '} {metric:>14} {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmark")
+    parser.add_argument("--data", default=DATA_DIR, help="directory of files to ingest")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="labeled query set (JSON)")
+    parser.add_argument("--modalities", nargs="+", help="only ingest these kinds (pdf image audio video)")
+    parser.add_argument("--k", type=int, default=5, help="hits per query for recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds over the query set")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds slept per fake API call")
+    parser.add_argument("--json", default="benchmark.json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--cache-dir", help="cache directory to use (default: a fresh temp dir)")
+    args = parser.parse_args()
+
+    # Module-level settings are read on import, so configure before importing the backend
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ.update(
+        {
+            "RAG_CACHE_DIR": cache_dir,
+            "VECTOR_BACKEND": "local",
+            "QUERY_CACHE_DISABLED": "1",
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "offline",
+        }
+    )
+    install_fakes(args.api_latency)
+    from ingest.pipeline import discover_files, file_kind
+
+    try:
+        paths = [
+            p for p in discover_files(args.data)
+            if not args.modalities or file_kind(p) in args.modalities
+        ]
+        with open(args.queries) as f:
+            queries = json.load(f)
+
+        rows = ingest_files(paths)
+        samples, quality, degraded = run_queries(
+            queries, relevant_chunks(queries), args.k, args.repeat, args.warmup
+        )
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    results = {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "files": len(paths),
+            "queries": len(queries),
+            "k": args.k,
+            "repeat": args.repeat,
+            "api_latency_s": args.api_latency,
+        },
+        "ingestion": {"modalities": summarize_ingestion(rows), "files": rows},
+        "latency_ms": {stage: percentiles(values) for stage, values in samples.items()},
+        "degraded_stages": degraded,
+        "quality": summarize_quality(quality, args.k),
+    }
+
+    print("\nIngestion:")
+    for kind, s in results["ingestion"]["modalities"].items():
+        print(
+            f"{kind:>8}: {s['files']} files ({s['failed']} failed) in {s['seconds']:.2f}s | "
+            f"{s['files_per_sec']:.2f} files/s, {s['mb_per_sec']:.2f} MB/s, "
+            f"{s['chunks_per_sec']:.0f} chunks/s embedded"
+        )
+        for error in s["errors"]:
+            print(f"{'':>10}❌ {error}")
+    print("\nQuery latency (ms):")
+    for stage, s in results["latency_ms"].items():
+        print(f"{stage:>14}: p50 {s['p50']:8.2f}  p95 {s['p95']:8.2f}  p99 {s['p99']:8.2f}  (n={s['n']})")
+    q = results["quality"]
+    if q["evaluated"]:
+        print(f"\nrecall@{args.k} {q['recall_at_k']:.3f}  MRR {q['mrr']:.3f} over {q['evaluated']} queries")
+    if q["skipped"]:
+        print(f"⚠️ {len(q['skipped'])} queries have no relevant chunks ingested: {q['skipped']}")
+
+    with open(args.json, "w") as f:
+        json.dump(results, f, indent=2, default=float)
+    print(f"\n✅ Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print("❌ Regressions:", "; ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,38 @@
+import asyncio
+import json
 import openai
 import os
+import time
+from contextlib import AsyncExitStack
 from dotenv import load_dotenv
 
+from extract.extraction_cache import get_extraction_cache
+from ingest.utils import chunk_text, content_hash, count_tokens
+from openai_retry import with_retries_async
+from telemetry import count, event, span
+
 # Load the .env file
 load_dotenv()
 
 # Set the OpenAI API key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "gpt-4")
+EXTRACT_CHUNK_TOKENS = int(os.getenv("EXTRACT_CHUNK_TOKENS", "2000"))  # fits gpt-4's 8k window with the reply
+EXTRACT_CHUNK_OVERLAP = int(os.getenv("EXTRACT_CHUNK_OVERLAP", "100"))
+EXTRACT_MAX_CONCURRENCY = int(os.getenv("EXTRACT_MAX_CONCURRENCY", "8"))  # chat requests in flight
+EXTRACT_WINDOW_BATCH = int(os.getenv("EXTRACT_WINDOW_BATCH", "32"))  # windows held in memory at once
+
+SYSTEM_PROMPT = "You extract entities and relationships from technical content."
 
-def extract_entities_and_relationships(text: str):
+
+def build_prompt(text: str) -> str:
     """
-    Use OpenAI to extract entities and relationships from text in a structured format.
-    Returns a dictionary with "entities" and "relationships".
+    The extraction prompt for one chunk of text.
     """
-    prompt = f"""
-You are an expert at understanding technical documents. Extract a list of distinct entities and their relationships from the following text. 
-Format your response as JSON with two keys: "entities" (a list of unique string names) and "relationships" 
+    return f"""
+You are an expert at understanding technical documents. Extract a list of distinct entities and their relationships from the following text.
+Format your response as JSON with two keys: "entities" (a list of unique string names) and "relationships"
 (a list of dictionaries with "source", "relation", "target", and optional "extra").
 
 Text:
@@ -32,31 +48,307 @@ Only return JSON. Example format:
 }}
 """
 
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[
+
+# Cache key component: changes whenever the prompt template does, so cached
+# results made with an older prompt stop matching.
+PROMPT_VERSION = content_hash(SYSTEM_PROMPT + build_prompt("{text}"))[:16]
+
+
+def parse_graph(content: str):
+    """
+    Parse the model's JSON reply (tolerating a ```json fence) into
+    {"entities", "relationships"}, dropping malformed relationships.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        content = content[content.find("{") :]
+    graph = json.loads(content)
+    entities = [str(e).strip() for e in graph.get("entities", []) if str(e).strip()]
+    relationships = [
+        rel
+        for rel in graph.get("relationships", [])
+        if isinstance(rel, dict) and rel.get("source") and rel.get("target") and rel.get("relation")
+    ]
+    return {"entities": entities, "relationships": relationships}
+
+
+def _count_usage(response, model):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        count("rag_tokens_total", usage.prompt_tokens or 0, model=model, kind="prompt")
+        count("rag_tokens_total", usage.completion_tokens or 0, model=model, kind="completion")
+
+
+async def _extract_chunk(get_client, semaphore, text, model, cache):
+    """
+    Extract the graph of one chunk, from the cache when possible, retrying
+    rate limits and transient errors. `get_client()` returns the OpenAI
+    client, awaited only on a cache miss. Returns {"entities",
+    "relationships"} or raises on failure.
+    """
+    if cache is not None:
+        graph = cache.get(text, model, PROMPT_VERSION)
+        if graph is not None:
+            count("rag_cache_requests_total", cache="extraction", result="hit")
+            return graph
+        count("rag_cache_requests_total", cache="extraction", result="miss")
+    client = await get_client()
+
+    async def request(attempt):
+        with span("openai.chat", model=model, attempt=attempt):
+            count("rag_external_calls_total", service="openai", op="chat")
+            return await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": build_prompt(text)},
+                ],
+                temperature=0.2,
+            )
+
+    async with semaphore:
+        response = await with_retries_async(request, op="chat", label="Extraction")
+    _count_usage(response, model)
+    graph = parse_graph(response.choices[0].message.content)
+    if cache is not None:
+        cache.put(text, model, PROMPT_VERSION, graph)
+    return graph
+
+
+def pack_windows(chunks, max_tokens=EXTRACT_CHUNK_TOKENS):
+    """
+    Group consecutive {"id", "text"} chunks (e.g. the vector store's chunks
+    of a document) into extraction windows of at most `max_tokens` tokens.
+    Lazy: windows are yielded as `chunks` is consumed.
+    """
+    window, tokens = [], 0
+    for chunk in chunks:
+        n = count_tokens(chunk["text"])
+        if window and tokens + n > max_tokens:
+            yield window
+            window, tokens = [], 0
+        window.append(chunk)
+        tokens += n
+    if window:
+        yield window
+
+
+def _locate(name, window, folded):
+    """
+    IDs of the chunks in `window` whose text mentions `name`, or the whole
+    window when the model paraphrased the name.
+    """
+    needle = name.casefold()
+    return [c["id"] for c, text in zip(window, folded) if needle in text] or [c["id"] for c in window]
+
+
+class GraphMerger:
+    """
+    Incremental `merge_graphs`: `add` each chunk's graph in chunk order and
+    read the merged graph from `result()`. Only the merged graph is kept, so
+    chunks and windows can be dropped as soon as they are added.
+    """
+
+    def __init__(self):
+        self.entities = {}
+        self.relationships = {}
+        self.mentions = {}
+
+    def _add_mention(self, name, ids):
+        found = self.mentions.setdefault(name, [])
+        found.extend(i for i in ids if i not in found)
+
+    def add(self, chunk_index, graph, window=None):
+        """
+        Merge the graph of chunk `chunk_index` ({"id", "text"} chunks of its
+        `window`, if any; see `merge_graphs`).
+        """
+        folded = [c["text"].casefold() for c in window] if window else None
+        located = {}
+
+        def locate(name):
+            if window is None:
+                return [chunk_index]
+            if name not in located:
+                located[name] = _locate(name, window, folded)
+                self._add_mention(name, located[name])
+            return located[name]
+
+        for name in graph["entities"]:
+            self.entities.setdefault(name, None)
+            locate(name)
+        for rel in graph["relationships"]:
+            source, target = str(rel["source"]).strip(), str(rel["target"]).strip()
+            relation = str(rel["relation"]).strip()
+            self.entities.setdefault(source, None)
+            self.entities.setdefault(target, None)
+            source_chunks, target_chunks = locate(source), locate(target)
+            chunks = [c for c in source_chunks if c in target_chunks] or source_chunks + [
+                c for c in target_chunks if c not in source_chunks
+            ]
+            merged = self.relationships.setdefault(
+                (source, relation, target),
                 {
-                    "role": "system",
-                    "content": "You extract entities and relationships from technical content.",
+                    "source": source,
+                    "relation": relation,
+                    "target": target,
+                    "extra": rel.get("extra", {}),
+                    "chunks": [],
                 },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-        )
+            )
+            merged["chunks"].extend(c for c in chunks if c not in merged["chunks"])
 
-        content = response.choices[0].message.content.strip()
+    def result(self):
+        return {
+            "entities": list(self.entities),
+            "relationships": list(self.relationships.values()),
+            "mentions": self.mentions,
+        }
 
-        # Safely evaluate JSON using standard library
-        import json
 
-        graph = json.loads(content)
+def merge_graphs(graphs, windows=None):
+    """
+    Reduce per-chunk graphs (in chunk order, None for failed chunks) into one.
+
+    Entities are deduplicated by exact name, keeping first-seen order, and
+    relationship endpoints are added as entities. Relationships are
+    deduplicated by (source, relation, target); each keeps the `extra` of its
+    first occurrence and lists the chunks it was found in under "chunks".
+
+    Without `windows` the chunks are extraction chunk indices. With
+    `windows` (the {"id", "text"} chunks behind each graph) they are chunk
+    IDs narrowed to the chunks mentioning the entities, and "mentions" maps
+    every entity to the IDs of the chunks that mention it.
+    """
+    merger = GraphMerger()
+    for chunk_index, graph in enumerate(graphs):
+        if graph:
+            merger.add(chunk_index, graph, windows[chunk_index] if windows else None)
+    return merger.result()
 
-        # Fallback structure if keys are missing
-        entities = graph.get("entities", [])
-        relationships = graph.get("relationships", [])
-        return {"entities": entities, "relationships": relationships}
 
-    except Exception as e:
-        print("❌ LLM extraction failed:", e)
-        return {"entities": [], "relationships": []}
+_purged_models = set()  # models whose older prompt versions were purged from the cache
+
+
+async def extract_entities_and_relationships_async(
+    text: str,
+    chunks=None,
+    chunk_size=EXTRACT_CHUNK_TOKENS,
+    overlap=EXTRACT_CHUNK_OVERLAP,
+    max_concurrency=EXTRACT_MAX_CONCURRENCY,
+    model=EXTRACTION_MODEL,
+    progress=None,
+):
+    """
+    Map-reduce extraction: split `text` with `chunk_text`, extract each chunk
+    concurrently (at most `max_concurrency` requests in flight), then merge.
+    Chunks already extracted with the same model and prompt come from the
+    extraction cache without an LLM call (the OpenAI client is only opened on
+    a miss); cached results from older prompt versions of `model` are purged
+    once per process.
+
+    If `chunks` ({"id", "text"} records, e.g. from `document_chunks`) is
+    given, they are packed into extraction windows instead, and provenance
+    is reported as chunk IDs (see `merge_graphs`). `chunks` may be a lazy
+    iterable: at most EXTRACT_WINDOW_BATCH windows are held at once and
+    results are merged in order as they complete, so memory does not grow
+    with the document. `progress(done, total)` is called as each chunk
+    finishes; `total` is None when `chunks` is lazy.
+    """
+    if chunks is not None:
+        windows = pack_windows(chunks, chunk_size)
+        total = None
+        if isinstance(chunks, (list, tuple)):
+            windows = list(windows)
+            total = len(windows)
+        items = ((window, "\n".join(c["text"] for c in window)) for window in windows)
+    else:
+        texts = chunk_text(text, chunk_size=chunk_size, overlap=overlap) if text.strip() else []
+        total = len(texts)
+        items = ((None, chunk) for chunk in texts)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    cache = get_extraction_cache()
+    if cache is not None and model not in _purged_models:
+        _purged_models.add(model)
+        purged = cache.purge(model, PROMPT_VERSION)
+        if purged:
+            event(f"🧹 Dropped {purged} cached extractions from older prompt versions")
+    merger = GraphMerger()
+    done = failed = 0
+
+    async with AsyncExitStack() as stack:
+        client = None
+
+        async def get_client():
+            # Created on the first cache miss, so fully cached documents never open one
+            nonlocal client
+            if client is None:
+                client = openai.AsyncOpenAI(api_key=openai.api_key, max_retries=0)
+                await stack.enter_async_context(client)
+            return client
+
+        async def extract(chunk):
+            nonlocal done
+            try:
+                return await _extract_chunk(get_client, semaphore, chunk, model, cache)
+            finally:
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+
+        in_flight = {}  # task -> chunk index
+        finished = {}  # chunk index -> graph or exception, until merged in order
+        held = {}  # chunk index -> window, until merged
+        started = merged = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and started - merged < EXTRACT_WINDOW_BATCH:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    held[started], chunk = item
+                    in_flight[asyncio.ensure_future(extract(chunk))] = started
+                    started += 1
+                if not in_flight:
+                    break
+                completed, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in completed:
+                    finished[in_flight.pop(task)] = task.exception() or task.result()
+                while merged in finished:
+                    result, window = finished.pop(merged), held.pop(merged)
+                    if isinstance(result, Exception):
+                        event(f"❌ LLM extraction failed for chunk {merged}: {result}", level="error")
+                        failed += 1
+                    else:
+                        merger.add(merged, result, window)
+                    merged += 1
+        finally:
+            # e.g. a streamed PDF page failed while more windows were in flight
+            for task in in_flight:
+                task.cancel()
+
+    graph = merger.result()
+    graph["chunks"] = started
+    graph["failed_chunks"] = failed
+    return graph
+
+
+def extract_entities_and_relationships(text: str, chunks=None, progress=None):
+    """
+    Use OpenAI to extract entities and relationships from text in a structured format.
+    Returns a dictionary with "entities" and "relationships" (each relationship
+    carrying the "chunks" it was extracted from), "mentions" (entity -> chunk
+    IDs, when `chunks` is given), plus "chunks", "failed_chunks" and "seconds".
+    `progress(done, total)` reports finished chunks.
+    """
+    start = time.perf_counter()
+    with span("extract.graph", chars=len(text)) as extract_span:
+        graph = asyncio.run(
+            extract_entities_and_relationships_async(text, chunks, progress=progress)
+        )
+        extract_span.set(chunks=graph["chunks"], failed_chunks=graph["failed_chunks"])
+    graph["seconds"] = time.perf_counter() - start
+    return graph
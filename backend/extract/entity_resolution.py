@@ -0,0 +1,317 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+import numpy as np
+
+from ingest.utils import get_cache_path
+from telemetry import span
+
+RESOLVE_THRESHOLD = float(os.getenv("ENTITY_RESOLVE_THRESHOLD", "0.8"))  # shingle Jaccard to merge
+LSH_BANDS = 8
+LSH_ROWS = 3  # a pair at Jaccard 0.8 shares a band with probability ~0.997
+SHINGLE_SIZE = 3
+
+# Tokens that do not distinguish one entity from another
+_LEGAL_SUFFIXES = frozenset(
+    "inc incorporated corp corporation co company ltd limited llc plc gmbh ag sa".split()
+)
+_NON_WORD = re.compile(r"[^\w\s]+")
+_DIGITS = re.compile(r"\d+")
+
+# Multiply-shift hash family for MinHash, and multipliers that fold each
+# band's LSH_ROWS values into one hash (odd, so they are invertible mod 2**64)
+_rng = np.random.default_rng(0x5EED)
+_PERM_A = _rng.integers(1, 1 << 63, LSH_BANDS * LSH_ROWS, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 1 << 63, LSH_BANDS * LSH_ROWS, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 1 << 63, LSH_ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Canonical comparison key for an entity name: Unicode-normalized,
+    casefolded, without punctuation, a leading "the" or legal suffixes
+    ("OpenAI Inc." -> "openai").
+    """
+    text = unicodedata.normalize("NFKC", str(name)).casefold()
+    words = _NON_WORD.sub(" ", text).split()
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and words[-1] in _LEGAL_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
+
+
+def shingles(key: str):
+    """
+    Character n-grams of a normalized key with spaces removed ("open ai" and
+    "openai" share all shingles), padded so short names still produce several.
+    """
+    padded = f" {key.replace(' ', '')} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i : i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def band_hashes(shingle_sets, block=50000):
+    """
+    LSH band hashes of many shingle sets at once: an (n, LSH_BANDS) uint64
+    array, each entry a hash of LSH_ROWS MinHash values. Signatures are
+    computed in blocks of `block` sets with one vectorized pass each.
+    """
+    out = np.empty((len(shingle_sets), LSH_BANDS), dtype=np.uint64)
+    for lo in range(0, len(shingle_sets), block):
+        sets = shingle_sets[lo : lo + block]
+        sizes = np.fromiter((len(s) for s in sets), dtype=np.int64, count=len(sets))
+        # Band hashes are rebuilt on load and never persisted, so Python's
+        # (per-process salted) string hash is good enough and much cheaper
+        hashes = np.fromiter(
+            (hash(x) & 0xFFFFFFFF for s in sets for x in s), dtype=np.uint64, count=int(sizes.sum())
+        )
+        # Arithmetic wraps mod 2**64; the high 32 bits are the hash value
+        values = (hashes[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        signatures = np.minimum.reduceat(values, starts, axis=0)
+        out[lo : lo + len(sets)] = (
+            signatures.reshape(len(sets), LSH_BANDS, LSH_ROWS) * _BAND_MIX
+        ).sum(axis=2, dtype=np.uint64)
+    return out
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+class EntityResolver:
+    """
+    Maps entity name variants onto one canonical name.
+
+    Names are first grouped by `normalize_name`, then near-duplicate keys are
+    found with MinHash/LSH blocking (only keys sharing a band hash are
+    compared), confirmed by shingle Jaccard >= `threshold` and identical
+    numbers (so "GPT-3" and "GPT-4" stay apart), and clustered with
+    union-find. Cost is near-linear in the number of names.
+
+    The LSH index is one sorted hash array per band, searched with
+    `searchsorted`. Resolved aliases persist in an SQLite alias table, and
+    every known canonical name is indexed, so later documents resolve onto
+    the same nodes.
+    """
+
+    def __init__(self, path=None, threshold=RESOLVE_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path or get_cache_path("aliases.db"), check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, canonical TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self._canonical = {}  # normalized key -> canonical name
+        self._keys = []  # LSH id -> normalized key
+        self._shingles = []  # LSH id -> shingle set
+        self._ids = {}  # normalized key -> LSH id
+        self._band_hashes = [np.empty(0, dtype=np.uint64) for _ in range(LSH_BANDS)]
+        self._band_ids = [np.empty(0, dtype=np.int64) for _ in range(LSH_BANDS)]
+        canonical_keys = []
+        for alias, canonical in self._db.execute("SELECT alias, canonical FROM aliases"):
+            self._canonical.setdefault(normalize_name(alias), canonical)
+            canonical_keys.append(normalize_name(canonical))
+        self._index(canonical_keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _index(self, keys):
+        """
+        Add normalized keys to the LSH index; returns their LSH ids.
+        """
+        new = [k for k in dict.fromkeys(keys) if k and k not in self._ids]
+        if new:
+            sets = [shingles(k) for k in new]
+            bands = band_hashes(sets)
+            ids = np.arange(len(self._keys), len(self._keys) + len(new))
+            for key, s, i in zip(new, sets, ids.tolist()):
+                self._ids[key] = i
+                self._keys.append(key)
+                self._shingles.append(s)
+            for band in range(LSH_BANDS):
+                hashes = np.concatenate([self._band_hashes[band], bands[:, band]])
+                order = np.argsort(hashes, kind="stable")
+                self._band_hashes[band] = hashes[order]
+                self._band_ids[band] = np.concatenate([self._band_ids[band], ids])[order]
+        return [self._ids[k] for k in keys if k]
+
+    def _candidates(self, ids):
+        """
+        Pairs (id, other id) of indexed keys sharing at least one band hash
+        with a key in `ids`.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        pairs = set()
+        if not len(ids):
+            return pairs
+        for band in range(LSH_BANDS):
+            sorted_hashes = self._band_hashes[band]
+            position = np.empty(len(self._keys), dtype=np.int64)
+            position[self._band_ids[band]] = np.arange(len(sorted_hashes))
+            hashes = sorted_hashes[position[ids]]
+            lo = np.searchsorted(sorted_hashes, hashes, "left")
+            hi = np.searchsorted(sorted_hashes, hashes, "right")
+            for j in np.flatnonzero(hi - lo > 1).tolist():
+                a = int(ids[j])
+                for b in self._band_ids[band][lo[j] : hi[j]].tolist():
+                    if a != b:
+                        pairs.add((min(a, b), max(a, b)))
+        return pairs
+
+    def _matches(self, a, b):
+        ka, kb = self._keys[a], self._keys[b]
+        return (
+            _DIGITS.findall(ka) == _DIGITS.findall(kb)
+            and _jaccard(self._shingles[a], self._shingles[b]) >= self.threshold
+        )
+
+    def lookup(self, name):
+        """
+        Canonical name for `name` if it (or its normalized form) is a known
+        alias, otherwise `name` unchanged.
+        """
+        return self._canonical.get(normalize_name(name), name)
+
+    def resolve(self, names):
+        """
+        Return {name: canonical name} for every name in `names`, updating the
+        alias table. Among new variants of one entity, the most frequent
+        spelling becomes canonical (ties prefer capitalized, then shorter
+        spellings); an already-known canonical name always wins.
+        """
+        counts = {}
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+        by_key = {}
+        for name in counts:
+            by_key.setdefault(normalize_name(name), []).append(name)
+
+        with self._lock:
+            parent = {}
+
+            def find(key):
+                parent.setdefault(key, key)
+                while parent[key] != key:
+                    parent[key] = parent[parent[key]]
+                    key = parent[key]
+                return key
+
+            def union(a, b):
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    # Known canonical keys stay roots
+                    if rb in self._canonical and ra not in self._canonical:
+                        ra, rb = rb, ra
+                    parent[rb] = ra
+
+            new_keys = [key for key in by_key if key and key not in self._canonical]
+            for a, b in self._candidates(self._index(new_keys)):
+                if self._matches(a, b):
+                    union(self._keys[a], self._keys[b])
+
+            clusters = {}
+            for key in by_key:
+                clusters.setdefault(find(key), []).append(key)
+
+            mapping, rows = {}, []
+            for root, keys in clusters.items():
+                if root in self._canonical:
+                    canonical = self._canonical[root]
+                else:
+                    spellings = [name for key in keys for name in by_key[key]]
+                    canonical = min(
+                        spellings, key=lambda n: (-counts[n], n.islower(), len(n), n)
+                    )
+                for key in keys:
+                    self._canonical.setdefault(key, canonical)
+                    for name in by_key[key]:
+                        mapping[name] = canonical
+                        rows.append((name, canonical))
+                self._canonical.setdefault(normalize_name(canonical), canonical)
+
+            self._db.executemany(
+                "INSERT OR IGNORE INTO aliases (alias, canonical) VALUES (?, ?)", rows
+            )
+            self._db.commit()
+        return mapping
+
+    def aliases(self, canonical):
+        """
+        Every recorded alias of a canonical name.
+        """
+        with self._lock:
+            return [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT alias FROM aliases WHERE canonical = ?", (canonical,)
+                )
+            ]
+
+
+def resolve_graph(graph, resolver=None):
+    """
+    Rewrite an extracted graph onto canonical entity names: entities are
+    deduplicated, relationships renamed and merged (unioning their "chunks"),
+    self-loops created by the merge dropped and "mentions" merged per
+    canonical name. Adds "aliases" with the {name: canonical} mapping for
+    names that changed.
+    """
+    resolver = resolver or get_entity_resolver()
+    names = list(graph["entities"])
+    for rel in graph["relationships"]:
+        names.extend([rel["source"], rel["target"]])
+    with span("extract.resolve", names=len(names)):
+        mapping = resolver.resolve(names)
+
+    relationships = {}
+    for rel in graph["relationships"]:
+        source, target = mapping[rel["source"]], mapping[rel["target"]]
+        if source == target:
+            continue
+        key = (source, rel["relation"], target)
+        if key not in relationships:
+            relationships[key] = {**rel, "source": source, "target": target}
+            if "chunks" in rel:
+                relationships[key]["chunks"] = list(rel["chunks"])
+        else:
+            merged = relationships[key].setdefault("chunks", [])
+            merged.extend(c for c in rel.get("chunks", []) if c not in merged)
+
+    mentions = {}
+    for name, chunk_ids in graph.get("mentions", {}).items():
+        merged = mentions.setdefault(mapping.get(name) or resolver.lookup(name), [])
+        merged.extend(c for c in chunk_ids if c not in merged)
+
+    return {
+        **graph,
+        "entities": list(dict.fromkeys(mapping[name] for name in graph["entities"])),
+        "mentions": mentions,
+        "relationships": list(relationships.values()),
+        "aliases": {name: canonical for name, canonical in mapping.items() if name != canonical},
+    }
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_entity_resolver():
+    """
+    Return the process-wide resolver (alias table loaded once).
+    """
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = EntityResolver()
+        return _resolver
@@ -0,0 +1,87 @@
+import json
+import os
+import time
+
+from ingest.utils import content_hash, get_cache_path
+from sqlite_lru import SQLiteLRU, shared_instance
+
+EXTRACT_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACT_CACHE_MAX_ENTRIES", "100000"))
+EXTRACT_CACHE_DISABLED = os.getenv("EXTRACT_CACHE_DISABLED", "0") == "1"
+
+
+class ExtractionCache(SQLiteLRU):
+    """
+    Persistent cache of LLM extraction results.
+
+    Entries are keyed by (sha256(text), model, prompt_version), so a new
+    model or prompt template misses only for itself while entries for other
+    versions stay valid. The cache is bounded to `max_entries` with
+    least-recently-used eviction, and `purge` drops versions no longer in use.
+    """
+
+    table = "extractions"
+
+    def __init__(self, path=None, max_entries=EXTRACT_CACHE_MAX_ENTRIES):
+        super().__init__(
+            path or get_cache_path("extractions.db"),
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                graph TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (hash, model, prompt_version)
+            );
+            CREATE INDEX IF NOT EXISTS extractions_lru ON extractions (last_used);
+            """,
+            max_entries,
+        )
+
+    def get(self, text, model, prompt_version):
+        """
+        Return the cached graph for `text`, or None on a miss.
+        """
+        key = (content_hash(text), model, prompt_version)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT graph FROM extractions WHERE hash = ? AND model = ? AND prompt_version = ?",
+                key,
+            ).fetchone()
+            self._record(row is not None, 1)
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE extractions SET last_used = ? "
+                "WHERE hash = ? AND model = ? AND prompt_version = ?",
+                (time.time(), *key),
+            )
+        return json.loads(row[0])
+
+    def put(self, text, model, prompt_version, graph):
+        """
+        Store a graph, evicting the least recently used entries when full.
+        """
+        with self._lock, self._transaction():
+            self._evict(1)
+            self._db.execute(
+                "INSERT OR REPLACE INTO extractions (hash, model, prompt_version, graph, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash(text), model, prompt_version, json.dumps(graph), time.time()),
+            )
+
+    def purge(self, model, prompt_version):
+        """
+        Delete entries made with any other prompt version for `model`.
+        Returns the number of entries removed.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM extractions WHERE model = ? AND prompt_version != ?",
+                (model, prompt_version),
+            )
+        return cursor.rowcount
+
+
+# Process-wide extraction cache, or None if caching is disabled
+get_extraction_cache = shared_instance(ExtractionCache, disabled=EXTRACT_CACHE_DISABLED)
@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from telemetry import event, span
+
+GRAPH_HOPS = int(os.getenv("GRAPH_HOPS", "2"))  # default expansion depth
+GRAPH_MAX_FANOUT = int(os.getenv("GRAPH_MAX_FANOUT", "50"))  # neighbours followed per node
+GRAPH_MAX_NODES = int(os.getenv("GRAPH_MAX_NODES", "200"))  # cap on entities returned
+GRAPH_SNAPSHOT_TTL = float(os.getenv("GRAPH_SNAPSHOT_TTL", "600"))  # seconds before a full reload
+GRAPH_COMPACT_EVERY = int(os.getenv("GRAPH_COMPACT_EVERY", "10000"))  # delta edges before a rebuild
+GRAPH_MAX_CHUNKS = int(os.getenv("GRAPH_MAX_CHUNKS", "1000"))  # cap on candidate chunks per query
+GRAPH_RELOAD_RETRY = 30.0  # seconds before retrying a failed background reload
+
+_EMPTY = np.empty(0, np.int64)
+
+
+def _build_csr(n_nodes, src, dst, rel):
+    """
+    CSR arrays for edges (src -> dst, rel), deduplicated and sorted by
+    (src, rel, dst): neighbours of node i are targets[offsets[i]:offsets[i+1]].
+    """
+    if len(src):
+        edges = np.unique(np.stack([src, rel, dst], axis=1).astype(np.int64), axis=0)
+        src, rel, dst = edges[:, 0], edges[:, 1], edges[:, 2]
+    offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=offsets[1:])
+    return offsets, dst.astype(np.int32), rel.astype(np.int32)
+
+
+class GraphSnapshot:
+    """
+    In-memory adjacency snapshot of the Entity graph, so neighbourhood
+    expansion is a local array walk instead of a Bolt round trip.
+
+    Entity names map to integer IDs through `ids`/`names`, relation types
+    through `rel_ids`/`rel_names`. Outgoing edges are stored CSR-style
+    (offsets, targets, relation ids). Edges written after the last build go
+    to a small per-node delta and are folded into the arrays every
+    GRAPH_COMPACT_EVERY edges.
+
+    MENTIONED_IN edges are kept the same way as a second CSR from entity ID
+    to chunk numbers (`chunk_ids` maps those back to vector point IDs), so a
+    graph neighbourhood turns into candidate chunk IDs locally.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.names, self.ids = [], {}
+        self.rel_names, self.rel_ids = [], {}
+        self.chunk_ids, self._chunk_numbers = [], {}
+        self._csr = _build_csr(0, _EMPTY, _EMPTY, _EMPTY)
+        self._mentions = _build_csr(0, _EMPTY, _EMPTY, _EMPTY)
+        self._delta = {}  # src id -> [(dst id, rel id)]
+        self._delta_edges = 0
+        self._mention_delta = {}  # entity id -> [chunk number]
+        self._delta_mentions = 0
+        self._journal = None  # writes applied while a load is reading Neo4j
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def _node(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def _rel(self, relation):
+        i = self.rel_ids.get(relation)
+        if i is None:
+            i = self.rel_ids[relation] = len(self.rel_names)
+            self.rel_names.append(relation)
+        return i
+
+    def _chunk(self, chunk_id):
+        i = self._chunk_numbers.get(chunk_id)
+        if i is None:
+            i = self._chunk_numbers[chunk_id] = len(self.chunk_ids)
+            self.chunk_ids.append(chunk_id)
+        return i
+
+    @property
+    def edge_count(self):
+        return len(self._csr[1]) + self._delta_edges
+
+    # --- building -------------------------------------------------------
+
+    def load(self, driver):
+        """
+        Rebuild the snapshot from every Entity and edge between Entities in Neo4j.
+        Writes `apply`-ed while the reads run may be missing from them, so
+        they are journaled and replayed onto the new tables before the swap.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self._journal is None:
+                self._journal = []
+        with driver.session() as session:
+            names = [r["name"] for r in session.run("MATCH (e:Entity) RETURN e.name AS name")]
+            rows = session.run(
+                "MATCH (a:Entity)-[r]->(b:Entity) "
+                "RETURN a.name AS source, coalesce(r.type, type(r)) AS relation, b.name AS target"
+            ).data()
+            mentions = session.run(
+                "MATCH (e:Entity)-[:MENTIONED_IN]->(c:Chunk) RETURN e.name AS name, c.id AS chunk"
+            ).data()
+        # Build into a fresh snapshot and swap its tables in, so concurrent
+        # readers never see a half-built one
+        fresh = GraphSnapshot()
+        for name in names:
+            fresh._node(name)
+        src = np.fromiter((fresh._node(r["source"]) for r in rows), np.int64, len(rows))
+        rel = np.fromiter((fresh._rel(r["relation"]) for r in rows), np.int64, len(rows))
+        dst = np.fromiter((fresh._node(r["target"]) for r in rows), np.int64, len(rows))
+        fresh._csr = _build_csr(len(fresh.names), src, dst, rel)
+        entity = np.fromiter((fresh._node(m["name"]) for m in mentions), np.int64, len(mentions))
+        chunk = np.fromiter((fresh._chunk(m["chunk"]) for m in mentions), np.int64, len(mentions))
+        fresh._mentions = _build_csr(len(fresh.names), entity, chunk, np.zeros_like(entity))
+        with self._lock:
+            for write in self._journal or ():
+                fresh._apply(*write)
+            self._journal = None
+            self.names, self.ids = fresh.names, fresh.ids
+            self.rel_names, self.rel_ids = fresh.rel_names, fresh.rel_ids
+            self.chunk_ids, self._chunk_numbers = fresh.chunk_ids, fresh._chunk_numbers
+            self._csr, self._mentions = fresh._csr, fresh._mentions
+            self._delta, self._delta_edges = fresh._delta, fresh._delta_edges
+            self._mention_delta, self._delta_mentions = fresh._mention_delta, fresh._delta_mentions
+            self.loaded_at = time.time()
+        event(
+            f"🕸️ Graph snapshot: {len(self.names)} entities, {len(rows)} edges, "
+            f"{len(mentions)} mentions in {time.perf_counter() - start:.2f}s"
+        )
+
+    def apply(self, entities, relationships, mentions=None):
+        """
+        Fold freshly written entities, relationships ({"source", "target",
+        "relation"}) and mentions ({entity name: [chunk IDs]}) into the
+        snapshot without reloading it.
+        """
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((list(entities), list(relationships), dict(mentions or {})))
+            self._apply(entities, relationships, mentions)
+
+    def _apply(self, entities, relationships, mentions):
+        # Caller holds the lock (or owns an unpublished snapshot)
+        for name in entities:
+            self._node(name)
+        for r in relationships:
+            src = self._node(r["source"])
+            edge = (self._node(r["target"]), self._rel(r["relation"]))
+            edges = self._delta.setdefault(src, [])
+            if edge not in edges:
+                edges.append(edge)
+                self._delta_edges += 1
+        for name, chunk_ids in (mentions or {}).items():
+            found = self._mention_delta.setdefault(self._node(name), [])
+            for chunk_id in chunk_ids:
+                chunk = self._chunk(chunk_id)
+                if chunk not in found:
+                    found.append(chunk)
+                    self._delta_mentions += 1
+        if self._delta_edges + self._delta_mentions >= GRAPH_COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        def merged(csr, delta):
+            offsets, targets, rels = csr
+            rows = [(s, d, r) for s, edges in delta.items() for d, r in edges]
+            src = np.concatenate(
+                [
+                    np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)),
+                    np.array([e[0] for e in rows], np.int64),
+                ]
+            )
+            dst = np.concatenate([targets, np.array([e[1] for e in rows], np.int64)])
+            rel = np.concatenate([rels, np.array([e[2] for e in rows], np.int64)])
+            return _build_csr(len(self.names), src, dst, rel)
+
+        self._csr = merged(self._csr, self._delta)
+        self._mentions = merged(
+            self._mentions, {e: [(c, 0) for c in chunks] for e, chunks in self._mention_delta.items()}
+        )
+        self._delta, self._delta_edges = {}, 0
+        self._mention_delta, self._delta_mentions = {}, 0
+
+    # --- queries --------------------------------------------------------
+
+    def neighbors(self, node, rel=None):
+        """
+        Outgoing neighbour IDs of node ID `node`, optionally only over
+        relation ID `rel`.
+        """
+        offsets, targets, rels = self._csr
+        if node + 1 < len(offsets):
+            lo, hi = offsets[node], offsets[node + 1]
+            found = targets[lo:hi] if rel is None else targets[lo:hi][rels[lo:hi] == rel]
+            found = found.tolist()
+        else:
+            found = []
+        for dst, r in self._delta.get(node, ()):
+            if rel is None or r == rel:
+                found.append(dst)
+        return found
+
+    def expand(
+        self,
+        source,
+        hops=GRAPH_HOPS,
+        relation_type=None,
+        max_fanout=GRAPH_MAX_FANOUT,
+        max_nodes=GRAPH_MAX_NODES,
+    ):
+        """
+        Breadth-first k-hop expansion along outgoing edges from `source`,
+        optionally following only `relation_type`. At most `max_fanout`
+        neighbours are followed per node and `max_nodes` entities returned.
+        Returns entity names ordered by hop distance (source excluded).
+        """
+        start = self.ids.get(source)
+        if start is None:
+            return []
+        rel = None
+        if relation_type is not None:
+            rel = self.rel_ids.get(relation_type)
+            if rel is None:
+                return []
+
+        seen = {start}
+        found = []
+        frontier = [start]
+        for _ in range(hops):
+            next_frontier = []
+            for node in frontier:
+                for n in self.neighbors(node, rel)[:max_fanout]:
+                    if n in seen:
+                        continue
+                    seen.add(n)
+                    found.append(n)
+                    if len(found) >= max_nodes:
+                        return [self.names[i] for i in found]
+                    next_frontier.append(n)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return [self.names[i] for i in found]
+
+    def mentioned_chunks(self, names, limit=GRAPH_MAX_CHUNKS):
+        """
+        Chunk IDs mentioning any of `names`, in the order of `names`
+        (deduplicated, at most `limit`).
+        """
+        offsets, chunks, _ = self._mentions
+        found = {}
+        for name in names:
+            node = self.ids.get(name)
+            if node is None:
+                continue
+            numbers = []
+            if node + 1 < len(offsets):
+                numbers = chunks[offsets[node] : offsets[node + 1]].tolist()
+            for chunk in numbers + self._mention_delta.get(node, []):
+                found.setdefault(chunk, None)
+                if len(found) >= limit:
+                    return [self.chunk_ids[c] for c in found]
+        return [self.chunk_ids[c] for c in found]
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_reloading = False
+_next_reload = 0.0
+
+
+def _reload(driver):
+    """
+    Background refresh of the published snapshot. `load` swaps the new
+    tables in at the end, so queries keep using the old ones meanwhile.
+    """
+    global _reloading, _next_reload
+    try:
+        with span("graph.snapshot_load", background=True):
+            _snapshot.load(driver)
+        next_reload = _snapshot.loaded_at + GRAPH_SNAPSHOT_TTL
+    except Exception as e:
+        event(f"⚠️ Graph snapshot reload failed, serving the previous one: {e}", level="warning")
+        next_reload = time.time() + GRAPH_RELOAD_RETRY
+    with _snapshot_lock:
+        _next_reload = next_reload
+        _reloading = False
+
+
+def get_graph_snapshot(driver):
+    """
+    Return the process-wide snapshot, loading it from Neo4j on first use.
+    Once it is older than GRAPH_SNAPSHOT_TTL (to pick up writes made by
+    other processes) it is rebuilt in a background thread while the current
+    one keeps serving queries. A failed first load publishes nothing, so
+    the next call tries again.
+    """
+    global _snapshot, _reloading, _next_reload
+    with _snapshot_lock:
+        if _snapshot is None:
+            snapshot = GraphSnapshot()
+            with span("graph.snapshot_load"):
+                snapshot.load(driver)
+            _snapshot = snapshot
+            _next_reload = snapshot.loaded_at + GRAPH_SNAPSHOT_TTL
+        elif GRAPH_SNAPSHOT_TTL and not _reloading and time.time() >= _next_reload:
+            _reloading = True
+            threading.Thread(
+                target=_reload, args=(driver,), daemon=True, name="graph-snapshot"
+            ).start()
+        return _snapshot
+
+
+def update_graph_snapshot(entities, relationships, mentions=None):
+    """
+    Apply a write to the snapshot if one is loaded in this process.
+    """
+    if _snapshot is not None:
+        _snapshot.apply(entities, relationships, mentions)
@@ -1,86 +1,212 @@
-from neo4j import GraphDatabase
 import os
+import time
 
-NEO4J_URI = "bolt://localhost:7687"  # Docker default
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "strongpassword123"  # match your docker run password
+from clients import NEO4J_URI, NEO4J_USER, NEO4J_PASS, close_clients, get_neo4j_driver
+from telemetry import count, event, span
 
-# Global variable to store the Neo4j driver
+GRAPH_WRITE_BATCH_SIZE = int(os.getenv("NEO4J_WRITE_BATCH_SIZE", "1000"))
+
+# The shared driver once connected (owned by clients.py; kept here for callers
+# that check it)
 neo4j_driver = None
 
 
-def connect_to_neo4j(uri, user, password):
+def connect_to_neo4j(uri=NEO4J_URI, user=NEO4J_USER, password=NEO4J_PASS):
     """
-    Establish a connection to Neo4j and return the driver.
+    Connect the shared, pooled Neo4j driver and return it. Repeated calls
+    reuse the existing pool instead of opening a new one.
     """
     global neo4j_driver
-    print("Connecting to Neo4j...")
-    try:
-        neo4j_driver = GraphDatabase.driver(uri, auth=(user, password))
-        with neo4j_driver.session() as session:
-            result = session.run("RETURN 1 AS test")
-            print("✅ Connected to Neo4j. Test result:", result.single()["test"])
-        return neo4j_driver
-    except Exception as e:
-        print("❌ Failed to connect to Neo4j:", e)
-        raise e
+    with span("neo4j.connect", uri=uri):
+        event("Connecting to Neo4j...")
+        try:
+            driver = get_neo4j_driver(uri, user, password)
+            if driver is not neo4j_driver:
+                with driver.session() as session:
+                    result = session.run("RETURN 1 AS test")
+                    event(f"✅ Connected to Neo4j. Test result: {result.single()['test']}")
+                ensure_schema(driver)
+                neo4j_driver = driver
+            return neo4j_driver
+        except Exception as e:
+            event(f"❌ Failed to connect to Neo4j: {e}", level="error")
+            raise e
+
+
+def _get_driver():
+    """
+    The connected driver, connecting with the configured credentials on
+    first use.
+    """
+    return neo4j_driver or connect_to_neo4j()
+
+
+def ensure_schema(driver=None):
+    """
+    Create the uniqueness constraints on Entity.name and Chunk.id (which also
+    back the lookups used by MERGE/MATCH). Falls back to a plain index if
+    existing duplicate names prevent the Entity constraint from being created.
+    """
+    with (driver or _get_driver()).session() as session:
+        session.run(
+            "CREATE CONSTRAINT chunk_id_unique IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE"
+        ).consume()
+        try:
+            session.run(
+                "CREATE CONSTRAINT entity_name_unique IF NOT EXISTS "
+                "FOR (e:Entity) REQUIRE e.name IS UNIQUE"
+            ).consume()
+        except Exception as e:
+            event(
+                f"⚠️ Could not create Entity.name constraint, using an index instead: {e}",
+                level="warning",
+            )
+            session.run(
+                "CREATE INDEX entity_name_index IF NOT EXISTS FOR (e:Entity) ON (e.name)"
+            ).consume()
 
 
 def close_connection():
     """
-    Close the Neo4j connection.
+    Close the shared Neo4j driver. Only call this at process exit;
+    long-lived callers should keep the pool open.
     """
     global neo4j_driver
     if neo4j_driver:
-        neo4j_driver.close()
-        print("Closed Neo4j connection.")
+        close_clients(qdrant=False)
+        event("Closed Neo4j connection.")
         neo4j_driver = None
 
 
-def get_related_entities(source, relation_type):
+def get_related_entities(source, relation_type=None, hops=1, max_fanout=None, max_nodes=None):
     """
-    Query Neo4j to get related entities based on the source and relation type.
+    Entities reachable from `source` within `hops` outgoing edges, optionally
+    only along `relation_type`, nearest first. Served from the in-memory graph
+    snapshot (see graph_snapshot.py) rather than a Cypher query per call.
     """
-    global neo4j_driver
-    if not neo4j_driver:
-        raise Exception("Neo4j driver is not initialized. Call connect_to_neo4j first.")
-
-    with neo4j_driver.session() as session:
-        query = """
-        MATCH (a:Entity {name: $source})-[r]->(b:Entity)
-        WHERE $rel IS NULL OR r.type = $rel
-        RETURN DISTINCT b.name AS name
+    from graphdb.graph_snapshot import GRAPH_MAX_FANOUT, GRAPH_MAX_NODES, get_graph_snapshot
+
+    return get_graph_snapshot(_get_driver()).expand(
+        source,
+        hops=hops,
+        relation_type=relation_type,
+        max_fanout=max_fanout or GRAPH_MAX_FANOUT,
+        max_nodes=max_nodes or GRAPH_MAX_NODES,
+    )
+
+
+def get_mentioned_chunks(names, limit=None):
+    """
+    IDs of the chunks that mention any of `names` (via MENTIONED_IN), in
+    the order of `names`, served from the in-memory graph snapshot.
+    """
+    from graphdb.graph_snapshot import GRAPH_MAX_CHUNKS, get_graph_snapshot
+
+    return get_graph_snapshot(_get_driver()).mentioned_chunks(names, limit or GRAPH_MAX_CHUNKS)
+
+
+def _batches(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def _merge_entities(tx, names):
+    tx.run("UNWIND $names AS name MERGE (:Entity {name: name})", names=names).consume()
+    return len(names)
+
+
+def _merge_relationships(tx, rows):
+    result = tx.run(
+        """
+        UNWIND $rows AS row
+        MATCH (a:Entity {name: row.source})
+        MATCH (b:Entity {name: row.target})
+        MERGE (a)-[r:RELATION {type: row.relation, extra: row.extra}]->(b)
+        RETURN count(r) AS written
+        """,
+        rows=rows,
+    )
+    return result.single()["written"]
+
+
+def _merge_mentions(tx, rows):
+    tx.run(
         """
-        result = session.run(query, source=source, rel=relation_type)
-        return [record["name"] for record in result]
+        UNWIND $rows AS row
+        MATCH (e:Entity {name: row.name})
+        UNWIND row.chunks AS chunk_id
+        MERGE (c:Chunk {id: chunk_id})
+        MERGE (e)-[:MENTIONED_IN]->(c)
+        """,
+        rows=rows,
+    ).consume()
+    return sum(len(row["chunks"]) for row in rows)
 
 
-def insert_graph_data(entities, relationships):
+def insert_graph_data(
+    entities, relationships, mentions=None, batch_size=GRAPH_WRITE_BATCH_SIZE
+):
     """
-    Insert entities and relationships into the Neo4j graph database.
+    Insert entities and relationships into the Neo4j graph database, plus
+    optional `mentions` ({entity name: [chunk IDs]}) as MENTIONED_IN edges
+    from each entity to (:Chunk {id}) nodes keyed by vector point ID.
+
+    Rows are sent as parameter lists through UNWIND, one explicit write
+    transaction per batch. Returns counts and timings:
+    {"entities", "relationships", "mentions", "entity_seconds", "relationship_seconds", "seconds"}.
     """
-    global neo4j_driver
-    if not neo4j_driver:
-        raise Exception("Neo4j driver is not initialized. Call connect_to_neo4j first.")
+    names = list(dict.fromkeys(entities))
+    rows = [
+        {
+            "source": rel["source"],
+            "target": rel["target"],
+            "relation": rel["relation"],
+            "extra": str(rel.get("extra", {})),
+        }
+        for rel in relationships
+    ]
 
-    with neo4j_driver.session() as session:
-        for name in entities:
-            print(f"🔄 Inserting entity: {name}")
-            session.run("MERGE (:Entity {name: $name})", name=name)
+    mentions = {name: [str(c) for c in ids] for name, ids in (mentions or {}).items() if ids}
+    mention_rows = [{"name": name, "chunks": ids} for name, ids in mentions.items()]
 
-        for rel in relationships:
-            print(f"🔗 Creating relationship: {rel}")
-            session.run(
-                """
-                MATCH (a:Entity {name: $source})
-                MATCH (b:Entity {name: $target})
-                MERGE (a)-[:RELATION {type: $relation, extra: $extra}]->(b)
-            """,
-                source=rel["source"],
-                target=rel["target"],
-                relation=rel["relation"],
-                extra=str(rel.get("extra", {})),
-            )
+    start = time.perf_counter()
+    entity_count = 0
+    relationship_count = 0
+    mention_count = 0
+    with span("neo4j.insert", entities=len(names), relationships=len(rows)):
+        with _get_driver().session() as session:
+            with span("neo4j.merge_entities"):
+                for batch in _batches(names, batch_size):
+                    entity_count += session.execute_write(_merge_entities, batch)
+                    count("rag_external_calls_total", service="neo4j", op="merge_entities")
+            entities_done = time.perf_counter()
+            with span("neo4j.merge_relationships"):
+                for batch in _batches(rows, batch_size):
+                    relationship_count += session.execute_write(_merge_relationships, batch)
+                    count("rag_external_calls_total", service="neo4j", op="merge_relationships")
+            with span("neo4j.merge_mentions"):
+                for batch in _batches(mention_rows, batch_size):
+                    mention_count += session.execute_write(_merge_mentions, batch)
+                    count("rag_external_calls_total", service="neo4j", op="merge_mentions")
+        end = time.perf_counter()
+
+        from graphdb.graph_snapshot import update_graph_snapshot
+        from retrieval.query_cache import invalidate_query_cache
+
+        update_graph_snapshot(names, rows, mentions)
+        invalidate_query_cache()
+
+    count("rag_graph_rows_total", entity_count, kind="entity")
+    count("rag_graph_rows_total", relationship_count, kind="relationship")
+    count("rag_graph_rows_total", mention_count, kind="mention")
+    return {
+        "entities": entity_count,
+        "relationships": relationship_count,
+        "mentions": mention_count,
+        "entity_seconds": entities_done - start,
+        "relationship_seconds": end - entities_done,
+        "seconds": end - start,
+    }
 
 
 # Example usage:
@@ -97,6 +223,6 @@ if __name__ == "__main__":
             },
             {"source": "Bob", "target": "Charlie", "relation": "WORKS_WITH"},
         ]
-        insert_graph_data(entities, relationships)
+        print(insert_graph_data(entities, relationships))
     finally:
         close_connection()
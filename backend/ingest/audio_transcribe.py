@@ -1,22 +1,166 @@
-import whisper
+import multiprocessing
 import os
-from .utils import get_file_metadata
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-model = whisper.load_model("base")
+import numpy as np
 
-def transcribe_audio(file_path):
+from telemetry import count, event, span
+
+from .models import get_whisper_model
+from .utils import get_file_metadata, merge_timed_segments
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+WINDOW_SECONDS = int(os.getenv("TRANSCRIBE_WINDOW_SECONDS", "120"))  # target window length
+SPLIT_SEARCH_SECONDS = 10  # look this far either side of a target cut for silence
+FRAME_SECONDS = 0.02  # energy frame used for silence detection
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def load_audio(file_path):
+    """
+    Decode any ffmpeg-readable file to mono float32 PCM at 16 kHz, without
+    importing Whisper/torch in the calling process.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def find_split_points(audio, window_seconds=WINDOW_SECONDS, search_seconds=SPLIT_SEARCH_SECONDS):
+    """
+    Choose cut points roughly every `window_seconds`, each moved to the
+    quietest frame within `search_seconds` of the target so cuts fall in
+    pauses rather than mid-word. Returns sample offsets, including 0 and
+    len(audio).
+    """
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [0, len(audio)]
+    energy = np.sqrt(np.mean(audio[: n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    window = int(window_seconds / FRAME_SECONDS)
+    search = int(search_seconds / FRAME_SECONDS)
+    cuts = [0]
+    target = window
+    while target < n_frames - search:
+        lo, hi = max(cuts[-1] + 1, target - search), min(n_frames, target + search)
+        cut = lo + int(np.argmin(energy[lo:hi]))
+        cuts.append(cut)
+        target = cut + window
+    return [c * frame for c in cuts] + [len(audio)]
+
+
+def _init_worker(model_size, threads):
+    import torch
+
+    torch.set_num_threads(threads)
+    get_whisper_model(model_size)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers, model_size):
+    """
+    The process-wide transcription pool. Its workers load Whisper once and
+    keep it for every later file, and split the CPUs between them.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(model_size, threads)
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _transcribe_window(audio, offset_seconds, model_size=None):
+    """
+    Transcribe one window and shift its segment timestamps to file time.
+    """
+    result = get_whisper_model(model_size).transcribe(audio)
+    return [
+        {
+            "text": seg["text"].strip(),
+            "metadata": {
+                "start": round(seg["start"] + offset_seconds, 2),
+                "end": round(seg["end"] + offset_seconds, 2),
+            },
+        }
+        for seg in result["segments"]
+        if seg["text"].strip()
+    ]
+
+
+def transcribe_audio(file_path, model_size=None, workers=TRANSCRIBE_WORKERS):
+    """
+    Transcribe an audio (or video) file.
+
+    Long recordings are split at silences into ~WINDOW_SECONDS windows that
+    are transcribed in parallel on a long-lived worker pool and stitched
+    back in order. Inside a worker process (e.g. the ingest pipeline's
+    extraction pool, which already runs one file per CPU) windows are
+    transcribed in-process instead, with the worker's own cached model.
+    Returns {"text", "metadata", "segments"}, where the segments are Whisper's
+    timed segments merged up to chunk size, each {"text", "metadata":
+    {"start", "end"}} with times in seconds. On failure the text is empty
+    and "errors" lists what went wrong.
+    """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
     try:
-        result = model.transcribe(file_path)
+        audio = load_audio(file_path)
+        cuts = find_split_points(audio)
+        windows = [(audio[a:b], a / SAMPLE_RATE) for a, b in zip(cuts, cuts[1:])]
+        count("rag_audio_seconds_total", len(audio) / SAMPLE_RATE)
+
+        with span("whisper.transcribe", windows=len(windows), seconds=len(audio) / SAMPLE_RATE):
+            nested = multiprocessing.parent_process() is not None
+            if len(windows) == 1 or workers <= 1 or nested:
+                parts = [_transcribe_window(w, offset, model_size) for w, offset in windows]
+            else:
+                try:
+                    parts = list(
+                        _get_pool(workers, model_size).map(
+                            _transcribe_window,
+                            [w for w, _ in windows],
+                            [offset for _, offset in windows],
+                            [model_size] * len(windows),
+                        )
+                    )
+                except BrokenProcessPool:
+                    _reset_pool()  # a worker died (e.g. out of memory); start fresh next time
+                    raise
+
+        segments = [seg for part in parts for seg in part]
         return {
-            "text": result["text"].strip(),
-            "metadata": get_file_metadata(file_path)
+            "text": " ".join(seg["text"] for seg in segments),
+            "metadata": get_file_metadata(file_path),
+            "segments": merge_timed_segments(segments),
         }
     except Exception as e:
-        print(f"Error transcribing audio: {e}")
+        event(f"Error transcribing audio: {e}", level="error")
         return {
             "text": "",
-            "metadata": get_file_metadata(file_path)
+            "metadata": get_file_metadata(file_path),
+            "segments": [],
+            "errors": [f"{type(e).__name__}: {e}"],
         }
@@ -1,22 +1,192 @@
-from PIL import Image
+from PIL import Image, ImageOps, ImageSequence
 import pytesseract
+import hashlib
+import io
 import os
-from .utils import get_file_metadata
+import shlex
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from telemetry import count, event, span
+
+from .utils import get_cache_path, get_file_metadata
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_CONFIG = os.getenv("OCR_CONFIG", "--oem 1 --psm 3")
+MIN_OCR_WIDTH = 1000  # upscale narrower images; tesseract wants ~300 DPI text
+
+# Each tesseract process runs single-threaded; parallelism comes from the pool.
+# Set per call so torch/Whisper in the same process keep their threads.
+TESSERACT_THREADS = os.getenv("TESSERACT_THREADS", "1")
+
+
+class OcrCache:
+    """
+    SQLite cache of OCR output keyed by sha256 of the image bytes and the
+    tesseract config, so re-ingesting the same scans does no OCR work.
+    """
+
+    def __init__(self, path=None):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path or get_cache_path("ocr.db"), check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, text TEXT NOT NULL)"
+        )
+
+    @staticmethod
+    def key(data):
+        return hashlib.sha256(OCR_CONFIG.encode() + b"\0" + data).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT text FROM ocr WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ocr (key, text) VALUES (?, ?)", (key, text))
+            self._db.commit()
+
+
+_cache = None
+_pool = None
+_init_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    with _init_lock:
+        if _cache is None:
+            _cache = OcrCache()
+        return _cache
+
+
+def _get_pool():
+    global _pool
+    with _init_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+        return _pool
+
+
+def preprocess(image):
+    """
+    Grayscale, stretch contrast and upscale small images before OCR.
+    """
+    image = ImageOps.autocontrast(ImageOps.grayscale(image))
+    if image.width < MIN_OCR_WIDTH:
+        scale = MIN_OCR_WIDTH / image.width
+        image = image.resize((MIN_OCR_WIDTH, int(image.height * scale)), Image.LANCZOS)
+    return image
+
+
+def _tesseract(image):
+    """
+    Run tesseract on a PIL image. Like `pytesseract.image_to_string` (and
+    using its configured `tesseract_cmd`), but with OMP_THREAD_LIMIT set for
+    this subprocess only.
+    """
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    cmd = [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", *shlex.split(OCR_CONFIG)]
+    proc = subprocess.run(
+        cmd,
+        input=buf.getvalue(),
+        capture_output=True,
+        env={**os.environ, "OMP_THREAD_LIMIT": TESSERACT_THREADS},
+    )
+    if proc.returncode != 0:
+        raise pytesseract.TesseractError(proc.returncode, proc.stderr.decode(errors="replace").strip())
+    return proc.stdout.decode("utf-8", errors="replace")
+
+
+def _ocr_bytes(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return _tesseract(preprocess(image)).strip()
+
+
+def ocr_images(images):
+    """
+    OCR a batch of encoded images (bytes) in the worker pool. Results are
+    cached by image content hash; returns texts in input order.
+    """
+    cache = _get_cache()
+    keys = [OcrCache.key(data) for data in images]
+    texts = [cache.get(k) for k in keys]
+    missing = [i for i, t in enumerate(texts) if t is None]
+    count("rag_cache_requests_total", len(images) - len(missing), cache="ocr", result="hit")
+    count("rag_cache_requests_total", len(missing), cache="ocr", result="miss")
+    with span("ocr.tesseract", images=len(missing)):
+        if len(missing) == 1:
+            results = [_ocr_bytes(images[missing[0]])]
+        else:
+            results = list(_get_pool().map(_ocr_bytes, [images[i] for i in missing]))
+    count("rag_bytes_total", sum(len(images[i]) for i in missing), stage="ocr")
+    for i, text in zip(missing, results):
+        cache.put(keys[i], text)
+        texts[i] = text
+    return texts
+
+
+def _frames(image):
+    """
+    Encode every frame of an image (one for JPEG/PNG, all pages of a
+    multi-page TIFF) as PNG bytes.
+    """
+    frames = []
+    for frame in ImageSequence.Iterator(image):
+        buf = io.BytesIO()
+        frame.convert("RGB").save(buf, format="PNG")
+        frames.append(buf.getvalue())
+    return frames
+
+
+def ocr_stats():
+    """
+    Hit/miss counters of the OCR cache in this process.
+    """
+    cache = _get_cache()
+    total = cache.hits + cache.misses
+    return {"hits": cache.hits, "misses": cache.misses, "hit_rate": cache.hits / total if total else 0.0}
+
 
 def extract_text_from_image(file_path):
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
     try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
+        with Image.open(file_path) as image:
+            n_frames = getattr(image, "n_frames", 1)
+            if n_frames == 1:
+                with open(file_path, "rb") as f:
+                    pages = [f.read()]
+            else:
+                pages = _frames(image)
+        texts = ocr_images(pages)
+        segments = []
+        for i, text in enumerate(texts, start=1):
+            if text:
+                segments.append({"text": text, "metadata": {"page": i} if n_frames > 1 else {}})
         return {
-            "text": text.strip(),
-            "metadata": get_file_metadata(file_path)
+            "text": "\n\n".join(s["text"] for s in segments),
+            "metadata": get_file_metadata(file_path),
+            "segments": segments,
         }
     except Exception as e:
-        print(f"Error processing image: {e}")
+        event(f"Error processing image: {e}", level="error")
         return {
             "text": "",
-            "metadata": get_file_metadata(file_path)
+            "metadata": get_file_metadata(file_path),
+            "segments": [],
+            "errors": [f"{type(e).__name__}: {e}"],
         }
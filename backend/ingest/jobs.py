@@ -0,0 +1,318 @@
+import contextvars
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import telemetry
+
+from .pipeline import _extract_in_worker, file_kind
+
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))  # jobs running at once
+INGEST_JOB_RETENTION = float(os.getenv("INGEST_JOB_RETENTION", "3600"))  # seconds a finished job is kept
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "200"))  # finished jobs kept at most
+INGEST_EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", "2"))  # extraction processes
+
+
+class JobQueue:
+    """
+    Background queue for ingestion work (extraction, graph and vector
+    inserts), so a slow upload never blocks the caller.
+
+    Each job is a dict {"id", "kind", "filename", "status" (queued, running,
+    done, failed), "progress" (0-1), "message", "result", "error",
+    "created", "started", "finished"}; `get` returns a snapshot to poll.
+    Jobs submitted with a `key` are memoized: submitting the same key again
+    returns the existing job (queued, running or done) instead of redoing
+    the work, unless that job failed. Finished jobs are kept until a caller
+    `take`s them, or for INGEST_JOB_RETENTION seconds (at most
+    INGEST_MAX_JOBS of them) if nobody does.
+    """
+
+    def __init__(self, workers=INGEST_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # job id -> job
+        self._keys = {}  # memo key -> job id
+
+    def submit(self, kind, fn, *args, key=None, filename=None):
+        """
+        Queue `fn(report, *args)` and return its job ID. `fn` may call
+        `report(progress, message)` to publish progress; its return value
+        becomes the job's "result".
+        """
+        with self._lock:
+            self._prune()
+            job_id = self._keys.get(key) if key is not None else None
+            if job_id is not None and self._jobs[job_id]["status"] != "failed":
+                return job_id
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                "id": job_id,
+                "kind": kind,
+                "filename": filename,
+                "status": "queued",
+                "progress": 0.0,
+                "message": "Queued",
+                "result": None,
+                "error": None,
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+            }
+            if key is not None:
+                self._keys[key] = job_id
+        telemetry.count("rag_jobs_total", kind=kind, status="queued")
+        # Run in the submitter's context so the job's spans join its trace
+        self._executor.submit(contextvars.copy_context().run, self._run, job_id, fn, args)
+        return job_id
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, fn, args):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(status="running", message="Running", started=time.time())
+
+        def report(progress, message=None):
+            fields = {"progress": max(0.0, min(1.0, progress))}
+            if message is not None:
+                fields["message"] = message
+            self._update(job_id, **fields)
+
+        try:
+            with telemetry.span(f"job.{job['kind']}", job=job_id):
+                result = fn(report, *args)
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), message="Failed", finished=time.time())
+            telemetry.count("rag_jobs_total", kind=job["kind"], status="failed")
+            telemetry.event(f"❌ Job {job_id} ({job['kind']}) failed: {e}", level="error")
+        else:
+            self._update(
+                job_id, status="done", progress=1.0, message="Done", result=result, finished=time.time()
+            )
+            telemetry.count("rag_jobs_total", kind=job["kind"], status="done")
+
+    def _prune(self):
+        # Caller holds the lock
+        now = time.time()
+        finished = sorted(
+            (job["finished"], job_id) for job_id, job in self._jobs.items() if job["finished"]
+        )
+        expired = {
+            job_id
+            for i, (finished_at, job_id) in enumerate(finished)
+            if now - finished_at > INGEST_JOB_RETENTION or len(finished) - i > INGEST_MAX_JOBS
+        }
+        if not expired:
+            return
+        for job_id in expired:
+            del self._jobs[job_id]
+        self._keys = {key: job_id for key, job_id in self._keys.items() if job_id not in expired}
+
+    def get(self, job_id):
+        """
+        A copy of the job, or None if it is unknown or was pruned.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def take(self, job_id):
+        """
+        Like `get`, but a finished job is removed along with its result, so
+        the queue does not hold results the caller has already read. Taking
+        a job also drops its memo entry: submitting the same key again
+        redoes the work.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["finished"]:
+                del self._jobs[job_id]
+                self._keys = {key: kept for key, kept in self._keys.items() if kept != job_id}
+            return dict(job)
+
+    def jobs(self):
+        """
+        Copies of all known jobs, oldest first.
+        """
+        with self._lock:
+            return sorted((dict(job) for job in self._jobs.values()), key=lambda job: job["created"])
+
+
+# --- job functions ----------------------------------------------------------
+
+
+def upload_digest(data):
+    """
+    SHA-256 hex digest of uploaded bytes, the memo key for its jobs.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def extract_upload(report, data, filename):
+    """
+    Extract text from uploaded bytes via a temporary file named like the upload.
+    The extraction itself (OCR, PDF parsing, transcription) is CPU-bound, so
+    it runs in the extraction process pool, as in the batch pipeline.
+    """
+    suffix = os.path.splitext(filename)[1].lower()
+    if file_kind(filename) is None:
+        raise ValueError(f"Unsupported file type: {filename}")
+    report(0.1, "Extracting text")
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(data)
+        tmp_path = tmp.name
+    pool = get_extract_pool()
+    try:
+        result, metrics = pool.submit(_extract_in_worker, tmp_path).result()
+    except BrokenProcessPool:
+        _reset_extract_pool(pool)  # a worker died (e.g. OOM); start a fresh pool next time
+        raise
+    finally:
+        os.remove(tmp_path)
+    telemetry.merge(metrics)
+    if result.get("errors"):
+        raise ValueError("; ".join(result["errors"]))
+    result["metadata"] = {**result["metadata"], "filename": filename}
+    result["digest"] = upload_digest(data)
+    return result
+
+
+def insert_graph(report, extraction, doc_id):
+    """
+    Extract entities over the document's chunks, resolve them and write them
+    to Neo4j. Progress follows the chunks as they are extracted.
+    """
+    from extract.entity_graph_builder import extract_entities_and_relationships
+    from extract.entity_resolution import resolve_graph
+    from graphdb.neo4j_setup import insert_graph_data
+    from vectordb.qdrant_setup import document_chunks
+
+    chunks = [
+        {"id": point_id, "text": chunk["text"]}
+        for point_id, chunk, _ in document_chunks(
+            doc_id, extraction["text"], extraction.get("segments")
+        )
+    ]
+    report(0.0, f"Extracting entities from {len(chunks)} chunks")
+
+    def progress(done, total):
+        report(0.9 * done / total, f"Extracted {done}/{total} chunks")
+
+    graph = resolve_graph(
+        extract_entities_and_relationships(extraction["text"], chunks, progress=progress)
+    )
+    report(0.9, "Writing to Neo4j")
+    stats = insert_graph_data(graph["entities"], graph["relationships"], graph["mentions"])
+    return {
+        "entities": graph["entities"],
+        "relationships": graph["relationships"],
+        "aliases": graph["aliases"],
+        "stats": stats,
+    }
+
+
+def insert_vectors(report, extraction, doc_id):
+    """
+    Chunk, embed and upsert the document into Qdrant (and the keyword index).
+    """
+    from vectordb.qdrant_setup import add_document
+
+    report(0.0, "Embedding chunks")
+    return add_document(
+        doc_id, extraction["text"], extraction["metadata"], segments=extraction.get("segments")
+    )
+
+
+# --- submitting ---------------------------------------------------------------
+
+
+def submit_extraction(data, filename):
+    """
+    Queue text extraction for uploaded bytes. Memoized by content hash and
+    filename, so re-submitting the same upload returns the same job, while
+    the same bytes under another name get their own job (and metadata).
+    """
+    return get_job_queue().submit(
+        "extract",
+        extract_upload,
+        data,
+        filename,
+        key=("extract", upload_digest(data), filename),
+        filename=filename,
+    )
+
+
+def submit_graph(extraction, doc_id, filename=None):
+    """
+    Queue entity extraction and the Neo4j insert for an extracted upload.
+    """
+    return get_job_queue().submit(
+        "graph",
+        insert_graph,
+        extraction,
+        doc_id,
+        key=("graph", extraction["digest"], doc_id),
+        filename=filename,
+    )
+
+
+def submit_vectors(extraction, doc_id, filename=None):
+    """
+    Queue the Qdrant insert for an extracted upload.
+    """
+    return get_job_queue().submit(
+        "vector",
+        insert_vectors,
+        extraction,
+        doc_id,
+        key=("vector", extraction["digest"], doc_id),
+        filename=filename,
+    )
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Return the process-wide job queue, shared by every session of the app.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+
+def get_extract_pool():
+    """
+    Return the process pool that runs upload extractions, created on first use.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=INGEST_EXTRACT_WORKERS)
+        return _extract_pool
+
+
+def _reset_extract_pool(broken):
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is broken:
+            _extract_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,49 @@
+import os
+import threading
+
+from telemetry import event, span
+
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL", "base")
+
+# Process-wide registry of loaded models, keyed by (kind, name).
+_models = {}
+_lock = threading.Lock()
+
+
+def get_model(kind, name, loader):
+    """
+    Return the model registered under (kind, name), calling `loader(name)` to
+    load it on first use. Loading happens at most once per process.
+    """
+    key = (kind, name)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                with span("model.load", kind=kind, name=name):
+                    model = loader(name)
+                _models[key] = model
+    return model
+
+
+def _load_whisper(size):
+    import whisper  # heavy: pulls in torch
+
+    event(f"🔄 Loading Whisper model '{size}'...")
+    return whisper.load_model(size)
+
+
+def get_whisper_model(size=None):
+    """
+    Return the shared Whisper model, loading it on first use. The size
+    defaults to the WHISPER_MODEL environment variable ("base").
+    """
+    return get_model("whisper", size or WHISPER_MODEL_SIZE, _load_whisper)
+
+
+def loaded_models():
+    """
+    List the (kind, name) pairs currently loaded in this process.
+    """
+    return list(_models)
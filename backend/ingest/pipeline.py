@@ -0,0 +1,423 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import telemetry
+
+from .utils import get_cache_path
+
+PDF_EXTENSIONS = {".pdf"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp"}
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".flac", ".ogg"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".webm", ".avi"}
+
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))  # documents buffered per stage
+KEYWORD_COMMIT_EVERY = int(os.getenv("KEYWORD_COMMIT_EVERY", "50"))  # documents per local index merge
+PDF_STREAM_MB = float(os.getenv("PDF_STREAM_MB", "20"))  # larger PDFs are streamed page by page
+
+_SENTINEL = object()
+
+
+def file_kind(path):
+    """
+    Return "pdf", "image", "audio", "video" or None for unsupported files.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PDF_EXTENSIONS:
+        return "pdf"
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in AUDIO_EXTENSIONS:
+        return "audio"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def discover_files(root):
+    """
+    Walk `root` and return the supported files in a stable order.
+    """
+    if os.path.isfile(root):
+        return [root] if file_kind(root) else []
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if file_kind(path):
+                found.append(path)
+    return found
+
+
+def extract_file(path, stream=False):
+    """
+    Extract text from one file, dispatching on its type. Runs in a worker
+    process; extractors are imported here so each worker only loads the
+    libraries it actually needs. With `stream`, PDFs come back unparsed
+    ("text" None, lazy "segments"; see `extract_text_from_pdf`).
+    """
+    kind = file_kind(path)
+    with telemetry.span("ingest.extract", kind=kind, file=os.path.basename(path)):
+        telemetry.count("rag_bytes_total", os.path.getsize(path), stage="extract", kind=kind)
+        result = _extract(kind, path, stream)
+    if result["text"] is not None:
+        telemetry.count("rag_chars_total", len(result["text"]), kind=kind)
+    return result
+
+
+def _streamed(path):
+    """
+    Whether `path` is a PDF large enough to stream through the stages
+    instead of extracting it whole in a worker.
+    """
+    return file_kind(path) == "pdf" and os.path.getsize(path) > PDF_STREAM_MB * 1e6
+
+
+def _extract_in_worker(path):
+    """
+    `extract_file` for the process pool. Also returns the metrics the worker
+    recorded (OCR, transcription, ...) so the parent can merge them.
+    """
+    result = extract_file(path)
+    return result, telemetry.drain() if telemetry.enabled() else None
+
+
+def _extract(kind, path, stream=False):
+    if kind == "pdf":
+        from .text import extract_text_from_pdf
+
+        return extract_text_from_pdf(path, stream=stream)
+    if kind == "image":
+        from .image_ocr import extract_text_from_image
+
+        return extract_text_from_image(path)
+    if kind == "audio":
+        from .audio_transcribe import transcribe_audio
+
+        return transcribe_audio(path)
+    if kind == "video":
+        from .video_frames import extract_text_from_video
+
+        return extract_text_from_video(path)
+    raise ValueError(f"Unsupported file type: {path}")
+
+
+class IngestCheckpoint:
+    """
+    JSON record of files that finished ingesting, keyed by path and
+    invalidated by size/mtime, so an interrupted run can resume.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_cache_path("ingest_checkpoint.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._entries = {}
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def is_done(self, path):
+        entry = self._entries.get(os.path.abspath(path))
+        return bool(entry) and entry["status"] == "done" and all(
+            entry[k] == v for k, v in self._signature(path).items()
+        )
+
+    def record(self, path, status, error=None):
+        with self._lock:
+            entry = {"status": status, **self._signature(path)}
+            if error:
+                entry["error"] = error
+            self._entries[os.path.abspath(path)] = entry
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class _Progress:
+    """
+    Tracks per-file stage completion and prints a line as each file finishes.
+    """
+
+    def __init__(self, total, stages, checkpoint):
+        self.total = total
+        self.stages = stages
+        self.checkpoint = checkpoint
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._errors = {}
+        # Files whose chunks the vector stage buffered but has not committed
+        # yet, and finished files held back from the checkpoint until it does
+        self._uncommitted = set()
+        self._waiting = []
+        self.done = 0
+        self.failed = 0
+
+    def begin(self, path):
+        with self._lock:
+            self._pending[path] = self.stages
+
+    def finish(self, path, stage, error=None):
+        with self._lock:
+            if error:
+                self._errors.setdefault(path, []).append(f"{stage}: {error}")
+            elif stage == "vector":
+                self._uncommitted.add(path)
+            self._pending[path] -= 1
+            if self._pending[path]:
+                return
+            del self._pending[path]
+            errors = self._errors.pop(path, None)
+            durable = path not in self._uncommitted
+            if errors:
+                self.failed += 1
+            else:
+                self.done += 1
+                if not durable:
+                    self._waiting.append(path)
+            finished = self.done + self.failed
+            elapsed = time.perf_counter() - self.start
+        if errors:
+            self.checkpoint.record(path, "failed", "; ".join(errors))
+            telemetry.count("rag_files_total", status="failed")
+            telemetry.event(f"❌ [{finished}/{self.total}] {path}: {'; '.join(errors)}", level="error")
+        else:
+            if durable:
+                self.checkpoint.record(path, "done")
+            telemetry.count("rag_files_total", status="done")
+            telemetry.event(f"✅ [{finished}/{self.total}] {path} ({finished / elapsed:.2f} files/sec)")
+
+    def commit(self):
+        """
+        Called after the vector stage commits its indexes: everything it had
+        handled is now persisted, so held-back files can be checkpointed.
+        """
+        with self._lock:
+            self._uncommitted.clear()
+            ready, self._waiting = self._waiting, []
+        for path in ready:
+            self.checkpoint.record(path, "done")
+
+    def fail(self, path, stage, error):
+        """
+        Mark every remaining stage of `path` as failed (e.g. extraction error).
+        """
+        with self._lock:
+            remaining = self._pending.get(path, 0)
+        for _ in range(remaining):
+            self.finish(path, stage, error)
+
+
+def _setup_vector_stage(on_commit=None, root=None):
+    from vectordb.qdrant_setup import (
+        add_document,
+        commit_indexes,
+        init_collection,
+        make_doc_id,
+        source_key,
+    )
+
+    init_collection()
+    pending = 0
+
+    def commit():
+        nonlocal pending
+        commit_indexes()
+        pending = 0
+        if on_commit:
+            on_commit()
+
+    def handle(path, result):
+        nonlocal pending
+        add_document(
+            make_doc_id(source_key(path, root)),
+            result["text"],
+            result["metadata"],
+            segments=result.get("segments"),
+            commit=False,
+        )
+        # Merging the local indexes costs O(index size), so do it in batches
+        pending += 1
+        if pending >= KEYWORD_COMMIT_EVERY:
+            commit()
+
+    return handle, commit
+
+
+def _setup_graph_stage(root=None):
+    from extract.entity_graph_builder import extract_entities_and_relationships
+    from extract.entity_resolution import resolve_graph
+    from graphdb.neo4j_setup import (
+        NEO4J_PASS,
+        NEO4J_URI,
+        NEO4J_USER,
+        close_connection,
+        connect_to_neo4j,
+        insert_graph_data,
+    )
+    from vectordb.qdrant_setup import document_chunks, make_doc_id, source_key
+
+    connect_to_neo4j(NEO4J_URI, NEO4J_USER, NEO4J_PASS)
+
+    def handle(path, result):
+        # Extract over the same chunks the vector stage stores, so mentions
+        # point at their Qdrant IDs; a generator, so a streamed PDF is never
+        # held in memory whole
+        chunks = (
+            {"id": point_id, "text": chunk["text"]}
+            for point_id, chunk, _ in document_chunks(
+                make_doc_id(source_key(path, root)), result["text"], result.get("segments")
+            )
+        )
+        graph = resolve_graph(extract_entities_and_relationships(result["text"] or "", chunks))
+        insert_graph_data(graph["entities"], graph["relationships"], graph["mentions"])
+
+    return handle, close_connection
+
+
+def _run_stage(name, setup, jobs, progress):
+    """
+    Consume (path, result) jobs until the sentinel arrives. If the stage
+    cannot start (e.g. its database is down) every job is marked failed, so
+    the queue keeps draining and the other stages are not blocked.
+    """
+    handle, teardown, setup_error = None, None, None
+    try:
+        handle, teardown = setup()
+    except Exception as e:
+        setup_error = e
+        telemetry.event(f"❌ {name} stage unavailable: {e}", level="error")
+    try:
+        while True:
+            job = jobs.get()
+            if job is _SENTINEL:
+                return
+            path, result = job
+            try:
+                if setup_error:
+                    raise setup_error
+                # A streamed PDF ("text" None) is only known to be empty once parsed
+                if result["text"] is None or result["text"]:
+                    with telemetry.span(f"ingest.{name}", file=os.path.basename(path)):
+                        handle(path, result)
+                progress.finish(path, name)
+            except Exception as e:
+                progress.finish(path, name, e)
+    finally:
+        if teardown:
+            teardown()
+
+
+def ingest_directory(root, workers=None, graph=True, resume=True):
+    """
+    Ingest every supported file under `root`.
+
+    Extraction (PDF parsing, OCR, transcription) runs in a process pool sized
+    to the machine; its results flow through bounded queues into an
+    embedding/Qdrant stage and a graph-extraction/Neo4j stage running in
+    threads, so slow downstream stages apply backpressure instead of
+    buffering whole documents. PDFs over PDF_STREAM_MB skip the pool: the
+    stages parse them page by page, so embedding starts with the first page
+    and memory stays flat. A failure in one file is recorded and does not
+    stop the run; completed files are checkpointed and skipped on the next
+    run unless they changed. Returns {"total", "skipped", "done", "failed", "seconds"}.
+    """
+    checkpoint = IngestCheckpoint()
+    if not resume:
+        checkpoint.reset()
+
+    files = discover_files(root)
+    todo = [f for f in files if not checkpoint.is_done(f)]
+    telemetry.event(f"📂 {len(files)} files under {root}, {len(files) - len(todo)} already ingested")
+
+    progress = _Progress(len(todo), 2 if graph else 1, checkpoint)
+    # Files are checkpointed only once the vector stage has committed their chunks
+    # Documents are keyed by their path under `root` (see `source_key`)
+    stages = [("vector", lambda: _setup_vector_stage(on_commit=progress.commit, root=root))]
+    if graph:
+        stages.append(("graph", lambda: _setup_graph_stage(root=root)))
+    stage_queues = [queue.Queue(maxsize=QUEUE_SIZE) for _ in stages]
+
+    threads = [
+        threading.Thread(target=_run_stage, args=(name, setup, q, progress), daemon=True)
+        for (name, setup), q in zip(stages, stage_queues)
+    ]
+    for t in threads:
+        t.start()
+
+    workers = workers or os.cpu_count() or 1
+    pending = iter(todo)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def submit_next():
+            for path in pending:
+                progress.begin(path)
+                if not _streamed(path):
+                    in_flight[pool.submit(_extract_in_worker, path)] = path
+                    return
+                try:
+                    result = extract_file(path, stream=True)
+                except Exception as e:
+                    progress.fail(path, "extract", e)
+                    continue
+                for q in stage_queues:
+                    q.put((path, result))
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    result, metrics = future.result()
+                except Exception as e:
+                    progress.fail(path, "extract", e)
+                else:
+                    telemetry.merge(metrics)
+                    if result.get("errors"):
+                        # Extractors report failures (missing tesseract, ffmpeg
+                        # errors) here; such files must not be checkpointed
+                        progress.fail(path, "extract", "; ".join(result["errors"]))
+                        submit_next()
+                        continue
+                    for q in stage_queues:
+                        q.put((path, result))  # blocks when a stage falls behind
+                submit_next()
+
+    for q in stage_queues:
+        q.put(_SENTINEL)
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - progress.start
+    telemetry.event(
+        f"🏁 Ingested {progress.done} files ({progress.failed} failed) "
+        f"in {elapsed:.2f}s with {workers} workers"
+    )
+    return {
+        "total": len(files),
+        "skipped": len(files) - len(todo),
+        "done": progress.done,
+        "failed": progress.failed,
+        "seconds": elapsed,
+    }
@@ -1,8 +1,57 @@
 from PyPDF2 import PdfReader
 import os
+from telemetry import event
+
 from .utils import get_file_metadata
 
-def extract_text_from_pdf(file_path):
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", "8"))  # scanned pages OCR'd together
+
+
+def _record(errors, message):
+    if errors is not None and message not in errors:
+        errors.append(message)
+
+
+def _page_images(page, page_num, errors):
+    try:
+        return [image.data for image in page.images]
+    except Exception as e:
+        event(f"Failed to read images: {e}", level="warning")
+        _record(errors, f"page {page_num} images: {e}")
+        return []
+
+
+def _ocr_pages(scanned):
+    """
+    OCR buffered image-only pages as one parallel batch and return their
+    page records in page order.
+    """
+    from .image_ocr import ocr_images
+
+    flat = [(page_num, data) for page_num, images in scanned for data in images]
+    texts = ocr_images([data for _, data in flat])
+    by_page = {}
+    for (page_num, _), text in zip(flat, texts):
+        if text:
+            by_page.setdefault(page_num, []).append(text)
+    return [
+        {"text": "\n".join(by_page[page_num]), "metadata": {"page": page_num, "ocr": True}}
+        for page_num, _ in scanned
+        if page_num in by_page
+    ]
+
+
+def iter_pdf_pages(file_path, ocr=True, errors=None):
+    """
+    Stream a PDF page by page. Yields {"text", "metadata": {"page": n}} records
+    (1-based page numbers) as each page is parsed, skipping empty pages, so
+    callers can start chunking before the whole file has been read.
+
+    Pages without a text layer (scans) fall back to OCR of their embedded
+    images when `ocr` is set; such pages are OCR'd in small parallel batches
+    and marked with "ocr": True. Pages that fail to parse are skipped and,
+    if `errors` is a list, recorded in it.
+    """
     if not file_path.endswith(".pdf"):
         raise ValueError("Only PDF files are supported.")
 
@@ -10,17 +59,79 @@ def extract_text_from_pdf(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
     reader = PdfReader(file_path)
-    all_text = ""
+    scanned = []  # (page_num, [image bytes]) awaiting OCR
 
-    for page_num, page in enumerate(reader.pages):
+    for page_num, page in enumerate(reader.pages, start=1):
         try:
             text = page.extract_text()
-            if text:
-                all_text += f"\n--- Page {page_num + 1} ---\n{text}"
         except Exception as e:
-            print(f"Failed to read page {page_num + 1}: {e}")
+            event(f"Failed to read page {page_num}: {e}", level="warning")
+            _record(errors, f"page {page_num}: {e}")
+            continue
+        if text and text.strip():
+            if scanned:
+                yield from _ocr_pages(scanned)
+                scanned = []
+            yield {"text": text, "metadata": {"page": page_num}}
+        elif ocr:
+            images = _page_images(page, page_num, errors)
+            if images:
+                scanned.append((page_num, images))
+                if len(scanned) >= OCR_BATCH_PAGES:
+                    yield from _ocr_pages(scanned)
+                    scanned = []
+
+    if scanned:
+        yield from _ocr_pages(scanned)
+
+
+class PdfPages:
+    """
+    Lazy, re-iterable view of a PDF's page records: every iteration parses
+    the file again through `iter_pdf_pages`, so no pass holds more than the
+    current page (OCR'd pages come from the OCR cache after the first pass).
+    A page that fails to parse raises instead of being skipped, so a
+    consumer syncing the document stops before treating the pages after it
+    as removed.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def __iter__(self):
+        errors = []
+        for page in iter_pdf_pages(self.file_path, errors=errors):
+            if errors:
+                break
+            yield page
+        if errors:
+            raise ValueError(f"{self.file_path}: " + "; ".join(errors))
+
+
+def extract_text_from_pdf(file_path, stream=False):
+    """
+    Extract a PDF as {"text", "metadata", "segments", "errors"} with one
+    segment per page; "errors" lists pages that could not be read.
+
+    With `stream` set nothing is parsed up front: "segments" is a lazy
+    `PdfPages` and "text" is None, so consumers chunk and embed pages as
+    they are parsed and memory stays flat on very large files. Unreadable
+    pages then raise from the iteration (see `PdfPages`).
+    """
+    if stream:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        return {"text": None, "metadata": get_file_metadata(file_path), "segments": PdfPages(file_path)}
+
+    errors = []
+    segments = list(iter_pdf_pages(file_path, errors=errors))
+    all_text = "\n".join(
+        f"--- Page {s['metadata']['page']} ---\n{s['text']}" for s in segments
+    )
 
     return {
         "text": all_text.strip(),
-        "metadata": get_file_metadata(file_path)
+        "metadata": get_file_metadata(file_path),
+        "segments": segments,
+        "errors": errors,
     }
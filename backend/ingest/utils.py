@@ -1,4 +1,6 @@
+import hashlib
 import os
+from contextlib import contextmanager
 from datetime import datetime
 
 def get_file_metadata(file_path):
@@ -9,27 +11,220 @@ def get_file_metadata(file_path):
     }
 
 import re
-from typing import List
+from collections import deque
+from typing import Dict, List
 
+from telemetry import event
+
+# Tokenizer used by text-embedding-3-small; chunk sizes are measured in its tokens.
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "cl100k_base")
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\S+")
+_APPROX_TOKEN = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+_encoder = None
+
+
+def _approx_tokens(text):
+    # Errs high: BPE averages ~4 characters per token on ASCII words, and never
+    # emits more tokens than UTF-8 bytes (so CJK and other scripts are bounded)
+    total = 0
+    for m in _APPROX_TOKEN.finditer(text):
+        piece = m.group()
+        total += -(-len(piece) // 3) if piece.isascii() else len(piece.encode("utf-8"))
+    return total
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with the embedding model's tokenizer (tiktoken). If tiktoken
+    is not installed, fall back to a conservative estimate (ASCII words at 3
+    characters per token, other characters at one token per UTF-8 byte), so
+    chunks come out smaller rather than over the embedding limit.
+    """
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding(CHUNK_TOKENIZER)
+        except Exception as e:  # not installed, or its encoding could not be downloaded
+            _encoder = False
+            event(
+                f"⚠️ tiktoken unavailable ({type(e).__name__}); estimating token counts "
+                "conservatively (pip install tiktoken for exact chunk sizes)",
+                level="warning",
+            )
+    if _encoder:
+        return len(_encoder.encode_ordinary(text))
+    return _approx_tokens(text)
+
+
+def _sentence_spans(text):
+    start = 0
+    for m in _SENTENCE_BOUNDARY.finditer(text):
+        if m.start() > start:
+            yield start, m.start()
+        start = m.end()
+    end = len(text.rstrip())
+    if end > start:
+        yield start, end
+
+
+def _pieces(text, chunk_size):
+    """
+    Yield (start, end, tokens) units to pack into chunks: sentences, with
+    sentences longer than a chunk split into words (and over-long words, e.g.
+    unspaced CJK text, into slices of at most `chunk_size` tokens).
+    """
+    for start, end in _sentence_spans(text):
+        tokens = count_tokens(text[start:end])
+        if tokens <= chunk_size:
+            yield start, end, tokens
+            continue
+        for m in _WORD.finditer(text, start, end):
+            word_tokens = count_tokens(m.group())
+            if word_tokens <= chunk_size:
+                yield m.start(), m.end(), word_tokens
+                continue
+            s = m.start()
+            while s < m.end():
+                e = min(s + chunk_size, m.end())
+                tokens = count_tokens(text[s:e])
+                # Characters are not tokens: shrink the slice until it fits
+                while tokens > chunk_size and e - s > 1:
+                    e = s + max(1, (e - s) * chunk_size // tokens)
+                    tokens = count_tokens(text[s:e])
+                yield s, e, tokens
+                s = e
+
+
+def chunk_text_with_offsets(text: str, chunk_size: int = 500, overlap: int = 50) -> List[Dict]:
+    """
+    Split text into chunks of at most `chunk_size` tokens, where consecutive
+    chunks share up to `overlap` tokens of trailing sentences.
+
+    Single pass over the text: every sentence is tokenized once and the
+    sliding window keeps a running token total. Returns a list of
+    {"text", "start", "end", "tokens"} dicts, with character offsets into `text`.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-    # Split into sentences (basic approach)
-    sentences = re.split(r"(?<=[.!?]) +", text)
     chunks = []
-    current_chunk = []
-
-    total_length = 0
-    for sentence in sentences:
-        sentence_len = len(sentence.split())
-        if total_length + sentence_len > chunk_size:
-            chunks.append(" ".join(current_chunk))
-            # start new chunk with overlap
-            current_chunk = current_chunk[-overlap:] if overlap else []
-            total_length = sum(len(s.split()) for s in current_chunk)
-        current_chunk.append(sentence)
-        total_length += sentence_len
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+    window = deque()
+    window_tokens = 0
+
+    def emit():
+        start, end = window[0][0], window[-1][1]
+        chunks.append({"text": text[start:end], "start": start, "end": end, "tokens": window_tokens})
+
+    for piece in _pieces(text, chunk_size):
+        tokens = piece[2]
+        if window and window_tokens + tokens > chunk_size:
+            emit()
+            # Keep the trailing pieces that fit in the overlap (and leave room for this one)
+            while window and (window_tokens > overlap or window_tokens + tokens > chunk_size):
+                window_tokens -= window.popleft()[2]
+        window.append(piece)
+        window_tokens += tokens
+
+    if window:
+        emit()
 
     return chunks
+
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+    """
+    Token-aware chunking; see `chunk_text_with_offsets`.
+    """
+    return [c["text"] for c in chunk_text_with_offsets(text, chunk_size, overlap)]
+
+
+# Local on-disk state (embedding cache, manifests, indexes) lives here.
+CACHE_DIR = os.getenv(
+    "RAG_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".rag_cache")
+)
+
+
+def get_cache_path(*parts):
+    """
+    Return a path inside the local cache directory, creating parent folders.
+    """
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive advisory lock on `path` (created if missing), so
+    read-merge-replace updates of shared on-disk state from several
+    processes (CLI ingest and the UI) serialize. A no-op without fcntl.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def content_hash(text: str) -> str:
+    """
+    Stable SHA-256 hex digest of a text, used as a content address.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_segments(segments, chunk_size: int = 500, overlap: int = 50):
+    """
+    Chunk a stream of {"text", "metadata"} segments (PDF pages, transcript
+    windows, ...) lazily. Each chunk is yielded as {"text", "metadata"} and
+    carries its segment's metadata (e.g. the page number) plus its character
+    offsets within the segment.
+    """
+    for segment in segments:
+        for chunk in chunk_text_with_offsets(segment["text"], chunk_size, overlap):
+            metadata = dict(segment.get("metadata") or {})
+            metadata["char_start"] = chunk["start"]
+            metadata["char_end"] = chunk["end"]
+            yield {"text": chunk["text"], "metadata": metadata}
+
+
+def merge_timed_segments(segments, max_tokens: int = 500):
+    """
+    Merge consecutive short timed segments ({"text", "metadata": {"start",
+    "end"}}, e.g. Whisper output) into groups of at most `max_tokens` tokens,
+    each spanning the start of its first to the end of its last segment.
+    """
+    merged, group, group_tokens = [], [], 0
+
+    def flush():
+        if group:
+            merged.append(
+                {
+                    "text": " ".join(s["text"] for s in group),
+                    "metadata": {
+                        "start": group[0]["metadata"]["start"],
+                        "end": group[-1]["metadata"]["end"],
+                    },
+                }
+            )
+
+    for segment in segments:
+        tokens = count_tokens(segment["text"])
+        if group and group_tokens + tokens > max_tokens:
+            flush()
+            group, group_tokens = [], 0
+        group.append(segment)
+        group_tokens += tokens
+    flush()
+    return merged
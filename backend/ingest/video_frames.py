@@ -0,0 +1,171 @@
+import io
+import json
+import os
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+from telemetry import event
+
+from .utils import get_file_metadata
+
+SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "1"))  # frames decoded per second of video
+FRAME_WIDTH = int(os.getenv("VIDEO_FRAME_WIDTH", "1280"))  # decode width; height keeps aspect
+SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.08"))  # mean abs diff, 0..1
+HASH_DISTANCE = int(os.getenv("VIDEO_HASH_DISTANCE", "6"))  # max Hamming bits for a duplicate
+DIFF_STRIDE = 8  # frame differencing works on every 8th pixel
+
+
+def probe_video(file_path):
+    """
+    Return (width, height, duration_seconds) of the first video stream.
+    """
+    out = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=width,height:format=duration", "-of", "json", file_path,
+        ],
+        capture_output=True,
+        check=True,
+    ).stdout
+    info = json.loads(out)
+    stream = info["streams"][0]
+    return stream["width"], stream["height"], float(info["format"].get("duration", 0))
+
+
+def has_audio(file_path):
+    """
+    Whether the file has an audio stream to transcribe.
+    """
+    out = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "a",
+            "-show_entries", "stream=index", "-of", "csv=p=0", file_path,
+        ],
+        capture_output=True,
+        check=True,
+    ).stdout
+    return bool(out.strip())
+
+
+def iter_frames(file_path, fps=SAMPLE_FPS, width=FRAME_WIDTH):
+    """
+    Stream grayscale frames sampled at `fps` from an ffmpeg pipe, without
+    writing them to disk. Yields (timestamp_seconds, uint8 array of shape (h, w)).
+    """
+    src_w, src_h, _ = probe_video(file_path)
+    width = min(width, src_w)
+    height = int(round(src_h * width / src_w / 2)) * 2
+    frame_size = width * height
+    proc = subprocess.Popen(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-i", file_path,
+            "-vf", f"fps={fps},scale={width}:{height}",
+            "-f", "rawvideo", "-pix_fmt", "gray", "-",
+        ],
+        stdout=subprocess.PIPE,
+        bufsize=frame_size * 4,
+    )
+    try:
+        index = 0
+        while True:
+            buf = proc.stdout.read(frame_size)
+            if len(buf) < frame_size:
+                break
+            yield index / fps, np.frombuffer(buf, np.uint8).reshape(height, width)
+            index += 1
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def dhash(frame, size=8):
+    """
+    64-bit difference hash of a grayscale frame: block-average down to
+    size x (size + 1) and compare horizontal neighbours.
+    """
+    h, w = frame.shape
+    rows, cols = size, size + 1
+    trimmed = frame[: h - h % rows, : w - w % cols].astype(np.float32)
+    small = trimmed.reshape(rows, trimmed.shape[0] // rows, cols, trimmed.shape[1] // cols).mean(axis=(1, 3))
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def select_keyframes(frames, threshold=SCENE_THRESHOLD, max_distance=HASH_DISTANCE):
+    """
+    Pick the frames worth OCR'ing from a (timestamp, frame) stream.
+
+    A frame becomes a candidate when it differs from the last candidate by
+    more than `threshold` (mean absolute difference on a subsampled grid),
+    i.e. on a scene or slide change. Candidates whose perceptual hash is
+    within `max_distance` bits of an already-kept keyframe (a slide shown
+    again) are dropped. Yields (timestamp, frame) for the distinct keyframes.
+    """
+    last = None
+    kept_hashes = []
+    for timestamp, frame in frames:
+        small = frame[::DIFF_STRIDE, ::DIFF_STRIDE].astype(np.int16)
+        if last is not None and np.abs(small - last).mean() / 255.0 <= threshold:
+            continue
+        last = small
+        h = dhash(frame)
+        if any(bin(h ^ k).count("1") <= max_distance for k in kept_hashes):
+            continue
+        kept_hashes.append(h)
+        yield timestamp, frame
+
+
+def _png(frame):
+    buf = io.BytesIO()
+    Image.fromarray(frame).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def extract_text_from_video(file_path, transcribe=True):
+    """
+    Index a video: OCR the distinct keyframes and transcribe the audio track.
+
+    Returns {"text", "metadata", "segments"}, where OCR segments carry
+    {"start", "end", "source": "frame"} (the span the slide was on screen,
+    ending where the next keyframe starts) and transcript segments carry
+    {"start", "end", "source": "speech"}. Times are in seconds. A failed
+    transcription is passed on in "errors".
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    from .image_ocr import ocr_images
+
+    _, _, duration = probe_video(file_path)
+    keyframes = list(select_keyframes(iter_frames(file_path)))
+    texts = ocr_images([_png(frame) for _, frame in keyframes])
+    starts = [t for t, _ in keyframes]
+    ends = starts[1:] + [duration or (starts[-1] if starts else 0)]
+
+    segments = [
+        {"text": text, "metadata": {"start": round(s, 2), "end": round(e, 2), "source": "frame"}}
+        for s, e, text in zip(starts, ends, texts)
+        if text
+    ]
+    event(f"🎞️ {len(keyframes)} keyframes OCR'd, {len(segments)} with text")
+
+    errors = []
+    if transcribe and has_audio(file_path):
+        from .audio_transcribe import transcribe_audio
+
+        audio = transcribe_audio(file_path)
+        errors.extend(audio.get("errors", []))
+        for seg in audio["segments"]:
+            seg["metadata"]["source"] = "speech"
+        segments.extend(audio["segments"])
+
+    segments.sort(key=lambda s: s["metadata"]["start"])
+    return {
+        "text": "\n".join(s["text"] for s in segments),
+        "metadata": get_file_metadata(file_path),
+        "segments": segments,
+        "errors": errors,
+    }
@@ -0,0 +1,74 @@
+"""
+Retry policy shared by every OpenAI call (embeddings, entity extraction).
+
+Rate limits and transient errors are retried up to `max_retries` times,
+waiting for the server's Retry-After when it sends one and otherwise
+backing off exponentially with jitter. Anything else is a real failure.
+"""
+import asyncio
+import random
+import time
+
+import openai
+
+from telemetry import count, event
+
+OPENAI_MAX_RETRIES = 6
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def retry_delay(error, attempt):
+    """
+    Seconds to wait before retrying: the server's Retry-After when it sends
+    one, otherwise exponential backoff with jitter.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after) + random.uniform(0, 1)
+    except (TypeError, ValueError):
+        return min(2**attempt, 30) + random.uniform(0, 1)
+
+
+def _backoff(error, attempt, op, label):
+    delay = retry_delay(error, attempt)
+    count("rag_retries_total", service="openai", op=op, error=type(error).__name__)
+    event(
+        f"⏳ {label} request failed ({type(error).__name__}), retrying in {delay:.1f}s",
+        level="warning",
+    )
+    return delay
+
+
+def with_retries(call, op, label, max_retries=OPENAI_MAX_RETRIES):
+    """
+    Return `call(attempt)`, retrying retryable errors. `op` tags the retry
+    counter and `label` names the request in warnings.
+    """
+    for attempt in range(max_retries):
+        try:
+            return call(attempt)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(_backoff(e, attempt, op, label))
+
+
+async def with_retries_async(call, op, label, max_retries=OPENAI_MAX_RETRIES):
+    """
+    Async `with_retries`: awaits `call(attempt)` and sleeps without blocking
+    the event loop.
+    """
+    for attempt in range(max_retries):
+        try:
+            return await call(attempt)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries - 1:
+                raise
+            await asyncio.sleep(_backoff(e, attempt, op, label))
@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from retrieval.keyword_search import keyword_search
+from retrieval.query_cache import get_query_cache
+from telemetry import count, span
+
+RRF_K = 60  # reciprocal rank fusion damping constant
+CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # hits taken from each ranked list
+
+# Relative weight of each ranked list in the fusion
+DEFAULT_WEIGHTS = {"vector": 1.0, "keyword": 1.0, "graph": 0.5}
+
+# Latency budget per stage, in seconds. A stage that overruns is dropped
+# from the fusion instead of holding up the query.
+DEFAULT_BUDGETS = {"graph": 0.3, "vector": 2.0, "keyword": 0.3, "fetch": 0.5}
+
+# Stage calls are blocking client calls. They run on a long-lived pool rather
+# than the loop's default executor, which asyncio.run() joins on exit and
+# would make a query wait for a stage that already blew its budget.
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hybrid")
+
+
+def _graph_neighbors(source_node, relation_type):
+    from extract.entity_resolution import get_entity_resolver
+    from graphdb.graph_snapshot import GRAPH_HOPS
+    from graphdb.neo4j_setup import get_mentioned_chunks, get_related_entities
+
+    source_node = get_entity_resolver().lookup(source_node)
+    related = get_related_entities(source_node, relation_type, hops=GRAPH_HOPS)
+    if source_node not in related:
+        related.insert(0, source_node)
+    return related, get_mentioned_chunks(related)
+
+
+def _embed(query):
+    from vectordb.embeddings import get_openai_embedding
+
+    return get_openai_embedding(query)
+
+
+def _vector_search(query_vector, top_k, ids=None):
+    from vectordb.qdrant_setup import search_by_vector
+
+    return [
+        (str(hit.id), hit.score, hit.payload)
+        for hit in search_by_vector(query_vector, top_k, ids=ids)
+    ]
+
+
+def _fetch_payloads(ids):
+    from vectordb.qdrant_setup import get_payloads
+
+    return get_payloads(ids)
+
+
+def reciprocal_rank_fusion(ranked_lists, weights, k=RRF_K):
+    """
+    Fuse ranked ID lists: score(d) = sum over lists of weight / (k + rank).
+    `ranked_lists` maps a list name to IDs in rank order. Returns
+    [(id, score, {list name: 1-based rank})] sorted by fused score.
+    """
+    scores, ranks = {}, {}
+    for name, ids in ranked_lists.items():
+        weight = weights.get(name, 1.0)
+        for rank, doc_id in enumerate(ids, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+            ranks.setdefault(doc_id, {})[name] = rank
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(doc_id, score, ranks[doc_id]) for doc_id, score in fused]
+
+
+class _Stages:
+    """
+    Runs blocking stage functions in threads under a time budget and records
+    per-stage latency (ms) and status.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.status = {}
+
+    async def run(self, name, budget, fn, *args):
+        start = time.perf_counter()
+        with span(f"search.{name}") as stage_span:
+            try:
+                loop = asyncio.get_running_loop()
+                # The copied context lets spans opened by `fn` nest under this one
+                call = loop.run_in_executor(_executor, contextvars.copy_context().run, fn, *args)
+                result = await asyncio.wait_for(call, budget)
+                self.status[name] = "ok"
+                return result
+            except asyncio.TimeoutError:
+                self.status[name] = "timeout"
+            except Exception as e:
+                self.status[name] = f"error: {e}"
+            finally:
+                self.timings[name] = (time.perf_counter() - start) * 1000
+                status = self.status.get(name, "cancelled")
+                stage_span.set(status=status)
+                if status != "ok":
+                    count("rag_search_stage_failures_total", stage=name, status=status.split(":")[0])
+        return None
+
+
+async def hybrid_search_async(
+    query, source_node=None, relation_type=None, top_k=5, weights=None, budgets=None
+):
+    """
+    Hybrid retrieval with all backends queried concurrently:
+
+    - vector:  embed the query, then Qdrant nearest neighbours
+    - keyword: BM25 over the local keyword index
+    - graph:   entities within GRAPH_HOPS of `source_node` (from the in-memory
+               graph snapshot), turned into the IDs of the chunks that
+               mention them (MENTIONED_IN), then a vector search restricted
+               to those IDs with a HasId filter
+
+    The ranked lists are merged with weighted reciprocal rank fusion. Each
+    stage runs under its latency budget; a stage that times out or fails
+    contributes nothing and is reported in "status".
+
+    Responses are cached (`query_cache`): an exact repeat is answered before
+    any stage runs, and a near-duplicate as soon as its embedding is known,
+    cancelling the other stages. Only responses where every stage succeeded,
+    and no index write invalidated the cache meanwhile, are cached.
+
+    Returns {"results": [{"id", "score", "payload", "ranks"}], "entities",
+    "timings": {stage: ms}, "status": {stage: "ok" | "timeout" | "error: ..."},
+    "cache": None | "exact" | "semantic"}.
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    stages = _Stages()
+    start = time.perf_counter()
+
+    cache = get_query_cache()
+    options = (source_node or "", relation_type, top_k, tuple(sorted(weights.items())))
+    if cache is not None:
+        cached = cache.get(query, options)
+        if cached is not None:
+            return _from_cache(cached, "exact", start)
+        generation = cache.generation
+
+    # Shared by the vector and graph lists; shielded so one list timing out
+    # does not cancel the embedding for the other
+    embedding = asyncio.ensure_future(stages.run("embed", budgets["vector"], _embed, query))
+
+    async def vector():
+        async def chain():
+            query_vector = await asyncio.shield(embedding)
+            if query_vector is None:
+                return None
+            return await stages.run(
+                "vector_search", budgets["vector"], _vector_search, query_vector, CANDIDATES
+            )
+
+        try:
+            return await asyncio.wait_for(chain(), budgets["vector"])
+        except asyncio.TimeoutError:
+            stages.status["vector"] = "timeout"
+            return None
+
+    async def graph():
+        if not source_node:
+            return None, []
+        neighborhood = await stages.run(
+            "graph", budgets["graph"], _graph_neighbors, source_node, relation_type
+        )
+        if not neighborhood:
+            return None, []
+        entities, chunk_ids = neighborhood
+        if not chunk_ids:
+            return None, entities
+        try:
+            query_vector = await asyncio.wait_for(asyncio.shield(embedding), budgets["vector"])
+        except asyncio.TimeoutError:
+            return None, entities
+        if query_vector is None:
+            return None, entities
+        hits = await stages.run(
+            "graph_vector", budgets["vector"], _vector_search, query_vector, CANDIDATES, chunk_ids
+        )
+        return hits, entities
+
+    tasks = asyncio.gather(
+        vector(),
+        stages.run("keyword", budgets["keyword"], keyword_search, query, CANDIDATES),
+        graph(),
+    )
+    query_vector = await asyncio.shield(embedding)
+    if cache is not None and query_vector is not None:
+        cached = cache.get_similar(query_vector, options)
+        if cached is not None:
+            tasks.cancel()
+            await asyncio.gather(tasks, return_exceptions=True)
+            return _from_cache(cached, "semantic", start)
+    vector_hits, keyword_hits, (graph_hits, entities) = await tasks
+
+    ranked = {
+        "vector": [doc_id for doc_id, _, _ in vector_hits or []],
+        "keyword": [doc_id for doc_id, _ in keyword_hits or []],
+        "graph": [doc_id for doc_id, _, _ in graph_hits or []],
+    }
+    fused = reciprocal_rank_fusion(ranked, weights)[:top_k]
+
+    payloads = {
+        doc_id: payload for doc_id, _, payload in (vector_hits or []) + (graph_hits or [])
+    }
+    missing = [doc_id for doc_id, _, _ in fused if doc_id not in payloads]
+    if missing:
+        payloads.update(await stages.run("fetch", budgets["fetch"], _fetch_payloads, missing) or {})
+
+    stages.timings["total"] = (time.perf_counter() - start) * 1000
+    response = {
+        "results": [
+            {"id": doc_id, "score": score, "payload": payloads[doc_id], "ranks": ranks}
+            for doc_id, score, ranks in fused
+            if doc_id in payloads
+        ],
+        "entities": entities,
+        "timings": stages.timings,
+        "status": stages.status,
+        "cache": None,
+    }
+    if cache is not None and all(status == "ok" for status in stages.status.values()):
+        cache.put(query, options, response, query_vector, generation)
+    return response
+
+
+def _from_cache(cached, kind, start):
+    """
+    A cached response, re-labelled with how it was found and this lookup's latency.
+    """
+    return {
+        **cached,
+        "timings": {"total": (time.perf_counter() - start) * 1000},
+        "cache": kind,
+    }
+
+
+def hybrid_search(query, source_node=None, relation_type=None, top_k=5, weights=None, budgets=None):
+    """
+    Synchronous wrapper around `hybrid_search_async`.
+    """
+    with span("search.hybrid", top_k=top_k, graph=bool(source_node)) as search_span:
+        response = asyncio.run(
+            hybrid_search_async(query, source_node, relation_type, top_k, weights, budgets)
+        )
+        search_span.set(cache=response["cache"], results=len(response["results"]))
+    count("rag_cache_requests_total", cache="query", result=response["cache"] or "miss")
+    return response
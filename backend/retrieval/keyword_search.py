@@ -0,0 +1,316 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from ingest.utils import file_lock, get_cache_path
+
+MAX_TERM_LENGTH = 32  # terms are stored in a fixed-width array; longer tokens are dropped
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens without stopwords or over-long tokens.
+    """
+    return [
+        t
+        for t in _TOKEN.findall(text.lower())
+        if t not in STOPWORDS and len(t) <= MAX_TERM_LENGTH
+    ]
+
+
+class BM25Index:
+    """
+    BM25 inverted index over chunks, keyed by the same point IDs as Qdrant.
+
+    The committed index is a set of .npy files loaded with mmap, so opening
+    it is instant and pages are read on demand:
+      terms         sorted vocabulary (fixed-width unicode)
+      term_offsets  postings of terms[i] are [term_offsets[i], term_offsets[i+1])
+      post_docs     int32 doc numbers, sorted by (term, doc)
+      post_tfs      uint16 term frequencies
+      doc_lens      int32 token count per doc
+      doc_ids       chunk/point ID per doc number
+
+    Changes are buffered with `add`/`remove` and merged into new arrays by
+    `commit`, which is fully vectorized and swaps the files in atomically.
+    Commits from several processes are serialized with a file lock, and each
+    merges into the latest committed version rather than the one it loaded.
+    """
+
+    FILES = ("terms", "term_offsets", "post_docs", "post_tfs", "doc_lens", "doc_ids")
+
+    def __init__(self, directory=None, k1=K1, b=B):
+        self.directory = directory or os.path.dirname(get_cache_path("bm25", "meta.json"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._added = {}  # chunk_id -> Counter
+        self._removed = set()
+        self._load()
+
+    # --- persistence ----------------------------------------------------
+
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _lock_path(self):
+        return os.path.join(self.directory, "commit.lock")
+
+    def _committed_version(self):
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)["version"]
+        except FileNotFoundError:
+            return None
+
+    def _open(self, version):
+        if version is None:
+            return {
+                "terms": np.empty(0, dtype=f"<U{MAX_TERM_LENGTH}"),
+                "term_offsets": np.zeros(1, dtype=np.int64),
+                "post_docs": np.empty(0, dtype=np.int32),
+                "post_tfs": np.empty(0, dtype=np.uint16),
+                "doc_lens": np.empty(0, dtype=np.int32),
+                "doc_ids": np.empty(0, dtype="<U36"),
+            }
+        return {
+            name: np.load(os.path.join(self.directory, f"{name}.{version}.npy"), mmap_mode="r")
+            for name in self.FILES
+        }
+
+    def _load(self):
+        for attempt in range(3):
+            version = self._committed_version()
+            try:
+                arrays = self._open(version)
+                break
+            except FileNotFoundError:
+                # Another process committed (and removed this version) in between
+                if attempt == 2:
+                    raise
+        doc_lens = np.asarray(arrays["doc_lens"], dtype=np.float32)
+        avgdl = float(doc_lens.mean()) if len(doc_lens) else 1.0
+        # Arrays and the per-doc BM25 length normalisation derived from them
+        # are swapped in as one object, so a concurrent `search` never pairs
+        # new postings with old norms
+        self._state = {
+            "version": version,
+            "arrays": arrays,
+            "norm": self.k1 * (1 - self.b + self.b * doc_lens / avgdl),
+        }
+
+    @property
+    def arrays(self):
+        return self._state["arrays"]
+
+    def refresh(self):
+        """
+        Reload if another process committed a newer version.
+        """
+        version = self._committed_version()
+        if version is not None and version != self._state["version"]:
+            with self._lock:
+                self._load()
+
+    def __len__(self):
+        return len(self.arrays["doc_ids"])
+
+    # --- updates --------------------------------------------------------
+
+    def add(self, chunk_id, text):
+        """
+        Buffer a chunk for indexing (replacing any previous version).
+        """
+        with self._lock:
+            self._removed.discard(chunk_id)
+            self._added[chunk_id] = Counter(tokenize(text))
+
+    def remove(self, chunk_id):
+        """
+        Buffer a chunk for removal.
+        """
+        with self._lock:
+            self._added.pop(chunk_id, None)
+            self._removed.add(chunk_id)
+
+    def commit(self):
+        """
+        Merge buffered changes into new arrays and persist them.
+        """
+        with self._lock, file_lock(self._lock_path()):
+            if not self._added and not self._removed:
+                return
+            if self._committed_version() != self._state["version"]:
+                self._load()  # merge into what other processes committed since
+            a = self.arrays
+            doc_ids = np.asarray(a["doc_ids"])
+            dropped = np.isin(doc_ids, list(self._removed | set(self._added)))
+            keep = ~dropped
+            remap = np.cumsum(keep) - 1
+
+            # Existing postings of surviving docs
+            old_vocab = np.asarray(a["terms"])
+            offsets = np.asarray(a["term_offsets"])
+            post_terms = np.repeat(np.arange(len(old_vocab), dtype=np.int32), np.diff(offsets))
+            post_docs = np.asarray(a["post_docs"])
+            live = keep[post_docs] if len(post_docs) else np.empty(0, dtype=bool)
+            old_terms = post_terms[live]
+            old_docs = remap[post_docs[live]].astype(np.int32)
+            old_tfs = np.asarray(a["post_tfs"])[live]
+
+            # Postings of buffered docs, numbered after the survivors, with
+            # terms numbered in a temporary local vocabulary
+            base = int(keep.sum())
+            new_ids = list(self._added)
+            local_vocab = {}
+            new_terms, new_docs, new_tfs, new_lens = [], [], [], []
+            for n, chunk_id in enumerate(new_ids):
+                counts = self._added[chunk_id]
+                new_terms.extend(local_vocab.setdefault(t, len(local_vocab)) for t in counts)
+                new_docs.extend([base + n] * len(counts))
+                new_tfs.extend(min(tf, 65535) for tf in counts.values())
+                new_lens.append(sum(counts.values()))
+
+            # Merge vocabularies and renumber both sets of postings into it
+            local_terms = np.array(list(local_vocab), dtype=f"<U{MAX_TERM_LENGTH}")
+            vocab = np.union1d(old_vocab, local_terms).astype(f"<U{MAX_TERM_LENGTH}")
+            old_to_new = np.searchsorted(vocab, old_vocab).astype(np.int32)
+            local_to_new = np.searchsorted(vocab, local_terms).astype(np.int32)
+
+            all_terms = np.concatenate(
+                [old_to_new[old_terms], local_to_new[np.array(new_terms, dtype=np.int64)]]
+            )
+            all_docs = np.concatenate([old_docs, np.array(new_docs, dtype=np.int32)])
+            all_tfs = np.concatenate([old_tfs, np.array(new_tfs, dtype=np.uint16)])
+            order = np.lexsort((all_docs, all_terms))
+            term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(all_terms, minlength=len(vocab)), out=term_offsets[1:])
+
+            arrays = {
+                "terms": vocab,
+                "term_offsets": term_offsets,
+                "post_docs": all_docs[order],
+                "post_tfs": all_tfs[order],
+                "doc_lens": np.concatenate(
+                    [np.asarray(a["doc_lens"])[keep], np.array(new_lens, dtype=np.int32)]
+                ),
+                "doc_ids": np.concatenate([doc_ids[keep], np.array(new_ids, dtype="<U36")]),
+            }
+
+            old_version = self._state["version"]
+            version = (old_version or 0) + 1
+            for name, array in arrays.items():
+                np.save(os.path.join(self.directory, f"{name}.{version}.npy"), array)
+            tmp = self._meta_path() + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"version": version, "docs": len(arrays["doc_ids"])}, f)
+            os.replace(tmp, self._meta_path())
+
+            self._added.clear()
+            self._removed.clear()
+            self._load()
+
+        if old_version is not None:
+            for name in self.FILES:
+                try:
+                    os.remove(os.path.join(self.directory, f"{name}.{old_version}.npy"))
+                except OSError:
+                    pass
+
+    # --- queries --------------------------------------------------------
+
+    def search(self, query, top_k=5):
+        """
+        Return the top-k (chunk_id, score) pairs for `query` by BM25.
+        """
+        state = self._state  # one consistent version for the whole query
+        a, norm = state["arrays"], state["norm"]
+        n_docs = len(a["doc_ids"])
+        terms = set(tokenize(query))
+        if not n_docs or not terms:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        vocab = a["terms"]
+        offsets = a["term_offsets"]
+        for term in terms:
+            i = int(np.searchsorted(vocab, term))
+            if i >= len(vocab) or vocab[i] != term:
+                continue
+            start, end = int(offsets[i]), int(offsets[i + 1])
+            docs = a["post_docs"][start:end]
+            tfs = a["post_tfs"][start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            # Doc numbers are unique within one term's postings, so += is safe
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(str(a["doc_ids"][d]), float(scores[d])) for d in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_keyword_index():
+    """
+    Return the process-wide BM25 index, reloading it if another process
+    has committed changes since it was opened.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BM25Index()
+    _index.refresh()
+    return _index
+
+
+def keyword_search(query, top_k=5):
+    """
+    Top-k (chunk_id, score) pairs for `query` from the local BM25 index.
+    """
+    return get_keyword_index().search(query, top_k)
+
+
+def build_from_qdrant(client, collection_name, batch_size=1000):
+    """
+    (Re)index every chunk already stored in a Qdrant collection, e.g. for
+    documents ingested before the keyword index existed.
+    """
+    index = get_keyword_index()
+    offset = None
+    count = 0
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["text"],
+            with_vectors=False,
+        )
+        for point in points:
+            index.add(str(point.id), point.payload.get("text", ""))
+        count += len(points)
+        if offset is None:
+            break
+    index.commit()
+    return count
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ingest.utils import get_cache_path
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "600"))  # seconds
+QUERY_CACHE_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.95"))  # cosine for a near-duplicate
+QUERY_CACHE_DISABLED = os.getenv("QUERY_CACHE_DISABLED", "0") == "1"
+
+
+def _stamp_path():
+    return get_cache_path("query_cache.stamp")
+
+
+def _read_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def _bump_stamp(path):
+    # Replaced rather than rewritten, so the inode changes even when two
+    # bumps land within one mtime tick
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "w") as f:
+        f.write(str(time.time()))
+    os.replace(tmp, path)
+
+
+def normalize_query(query):
+    """
+    Exact-match form of a query: casefolded with whitespace collapsed.
+    """
+    return " ".join(query.casefold().split())
+
+
+class QueryCache:
+    """
+    In-memory cache of hybrid search responses.
+
+    Exact repeats (same normalized query and search options) are served from
+    an LRU dict. Near-duplicates are found by cosine similarity of the query
+    embedding against a small matrix holding one row per cached entry, but
+    only among entries with the same options (source node, relation, top_k,
+    weights). Entries expire after `ttl` seconds, and `invalidate` drops
+    everything when the indexes change.
+
+    Index writes in other processes (CLI ingestion while the UI serves
+    queries) replace a shared stamp file; every lookup compares it with the
+    last one seen and drops everything when it changed. Each invalidation
+    bumps `generation`, and `put` ignores responses computed under an
+    older generation.
+    """
+
+    def __init__(
+        self,
+        max_entries=QUERY_CACHE_SIZE,
+        ttl=QUERY_CACHE_TTL,
+        threshold=QUERY_CACHE_THRESHOLD,
+        stamp_path=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.stamp_path = stamp_path or _stamp_path()
+        self._stamp = _read_stamp(self.stamp_path)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (query, options) -> (response, created, slot)
+        self._vectors = None  # (max_entries, dim) float32, unit rows
+        self._slot_keys = [None] * max_entries
+        self._free = list(range(max_entries))
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _expired(self, created):
+        return self.ttl and time.time() - created > self.ttl
+
+    def _drop(self, key):
+        _, _, slot = self._entries.pop(key)
+        if slot is not None:
+            self._slot_keys[slot] = None
+            self._free.append(slot)
+
+    def _clear(self):
+        for key in list(self._entries):
+            self._drop(key)
+        self._generation += 1
+        self.invalidations += 1
+
+    def _sync(self):
+        # Caller holds the lock
+        stamp = _read_stamp(self.stamp_path)
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._clear()
+
+    @property
+    def generation(self):
+        """
+        Invalidation counter; read it before computing a response to `put`.
+        """
+        with self._lock:
+            self._sync()
+            return self._generation
+
+    def get(self, query, options):
+        """
+        Cached response for an exact repeat, or None.
+        """
+        key = (normalize_query(query), options)
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[0]
+
+    def get_similar(self, query_vector, options):
+        """
+        Cached response of the most similar earlier query with the same
+        options, if its cosine similarity reaches the threshold; else None
+        (counted as a miss).
+        """
+        with self._lock:
+            self._sync()
+            if self._vectors is not None and self._entries:
+                q = np.asarray(query_vector, dtype=np.float32)
+                q /= np.linalg.norm(q) or 1.0
+                slots = [
+                    s for s, key in enumerate(self._slot_keys) if key is not None and key[1] == options
+                ]
+                if slots:
+                    sims = self._vectors[slots] @ q
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.threshold:
+                        key = self._slot_keys[slots[best]]
+                        response, created, _ = self._entries[key]
+                        if not self._expired(created):
+                            self._entries.move_to_end(key)
+                            self.semantic_hits += 1
+                            return response
+                        self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, query, options, response, query_vector=None, generation=None):
+        """
+        Cache a response, with its query embedding for near-duplicate lookups.
+        A no-op if the cache was invalidated since `generation` was read.
+        """
+        key = (normalize_query(query), options)
+        with self._lock:
+            self._sync()
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+            slot = None
+            if query_vector is not None:
+                v = np.asarray(query_vector, dtype=np.float32)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, len(v)), dtype=np.float32)
+                slot = self._free.pop()
+                self._vectors[slot] = v / (np.linalg.norm(v) or 1.0)
+                self._slot_keys[slot] = key
+            self._entries[key] = (response, time.time(), slot)
+
+    def invalidate(self):
+        """
+        Drop every entry (the indexes changed).
+        """
+        with self._lock:
+            self._clear()
+            self._stamp = _read_stamp(self.stamp_path)
+
+    def stats(self):
+        """
+        Hit counters for this process: exact and semantic hits, misses, the
+        overall hit rate and the current entry count.
+        """
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """
+    Return the process-wide query cache, or None if caching is disabled.
+    """
+    global _cache
+    if QUERY_CACHE_DISABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+        return _cache
+
+
+def invalidate_query_cache():
+    """
+    Drop cached query results; called after writes to any index. Also
+    replaces the shared stamp, so query caches in other processes drop
+    theirs on their next lookup.
+    """
+    _bump_stamp(_stamp_path())
+    if _cache is not None:
+        _cache.invalidate()
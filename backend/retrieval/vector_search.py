@@ -0,0 +1,457 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from ingest.utils import file_lock, get_cache_path
+
+VECTOR_DIM = 1536
+SEARCH_BATCH_ROWS = 65536  # rows scored per matmul block, bounds scratch memory
+IVF_TRAIN_ITERATIONS = 10
+LOCAL_VECTOR_NPROBE = int(os.getenv("LOCAL_VECTOR_NPROBE", "0"))  # >0: IVF search over this many partitions
+IVF_MIN_ROWS = int(os.getenv("LOCAL_IVF_MIN_ROWS", "20000"))  # build the IVF once the index is this big
+
+
+class ScoredHit:
+    """
+    Search hit with the attributes of Qdrant's ScoredPoint that callers use:
+    `id`, `score` and `payload`.
+    """
+
+    __slots__ = ("id", "score", "payload")
+
+    def __init__(self, id, score, payload):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+    def __repr__(self):
+        return f"ScoredHit(id={self.id!r}, score={self.score:.4f})"
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LocalVectorIndex:
+    """
+    Embedded cosine-similarity index: an in-process stand-in for the Qdrant
+    collection with no server to run.
+
+    Vectors are L2-normalised and stored row-wise, so search is a blocked
+    matrix multiply. Storage precision is selectable:
+      "float32"  exact
+      "float16"  half the memory, scores within ~1e-3
+      "int8"     a quarter of the memory, per-row symmetric scale factors
+    After `build_ivf`, searches with `nprobe` only scan the rows in the
+    nprobe partitions whose k-means centroids are nearest the query
+    (approximate, much less work on large corpora). With a default `nprobe`
+    the IVF is built automatically on `save` once the index holds
+    IVF_MIN_ROWS points.
+
+    Like the BM25 index, the committed index is a set of versioned files,
+    with meta.json naming the current version:
+      vectors.{v}.bin   rows, opened as a read-only memmap
+      scales.{v}.npy    per-row scale factors
+      points.{v}.json   point ID and payload of each row
+      ivf.{v}.npz       centroids and row assignments, once built
+    `upsert`, `set_payload` and `delete` are buffered. `save` merges them
+    into the latest committed version under a file lock (so processes
+    sharing the directory never drop each other's points), writes the next
+    version without deleted rows and swaps it in as one state object;
+    searches read a single state, so they never see a half-written one.
+    """
+
+    def __init__(self, directory=None, dim=VECTOR_DIM, dtype="float32", nprobe=None):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.directory = directory or os.path.dirname(get_cache_path("vectors", "meta.json"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.dim = dim
+        self.dtype = dtype
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._added = {}  # point_id -> (encoded row, scale, payload)
+        self._removed = set()
+        self._payload_updates = {}  # point_id -> payload, for committed points
+        self._load()
+
+    # --- persistence ----------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _committed_version(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta["dim"] != self.dim or meta["dtype"] != self.dtype:
+            raise ValueError(
+                f"Index at {self.directory} is {meta['dim']}-d {meta['dtype']}, "
+                f"not {self.dim}-d {self.dtype}"
+            )
+        return meta["version"]
+
+    def _open(self, version):
+        state = {
+            "version": version,
+            "ids": [],
+            "payloads": [],
+            "matrix": np.empty((0, self.dim), dtype=self.dtype),
+            "scales": np.empty(0, dtype=np.float32),
+            "centroids": None,
+            "assignments": None,
+        }
+        if version is not None:
+            with open(self._path(f"points.{version}.json")) as f:
+                points = json.load(f)
+            state["ids"], state["payloads"] = points["ids"], points["payloads"]
+            state["scales"] = np.load(self._path(f"scales.{version}.npy"))
+            if state["ids"]:
+                state["matrix"] = np.memmap(
+                    self._path(f"vectors.{version}.bin"),
+                    dtype=self.dtype,
+                    mode="r",
+                    shape=(len(state["ids"]), self.dim),
+                )
+            if os.path.exists(self._path(f"ivf.{version}.npz")):
+                ivf = np.load(self._path(f"ivf.{version}.npz"))
+                state["centroids"], state["assignments"] = ivf["centroids"], ivf["assignments"]
+        state["positions"] = {point_id: i for i, point_id in enumerate(state["ids"])}
+        return state
+
+    def _load(self):
+        for attempt in range(3):
+            version = self._committed_version()
+            try:
+                self._state = self._open(version)
+                return
+            except FileNotFoundError:
+                # Another process committed (and removed this version) in between
+                if attempt == 2:
+                    raise
+
+    def refresh(self):
+        """
+        Reload if another process committed a newer version.
+        """
+        version = self._committed_version()
+        if version is not None and version != self._state["version"]:
+            with self._lock:
+                self._load()
+
+    @property
+    def ids(self):
+        return self._state["ids"]
+
+    @property
+    def payloads(self):
+        return self._state["payloads"]
+
+    def _write_ivf(self, version, centroids, assignments):
+        tmp = self._path(f"ivf.{version}.npz.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=centroids, assignments=assignments)
+        os.replace(tmp, self._path(f"ivf.{version}.npz"))
+
+    def save(self):
+        """
+        Commit buffered changes as a new version and swap it in, building
+        the IVF first when it is configured and the index is big enough.
+        """
+        with self._lock, file_lock(self._path("commit.lock")):
+            if not self._added and not self._removed and not self._payload_updates:
+                return
+            if self._committed_version() != self._state["version"]:
+                self._load()  # merge into what other processes committed since
+            old = self._state
+            replaced = self._removed | set(self._added)
+            keep = np.array(
+                [i for i, point_id in enumerate(old["ids"]) if point_id not in replaced],
+                dtype=np.int64,
+            )
+            ids = [old["ids"][i] for i in keep] + list(self._added)
+            payloads = [
+                self._payload_updates.get(old["ids"][i], old["payloads"][i]) for i in keep
+            ] + [payload for _, _, payload in self._added.values()]
+            new_rows = np.asarray(
+                [row for row, _, _ in self._added.values()], dtype=self.dtype
+            ).reshape(-1, self.dim)
+            new_scales = np.asarray([scale for _, scale, _ in self._added.values()], dtype=np.float32)
+
+            old_version = old["version"]
+            version = (old_version or 0) + 1
+            # Surviving rows are copied block by block, so the old matrix is
+            # never materialized in memory
+            with open(self._path(f"vectors.{version}.bin"), "wb") as f:
+                for start in range(0, len(keep), SEARCH_BATCH_ROWS):
+                    block = keep[start : start + SEARCH_BATCH_ROWS]
+                    np.ascontiguousarray(old["matrix"][block]).tofile(f)
+                new_rows.tofile(f)
+            np.save(self._path(f"scales.{version}.npy"), np.concatenate([old["scales"][keep], new_scales]))
+            if old["centroids"] is not None:
+                added = np.argmax(
+                    self._decode(new_rows, new_scales) @ old["centroids"].T, axis=1
+                ).astype(np.int32)
+                self._write_ivf(
+                    version, old["centroids"], np.concatenate([old["assignments"][keep], added])
+                )
+            with open(self._path(f"points.{version}.json"), "w") as f:
+                json.dump({"ids": ids, "payloads": payloads}, f)
+            tmp = self._path("meta.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"version": version, "dim": self.dim, "dtype": self.dtype, "points": len(ids)}, f)
+            os.replace(tmp, self._path("meta.json"))
+
+            self._added.clear()
+            self._removed.clear()
+            self._payload_updates.clear()
+            self._load()
+
+        if old_version is not None:
+            for name in ("vectors.{}.bin", "scales.{}.npy", "points.{}.json", "ivf.{}.npz"):
+                try:
+                    os.remove(self._path(name.format(old_version)))
+                except OSError:
+                    pass
+        if self.nprobe and self._state["centroids"] is None and len(self) >= IVF_MIN_ROWS:
+            self.build_ivf()
+
+    # --- updates --------------------------------------------------------
+
+    def _encode(self, vectors):
+        if self.dtype == "float32":
+            return vectors, np.ones(len(vectors), dtype=np.float32)
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def upsert(self, ids, vectors, payloads=None):
+        """
+        Buffer points to insert or replace (visible after `save`).
+        """
+        ids = [str(i) for i in ids]
+        payloads = payloads or [{} for _ in ids]
+        vectors = _normalize(vectors).reshape(len(ids), self.dim)
+        encoded, scales = self._encode(vectors)
+        with self._lock:
+            for point_id, row, scale, payload in zip(ids, encoded, scales, payloads):
+                self._removed.discard(point_id)
+                self._payload_updates.pop(point_id, None)
+                self._added[point_id] = (row, scale, payload)
+
+    def set_payload(self, point_id, payload):
+        """
+        Buffer a payload replacement for an existing point.
+        """
+        point_id = str(point_id)
+        with self._lock:
+            if point_id in self._added:
+                row, scale, _ = self._added[point_id]
+                self._added[point_id] = (row, scale, payload)
+            elif point_id not in self._removed:
+                self._payload_updates[point_id] = payload
+
+    def delete(self, ids):
+        """
+        Buffer points to remove by ID.
+        """
+        with self._lock:
+            for point_id in ids:
+                point_id = str(point_id)
+                self._added.pop(point_id, None)
+                self._payload_updates.pop(point_id, None)
+                self._removed.add(point_id)
+
+    def __len__(self):
+        """
+        Point count once the buffered changes are saved.
+        """
+        with self._lock:
+            positions = self._state["positions"]
+            return (
+                len(positions)
+                + sum(point_id not in positions for point_id in self._added)
+                - sum(point_id in positions for point_id in self._removed)
+            )
+
+    # --- search ---------------------------------------------------------
+
+    def _decode(self, block, scales):
+        block = np.asarray(block, dtype=np.float32)
+        if self.dtype == "int8":
+            block = block * scales[:, None]
+        return block
+
+    def _rows(self, state, rows):
+        """
+        Dequantized float32 vectors for a slice or index array of rows.
+        """
+        return self._decode(state["matrix"][rows], state["scales"][rows])
+
+    def build_ivf(self, nlist=None, seed=0):
+        """
+        Partition the rows into `nlist` clusters (spherical k-means trained on
+        a sample, default ~sqrt(n) clusters) for approximate search, and
+        store them with the committed version.
+        """
+        with self._lock, file_lock(self._path("commit.lock")):
+            if self._committed_version() != self._state["version"]:
+                self._load()
+            state = self._state
+            n = len(state["ids"])
+            if not n:
+                return
+            nlist = min(n, nlist or max(1, int(np.sqrt(n))))
+            rng = np.random.default_rng(seed)
+            data = self._rows(state, np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False)))
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+            for _ in range(IVF_TRAIN_ITERATIONS):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                empty = np.bincount(labels, minlength=nlist) == 0
+                sums[empty] = centroids[empty]
+                centroids = _normalize(sums)
+            assignments = np.empty(n, dtype=np.int32)
+            for start in range(0, n, SEARCH_BATCH_ROWS):
+                rows = slice(start, min(n, start + SEARCH_BATCH_ROWS))
+                assignments[rows] = np.argmax(self._rows(state, rows) @ centroids.T, axis=1)
+            self._write_ivf(state["version"], centroids, assignments)
+            self._state = {**state, "centroids": centroids, "assignments": assignments}
+
+    def search_vectors(self, queries, top_k=5, nprobe=None, allowed=None, state=None):
+        """
+        Batched search for a (q, dim) array of queries. Returns, per query, a
+        list of (row, score) sorted by descending cosine similarity. `nprobe`
+        switches to IVF search; `allowed` is an optional boolean row mask.
+        Rows refer to `state` (default: the current committed state).
+        """
+        state = state or self._state
+        queries = _normalize(np.atleast_2d(queries))
+        n = len(state["ids"])
+        mask = np.ones(n, dtype=bool) if allowed is None else allowed
+        if nprobe and state["centroids"] is not None:
+            probes = np.argsort(-(queries @ state["centroids"].T), axis=1)[:, :nprobe]
+            return [
+                self._top_k(
+                    state,
+                    query[None, :],
+                    np.flatnonzero(mask & np.isin(state["assignments"], probe)),
+                    top_k,
+                )[0]
+                for query, probe in zip(queries, probes)
+            ]
+        return self._top_k(state, queries, np.flatnonzero(mask), top_k)
+
+    def _top_k(self, state, queries, rows, top_k):
+        """
+        Exact top-k of `queries` against `rows`, scoring in blocks and keeping
+        a running best-k per query.
+        """
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        contiguous = len(rows) == len(state["ids"])  # no filtering: read slices, not gathers
+        for start in range(0, len(rows), SEARCH_BATCH_ROWS):
+            block_rows = rows[start : start + SEARCH_BATCH_ROWS]
+            block = self._rows(
+                state, slice(start, start + len(block_rows)) if contiguous else block_rows
+            )
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            candidates = np.concatenate(
+                [best_rows, np.broadcast_to(block_rows, (len(queries), len(block_rows)))], axis=1
+            )
+            k = min(top_k, scores.shape[1])
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, part, axis=1)
+            best_rows = np.take_along_axis(candidates, part, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [list(zip(r.tolist(), s.tolist())) for r, s in zip(best_rows, best_scores)]
+
+    def search_by_vector(self, query_vector, top_k=5, filter_terms=None, ids=None, nprobe=None):
+        """
+        Same contract as `vectordb.qdrant_setup.search_by_vector`:
+        `filter_terms` restricts hits to these filenames, `ids` to these point IDs.
+        `nprobe` defaults to the index's own (LOCAL_VECTOR_NPROBE).
+        """
+        state = self._state  # one consistent version for the whole query
+        if nprobe is None:
+            nprobe = self.nprobe
+        allowed = None
+        if filter_terms:
+            names = set(filter_terms)
+            allowed = np.array(
+                [(p or {}).get("metadata", {}).get("filename") in names for p in state["payloads"]],
+                dtype=bool,
+            )
+        if ids is not None:
+            positions = state["positions"]
+            id_mask = np.zeros(len(state["ids"]), dtype=bool)
+            id_mask[[positions[str(i)] for i in ids if str(i) in positions]] = True
+            allowed = id_mask if allowed is None else allowed & id_mask
+        rows = self.search_vectors(query_vector, top_k, nprobe=nprobe, allowed=allowed, state=state)[0]
+        return [ScoredHit(state["ids"][r], s, state["payloads"][r]) for r, s in rows]
+
+    def get_payloads(self, ids):
+        """
+        Payloads for point IDs, returned as {id: payload}.
+        """
+        state = self._state
+        positions = state["positions"]
+        return {str(i): state["payloads"][positions[str(i)]] for i in ids if str(i) in positions}
+
+
+def recall_at_k(exact_index, index, queries, top_k=10, nprobe=None):
+    """
+    Mean fraction of `exact_index`'s top-k IDs that `index` also returns for
+    each query. Compare a float32 exact index against a quantized and/or IVF
+    (`nprobe`) index built from the same vectors.
+    """
+    truth = exact_index.search_vectors(queries, top_k)
+    approx = index.search_vectors(queries, top_k, nprobe=nprobe)
+    recalls = []
+    for t, a in zip(truth, approx):
+        expected = {exact_index.ids[r] for r, _ in t}
+        found = {index.ids[r] for r, _ in a}
+        recalls.append(len(expected & found) / max(1, len(expected)))
+    return float(np.mean(recalls)) if recalls else 0.0
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """
+    Return the process-wide local index (storage dtype from LOCAL_VECTOR_DTYPE,
+    IVF probes from LOCAL_VECTOR_NPROBE), reloading it if another process
+    has saved changes since it was opened.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LocalVectorIndex(
+                dtype=os.getenv("LOCAL_VECTOR_DTYPE", "float32"),
+                nprobe=LOCAL_VECTOR_NPROBE or None,
+            )
+    _index.refresh()
+    return _index
+
+
+def search(query: str, top_k=5, filter_terms=None):
+    """
+    Drop-in equivalent of `vectordb.qdrant_setup.search` on the local index.
+    """
+    from vectordb.embeddings import get_openai_embedding
+
+    return get_local_index().search_by_vector(
+        get_openai_embedding(query), top_k=top_k, filter_terms=filter_terms
+    )
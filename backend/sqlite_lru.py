@@ -0,0 +1,104 @@
+"""
+Bounded SQLite store shared by the persistent caches (embeddings, LLM
+extractions).
+
+Each cache keeps one table whose rows carry a `last_used` time; the store
+bounds it to `max_entries` rows with least-recently-used eviction and keeps
+per-process hit/miss counters.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+EVICT_FRACTION = 0.05  # evict in batches so eviction cost is amortized
+
+
+class SQLiteLRU:
+    """
+    Base class for an LRU-bounded cache table. Subclasses set `table` and
+    pass their schema (which must give `table` a `last_used` column); they
+    hold `self._lock` around every use of `self._db`.
+    """
+
+    table = None
+
+    def __init__(self, path, schema, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(schema)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the block in one write transaction. Caller holds `self._lock`.
+        """
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _evict(self, incoming, columns=()):
+        """
+        Delete least-recently-used rows so `incoming` new ones fit, at least
+        EVICT_FRACTION of the capacity at a time. Returns the `columns` of
+        each deleted row. Must be called inside a write transaction.
+        """
+        (entries,) = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        overflow = entries + incoming - self.max_entries
+        if overflow <= 0:
+            return []
+        n = max(overflow, int(self.max_entries * EVICT_FRACTION))
+        victims = self._db.execute(
+            f"SELECT {', '.join(('rowid', *columns))} FROM {self.table} ORDER BY last_used LIMIT ?",
+            (n,),
+        ).fetchall()
+        self._db.executemany(
+            f"DELETE FROM {self.table} WHERE rowid = ?", [(v[0],) for v in victims]
+        )
+        return [v[1:] for v in victims]
+
+    def _record(self, hits, lookups):
+        self.hits += hits
+        self.misses += lookups - hits
+
+    def stats(self):
+        """
+        Return hit/miss counters for this process and the current entry count.
+        """
+        with self._lock:
+            (entries,) = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+
+def shared_instance(factory, disabled=False):
+    """
+    Return a getter for one process-wide `factory()` instance, created on
+    first call. The getter returns None when `disabled`.
+    """
+    instance = None
+    lock = threading.Lock()
+
+    def get():
+        nonlocal instance
+        if disabled:
+            return None
+        with lock:
+            if instance is None:
+                instance = factory()
+            return instance
+
+    return get
@@ -0,0 +1,307 @@
+"""
+Lightweight tracing and metrics for ingestion and retrieval.
+
+    with span("qdrant.upsert", points=len(points)):
+        ...
+    count("rag_external_calls_total", service="openai", op="embeddings")
+    event("⏳ Retrying ...", level="warning")
+
+Spans nest through contextvars (so they follow asyncio tasks), are recorded
+in a latency histogram per span name and, if TRACE_LOG is set, appended to
+a JSON-lines trace log. Counters and histograms are exported in the
+Prometheus text format: served on METRICS_PORT, written to METRICS_FILE at
+exit, or rendered with `prometheus_text()`.
+
+Everything is off unless TELEMETRY=1; disabled calls return after one flag
+check (spans are a shared no-op object). `event` always prints its message,
+so console output is unchanged either way.
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY", "0") == "1"
+TRACE_LOG = os.getenv("TRACE_LOG")  # JSON lines, one record per finished span
+METRICS_FILE = os.getenv("METRICS_FILE")  # Prometheus text, written at exit
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # serve /metrics when set
+
+# Latency histogram bucket bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SPAN_METRIC = "rag_span_seconds"
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_current = contextvars.ContextVar("telemetry_span", default=None)
+_trace_file = None
+_server = None
+
+
+def enabled():
+    return TELEMETRY_ENABLED
+
+
+def enable(trace_log=None, metrics_file=None):
+    """
+    Turn telemetry on at runtime (e.g. from a CLI flag), optionally setting
+    the trace log and metrics file.
+    """
+    global TELEMETRY_ENABLED, TRACE_LOG, METRICS_FILE
+    TELEMETRY_ENABLED = True
+    TRACE_LOG = trace_log or TRACE_LOG
+    METRICS_FILE = metrics_file or METRICS_FILE
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name, value=1, **labels):
+    """
+    Add `value` to a counter.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """
+    Record one latency sample (seconds) in a histogram.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                row[i] += 1
+                break
+        row[-2] += seconds
+        row[-1] += 1
+
+
+class Span:
+    """
+    One timed operation. Use through `span(...)`; `set` adds attributes.
+    """
+
+    __slots__ = ("name", "attrs", "events", "trace_id", "span_id", "parent_id", "start", "_wall", "_token")
+
+    def __init__(self, name, attrs):
+        parent = _current.get()
+        self.name = name
+        self.attrs = attrs
+        self.events = []
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _current.reset(self._token)
+        observe(SPAN_METRIC, seconds, span=self.name)
+        if exc_type is not None:
+            count("rag_span_errors_total", span=self.name)
+        if TRACE_LOG:
+            _write_trace(
+                {
+                    "trace": self.trace_id,
+                    "span": self.span_id,
+                    "parent": self.parent_id,
+                    "name": self.name,
+                    "start": self._wall,
+                    "ms": seconds * 1000,
+                    "pid": os.getpid(),
+                    "attrs": self.attrs,
+                    "events": self.events,
+                    "error": f"{exc_type.__name__}: {exc}" if exc_type else None,
+                }
+            )
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attrs):
+    """
+    Context manager timing a stage; nested spans share the trace of the
+    enclosing one.
+    """
+    if not TELEMETRY_ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def event(message, level="info", **attrs):
+    """
+    Print a status message and, when enabled, attach it to the current span
+    and count it by level.
+    """
+    print(message)
+    if not TELEMETRY_ENABLED:
+        return
+    count("rag_events_total", level=level)
+    current = _current.get()
+    if current is not None:
+        current.events.append({"t": time.time(), "level": level, "message": str(message), **attrs})
+
+
+def _write_trace(record):
+    global _trace_file
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        if _trace_file is None:
+            _trace_file = open(TRACE_LOG, "a", buffering=1)
+        _trace_file.write(line)
+
+
+# --- export ---------------------------------------------------------------
+
+
+def drain():
+    """
+    Return this process's counters and histograms and reset them, for
+    shipping metrics from a worker process to the parent (see `merge`).
+    """
+    with _lock:
+        data = {"counters": list(_counters.items()), "histograms": list(_histograms.items())}
+        _counters.clear()
+        _histograms.clear()
+    return data
+
+
+def merge(data):
+    """
+    Add metrics drained from another process.
+    """
+    if not data:
+        return
+    with _lock:
+        for key, value in data["counters"]:
+            _counters[key] = _counters.get(key, 0) + value
+        for key, row in data["histograms"]:
+            mine = _histograms.setdefault(key, [0] * len(row))
+            for i, value in enumerate(row):
+                mine[i] += value
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def prometheus_text():
+    """
+    All counters and histograms in the Prometheus text exposition format.
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(row)) for key, row in _histograms.items())
+    lines, typed = [], set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), row in histograms:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, n in zip(BUCKETS, row):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, [('le', str(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {row[-1]}")
+        lines.append(f"{name}_sum{_labels(labels)} {row[-2]}")
+        lines.append(f"{name}_count{_labels(labels)} {row[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=None):
+    """
+    Write `prometheus_text()` to `path` (default METRICS_FILE) atomically,
+    e.g. for the node exporter's textfile collector.
+    """
+    path = path or METRICS_FILE
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def serve_metrics(port=None):
+    """
+    Serve `prometheus_text()` at http://0.0.0.0:<port>/metrics from a
+    daemon thread (default METRICS_PORT). Only the first call starts a server.
+    """
+    global _server
+    port = port or METRICS_PORT
+    if not TELEMETRY_ENABLED or not port or _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+    return _server
+
+
+@atexit.register
+def _flush():
+    if TELEMETRY_ENABLED and METRICS_FILE:
+        write_metrics()
+    if _trace_file is not None:
+        _trace_file.close()
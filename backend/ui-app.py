@@ -1,149 +1,162 @@
 import streamlit as st
-import tempfile, os, uuid
 
-from ingest.text import extract_text_from_pdf
-from ingest.image_ocr import extract_text_from_image
-from extract.entity_graph_builder import extract_entities_and_relationships
-from graphdb.neo4j_setup import connect_to_neo4j, insert_graph_data, close_connection
-from vectordb.qdrant_setup import init_collection, add_document
+from ingest.jobs import get_job_queue, submit_extraction, submit_graph, submit_vectors, upload_digest
+from graphdb.neo4j_setup import connect_to_neo4j, get_related_entities
+from vectordb.qdrant_setup import init_collection, make_doc_id, source_key
+from retrieval.hybrid_search import hybrid_search
+from retrieval.query_cache import get_query_cache
+from answer_gen.generate_answer import generate_answer
+from telemetry import serve_metrics
 
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MinShould
-from graphdb.neo4j_setup import GraphDatabase
-from openai import OpenAI
-from ingest.utils import chunk_text
 
-client = QdrantClient(host="localhost", port=6333)
-COLLECTION_NAME = "rag_chunks"
-init_collection()
+
+@st.cache_resource
+def init_backends():
+    """
+    Connect the shared Neo4j/Qdrant clients once per server process rather
+    than on every Streamlit rerun.
+    """
+    serve_metrics()  # Prometheus /metrics on METRICS_PORT when TELEMETRY=1
+    init_collection()
+    try:
+        connect_to_neo4j()
+        get_related_entities("", None)  # load the graph snapshot up front
+    except Exception as e:
+        st.warning(f"Neo4j unavailable: {e}")
+
+
+init_backends()
 
 st.title("🧠 Multimodal RAG Assistant (PDF & Image)")
 
 
 # === File Upload ===
+# Streamlit reruns this script on every interaction, so the heavy work runs
+# as background jobs (ingest/jobs.py) and the page only polls their status.
+# Jobs are memoized by upload content hash: reruns, repeated clicks and other
+# sessions uploading the same file reuse the same job while it runs. Once a
+# job finishes the page `take`s it from the queue and keeps the result in its
+# session, so the shared queue never holds results that were already shown.
 uploaded_file = st.file_uploader(
     "Upload a PDF or Image", type=["pdf", "jpg", "jpeg", "png"]
 )
-if uploaded_file is not None:
-    filetype = uploaded_file.type
-    suffix = "." + uploaded_file.name.split(".")[-1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(uploaded_file.read())
-        tmp_path = tmp.name
+st.session_state.setdefault("jobs", [])
+st.session_state.setdefault("finished", {})  # job id -> finished job taken from the queue
+st.session_state.setdefault("extraction", None)  # (upload key, result) of the current upload
 
-    text = ""
-    metadata = {"filename": uploaded_file.name, "filetype": suffix}
 
-    try:
-        if "pdf" in filetype:
-            result = extract_text_from_pdf(tmp_path)
-            text = result["text"]
-            metadata.update(result["metadata"])
-            st.subheader("📄 PDF Text")
-        elif "image" in filetype:
-            result = extract_text_from_image(tmp_path)
-            text = result["text"]
-            metadata.update(result["metadata"])
-            st.image(tmp_path, caption="Uploaded Image", use_column_width=True)
-            st.subheader("🖼️ Image Text")
+def track(job_id):
+    if job_id not in st.session_state["jobs"]:
+        st.session_state["jobs"].append(job_id)
 
-        if text:
-            st.text_area("📑 Extracted Text", text[:5000], height=300)
 
-            if st.button("Extract Entities & Insert into Neo4j"):
-                graph = extract_entities_and_relationships(text)
-                st.write("Entities:", graph["entities"])
-                st.write("Relationships:", graph["relationships"])
+def job_active(job):
+    return job is not None and job["status"] in ("queued", "running")
 
-                connect_to_neo4j("bolt://localhost:7687", "neo4j", "strongpassword123")
-                insert_graph_data(graph["entities"], graph["relationships"])
-                close_connection()
-                st.success("✅ Inserted into Neo4j")
 
-            if st.button("Insert Chunks into Qdrant"):
-                doc_id = str(uuid.uuid4())
-                add_document(doc_id, text, metadata)  # Uses OpenAI embeddings
-                st.success("✅ Chunks added to Qdrant")
-    finally:
-        os.remove(tmp_path)
-
-
-# === Hybrid Search Logic ===
-class Neo4jConnector:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-
-    def close(self):
-        self.driver.close()
-
-    def get_related_entities(self, source_name, relation_type=None):
-        with self.driver.session() as session:
-            if relation_type:
-                cypher = f"""
-                MATCH (a {{name: $src}})-[r:`{relation_type}`]->(b)
-                RETURN DISTINCT b.name AS name
-                """
-                result = session.run(cypher, src=source_name)
-            else:
-                cypher = """
-                MATCH (a {name: $src})-[r]->(b)
-                RETURN DISTINCT b.name AS name
-                """
-                result = session.run(cypher, src=source_name)
+def job_state(job_id):
+    """
+    The job as this session last saw it: taken out of the queue (and kept
+    in the session) once it has finished.
+    """
+    finished = st.session_state["finished"]
+    if job_id not in finished:
+        job = get_job_queue().take(job_id)
+        if job is None or job_active(job):
+            return job
+        finished[job_id] = job
+    return finished[job_id]
 
-            return [record["name"] for record in result]
 
+def extraction_status(job_id):
+    # Polled as a fragment until the extraction job finishes, then reruns
+    # the whole page to show its result
+    job = get_job_queue().get(job_id)
+    if job_active(job):
+        st.progress(job["progress"], text=f"⏳ {job['message']}")
+    else:
+        st.rerun()
 
-def get_openai_embedding(text):
-    client = OpenAI()
-    response = client.embeddings.create(input=[text], model="text-embedding-3-small")
-    return response.data[0].embedding
 
+if uploaded_file is not None:
+    data = uploaded_file.getvalue()
+    upload_key = (upload_digest(data), uploaded_file.name)
+    extraction = None
+    if st.session_state["extraction"] and st.session_state["extraction"][0] == upload_key:
+        extraction = st.session_state["extraction"][1]
+    else:
+        job = get_job_queue().take(submit_extraction(data, uploaded_file.name))
+        if job is None:
+            st.rerun()  # another session took the finished job; submit again
+        elif job_active(job):
+            st.fragment(run_every=1)(extraction_status)(job["id"])
+        elif job["status"] == "failed":
+            st.error(f"Extraction failed: {job['error']}")
+        else:
+            extraction = job["result"]
+            st.session_state["extraction"] = (upload_key, extraction)
+
+    if extraction is not None:
+        if "image" in uploaded_file.type:
+            st.image(data, caption="Uploaded Image", use_column_width=True)
+            st.subheader("🖼️ Image Text")
+        else:
+            st.subheader("📄 PDF Text")
+
+        if extraction["text"]:
+            st.text_area("📑 Extracted Text", extraction["text"][:5000], height=300)
+            # Same document as a file of this name at the root of a CLI ingest
+            doc_id = make_doc_id(source_key(uploaded_file.name))
 
-def hybrid_search(user_query: str, source_node: str, relation_type: str = None):
-    st.write(f"Running hybrid search for: `{user_query}` via `{source_node}`")
+            if st.button("Extract Entities & Insert into Neo4j"):
+                track(submit_graph(extraction, doc_id, uploaded_file.name))
 
-    connector = Neo4jConnector("bolt://localhost:7687", "neo4j", "strongpassword123")
-    try:
-        related = connector.get_related_entities(source_node, relation_type)
-        if source_node not in related:
-            related.insert(0, source_node)
-    except Exception as e:
-        st.error(f"Neo4j error: {e}")
-        related = []
-    finally:
-        connector.close()
-
-    qdrant_filter = None
-    if related:
-        must_conditions = []
-        for ent in related:
-            must_conditions.append(
-                FieldCondition(key="text", match=MatchValue(value="ent"))
-            )
-        qdrant_filter = Filter(
-            should=must_conditions,
-            must=None,
-            must_not=None,
-            min_should=MinShould(conditions=must_conditions, min_count=1),
+            if st.button("Insert Chunks into Qdrant"):
+                track(submit_vectors(extraction, doc_id, uploaded_file.name))
+
+
+def show_result(job):
+    result = job["result"]
+    if job["kind"] == "graph":
+        st.write("Entities:", result["entities"])
+        st.write("Relationships:", result["relationships"])
+        if result["aliases"]:
+            st.write("Merged aliases:", result["aliases"])
+        graph_stats = result["stats"]
+        st.success(
+            f"✅ Inserted {graph_stats['entities']} entities and "
+            f"{graph_stats['relationships']} relationships into Neo4j "
+            f"in {graph_stats['seconds']:.2f}s"
+        )
+    elif job["kind"] == "vector":
+        st.success(
+            f"✅ {result['chunks']} chunks synced to Qdrant: "
+            f"{result['embedded']} embedded ({result['chunks_per_sec']:.1f} chunks/sec), "
+            f"{result['unchanged']} unchanged, {result['deleted']} deleted"
         )
-        print("qdrant_filter")
-        print(qdrant_filter)
 
-    try:
-        query_vector = get_openai_embedding(user_query)
 
-        results = client.search(
-            collection_name="rag_chunks",
-            query_vector=query_vector,
-            limit=5,
-            query_filter=qdrant_filter,
-        )
+def jobs_panel(polling):
+    jobs = [job for job in map(job_state, st.session_state["jobs"]) if job is not None]
+    if not jobs:
+        return
+    st.markdown("### ⚙️ Ingestion Jobs")
+    for job in jobs:
+        title = f"{job['kind']} · {job['filename']} · {job['status']}"
+        with st.expander(title, expanded=job["status"] != "done"):
+            if job_active(job):
+                st.progress(job["progress"], text=job["message"])
+            elif job["status"] == "failed":
+                st.error(job["error"])
+            else:
+                show_result(job)
+    if polling and not any(job_active(job) for job in jobs):
+        st.rerun()  # stop polling once everything has finished
 
-        return results
-    except Exception as e:
-        st.error(f"Qdrant search error: {e}")
-        return []
+
+# Re-render the panel every second only while some job is still running
+_active = any(job_active(job_state(job_id)) for job_id in st.session_state["jobs"])
+st.fragment(run_every=1 if _active else None)(jobs_panel)(_active)
 
 
 # === Hybrid Search UI ===
@@ -153,9 +166,47 @@ st.subheader("🔍 Ask a Question with Graph Context")
 query = st.text_input("Natural language query:")
 source_node = st.text_input("Filter using node (optional):", "")
 if st.button("Run Hybrid Search"):
-    results = hybrid_search(query, source_node.strip())
+    st.write(f"Running hybrid search for: `{query}` via `{source_node}`")
+    response = hybrid_search(query, source_node.strip() or None)
+    for stage, status in response["status"].items():
+        if status != "ok":
+            st.warning(f"{stage}: {status}")
+    st.caption(
+        " · ".join(f"{stage} {ms:.0f} ms" for stage, ms in response["timings"].items())
+    )
+    cache = get_query_cache()
+    if cache is not None:
+        stats = cache.stats()
+        served = f"served from cache ({response['cache']}) · " if response["cache"] else ""
+        st.caption(
+            f"{served}query cache hit rate {stats['hit_rate']:.0%} "
+            f"({stats['exact_hits']} exact, {stats['semantic_hits']} similar, {stats['misses']} misses)"
+        )
+
+    # Chunks render before the answer streams in above them, so a failed or
+    # slow generation never hides the retrieved results
+    st.markdown("### 💬 Answer")
+    answer_section = st.container()
+
     st.markdown("### 🔬 Top Matching Chunks")
-    for i, r in enumerate(results):
-        with st.expander(f"Result {i+1}"):
-            st.write(r.payload["text"])
-            st.json(r.payload["metadata"])
+    for i, r in enumerate(response["results"]):
+        page = r["payload"]["metadata"].get("page")
+        with st.expander(f"Result {i+1}" + (f" (page {page})" if page else "")):
+            st.write(r["payload"]["text"])
+            st.json(r["payload"]["metadata"])
+
+    with answer_section:
+        answer_box = st.empty()
+        try:
+            answer = generate_answer(query, response["results"], on_token=answer_box.markdown)
+        except Exception as e:
+            answer_box.error(f"Answer generation failed: {e}")
+        else:
+            if answer["context"]:
+                ttft = f"{answer['ttft']:.2f}s" if answer["ttft"] is not None else "n/a"
+                st.caption(
+                    f"first token {ttft} · total {answer['seconds']:.2f}s · "
+                    f"{len(answer['context'])} passages, {answer['context_tokens']} context tokens"
+                )
+            else:
+                answer_box.info("No context retrieved to answer from.")
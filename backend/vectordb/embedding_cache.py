@@ -0,0 +1,172 @@
+import os
+import time
+
+import numpy as np
+
+from ingest.utils import content_hash, get_cache_path
+from sqlite_lru import SQLiteLRU, shared_instance
+
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "100000"))
+EMBED_CACHE_DISABLED = os.getenv("EMBED_CACHE_DISABLED", "0") == "1"
+GROWTH_STEP = 4096  # slots added each time a vector file grows
+
+
+class EmbeddingCache(SQLiteLRU):
+    """
+    Persistent, content-addressed embedding cache.
+
+    Entries are keyed by (model, sha256(text)). The index lives in SQLite and
+    the vectors in one memory-mapped float32 file per dimension, so lookups
+    read only the rows they need. The cache is bounded to `max_entries` with
+    least-recently-used eviction; freed slots are recycled.
+    """
+
+    table = "entries"
+
+    def __init__(self, directory=None, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.directory = directory or os.path.dirname(get_cache_path("embeddings", "index.db"))
+        os.makedirs(self.directory, exist_ok=True)
+        self._arrays = {}  # dim -> np.memmap
+        super().__init__(
+            os.path.join(self.directory, "index.db"),
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (dim INTEGER NOT NULL, slot INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS slot_counters (dim INTEGER PRIMARY KEY, next_slot INTEGER NOT NULL);
+            """,
+            max_entries,
+        )
+
+    # --- vector storage -------------------------------------------------
+
+    def _array(self, dim, min_slots=0):
+        """
+        Return the memmap for `dim`, growing the backing file if it has fewer
+        than `min_slots` rows.
+        """
+        path = os.path.join(self.directory, f"vectors_{dim}.f32")
+        array = self._arrays.get(dim)
+        current = os.path.getsize(path) // (4 * dim) if os.path.exists(path) else 0
+        if current < min_slots:
+            new_slots = ((min_slots // GROWTH_STEP) + 1) * GROWTH_STEP
+            with open(path, "ab") as f:
+                f.truncate(new_slots * 4 * dim)
+            current = new_slots
+            array = None
+        if array is None or array.shape[0] != current:
+            if current == 0:
+                return None
+            array = np.memmap(path, dtype=np.float32, mode="r+", shape=(current, dim))
+            self._arrays[dim] = array
+        return array
+
+    def _allocate_slots(self, dim, count):
+        """
+        Take `count` slots for `dim` from the free list, then from the end of
+        the file. Must be called inside a write transaction.
+        """
+        rows = self._db.execute(
+            "SELECT rowid, slot FROM free_slots WHERE dim = ? LIMIT ?", (dim, count)
+        ).fetchall()
+        if rows:
+            self._db.executemany("DELETE FROM free_slots WHERE rowid = ?", [(r[0],) for r in rows])
+        slots = [r[1] for r in rows]
+        remaining = count - len(slots)
+        if remaining:
+            row = self._db.execute(
+                "SELECT next_slot FROM slot_counters WHERE dim = ?", (dim,)
+            ).fetchone()
+            start = row[0] if row else 0
+            self._db.execute(
+                "INSERT OR REPLACE INTO slot_counters (dim, next_slot) VALUES (?, ?)",
+                (dim, start + remaining),
+            )
+            slots.extend(range(start, start + remaining))
+        return slots
+
+    def _free(self, incoming):
+        """
+        Evict least-recently-used entries so `incoming` new ones fit and
+        recycle their slots. Must be called inside a write transaction.
+        """
+        victims = self._evict(incoming, ("dim", "slot"))
+        self._db.executemany("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", victims)
+
+    # --- public API -----------------------------------------------------
+
+    def get_many(self, model, texts):
+        """
+        Look up embeddings for `texts`. Returns a list aligned with `texts`
+        holding a vector (list of floats) or None for each miss.
+        """
+        hashes = [content_hash(t) for t in texts]
+        results = [None] * len(texts)
+        with self._lock:
+            found = {}
+            for i in range(0, len(hashes), 500):
+                part = hashes[i : i + 500]
+                placeholders = ",".join("?" * len(part))
+                for h, dim, slot in self._db.execute(
+                    f"SELECT hash, dim, slot FROM entries WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *part],
+                ):
+                    found[h] = (dim, slot)
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, h) for h in found],
+                )
+            for i, h in enumerate(hashes):
+                if h in found:
+                    dim, slot = found[h]
+                    array = self._array(dim, slot + 1)
+                    results[i] = array[slot].tolist()
+            self._record(sum(r is not None for r in results), len(texts))
+        return results
+
+    def put_many(self, model, texts, vectors):
+        """
+        Store embeddings for `texts`, evicting old entries if the cache is full.
+        """
+        if not texts:
+            return
+        items = {content_hash(t): v for t, v in zip(texts, vectors)}
+        dim = len(next(iter(items.values())))
+        now = time.time()
+        with self._lock, self._transaction():
+            existing = set()
+            keys = list(items)
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                placeholders = ",".join("?" * len(part))
+                existing.update(
+                    h
+                    for (h,) in self._db.execute(
+                        f"SELECT hash FROM entries WHERE model = ? AND hash IN ({placeholders})",
+                        [model, *part],
+                    )
+                )
+            new = [h for h in keys if h not in existing][-self.max_entries :]
+            self._free(len(new))
+            slots = self._allocate_slots(dim, len(new))
+            if new:
+                array = self._array(dim, max(slots) + 1)
+                array[slots] = np.asarray([items[h] for h in new], dtype=np.float32)
+                array.flush()
+            self._db.executemany(
+                "INSERT INTO entries (model, hash, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(model, h, dim, slot, now) for h, slot in zip(new, slots)],
+            )
+
+
+# Process-wide embedding cache, or None if caching is disabled
+get_embedding_cache = shared_instance(EmbeddingCache, disabled=EMBED_CACHE_DISABLED)
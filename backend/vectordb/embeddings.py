@@ -0,0 +1,118 @@
+import contextvars
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+import openai
+
+from openai_retry import with_retries
+from telemetry import count, event, span
+from vectordb.embedding_cache import get_embedding_cache
+
+# Ensure the OpenAI API key is loaded
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))  # inputs per request
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))  # requests in flight
+
+
+def embed_batch(texts, model=EMBEDDING_MODEL):
+    """
+    Embed a list of texts in a single OpenAI request, retrying rate limits
+    and transient errors (see `openai_retry`). Returns vectors in input order.
+    """
+
+    def request(attempt):
+        with span("openai.embeddings", model=model, inputs=len(texts), attempt=attempt):
+            count("rag_external_calls_total", service="openai", op="embeddings")
+            return openai.embeddings.create(model=model, input=list(texts))
+
+    response = with_retries(request, op="embeddings", label="Embedding")
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        count("rag_tokens_total", usage.total_tokens or 0, model=model, kind="embedding")
+    data = sorted(response.data, key=lambda d: d.index)
+    return [d.embedding for d in data]
+
+
+def embed_texts(texts, model=EMBEDDING_MODEL):
+    """
+    Embed texts through the shared on-disk cache: cached vectors are returned
+    directly and only the misses are sent to OpenAI (in one request).
+    """
+    texts = list(texts)
+    cache = get_embedding_cache()
+    if cache is None:
+        return embed_batch(texts, model=model)
+
+    vectors = cache.get_many(model, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    count("rag_cache_requests_total", len(texts) - len(missing), cache="embedding", result="hit")
+    count("rag_cache_requests_total", len(missing), cache="embedding", result="miss")
+    if missing:
+        fresh = embed_batch([texts[i] for i in missing], model=model)
+        cache.put_many(model, [texts[i] for i in missing], fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return vectors
+
+
+def get_openai_embedding(text, model=EMBEDDING_MODEL):
+    """
+    Get the OpenAI embedding for a single text (cached).
+    """
+    return embed_texts([text], model=model)[0]
+
+
+def _batches(items, batch_size):
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def embed_stream(
+    items,
+    key=lambda item: item,
+    batch_size=EMBED_BATCH_SIZE,
+    max_concurrency=EMBED_MAX_CONCURRENCY,
+    model=EMBEDDING_MODEL,
+):
+    """
+    Embed an iterable of items in batches, keeping at most `max_concurrency`
+    requests in flight. `key` maps an item to the text to embed.
+
+    Yields (item, vector) pairs as batches complete, so callers can start
+    writing vectors before the whole input has been embedded. The input is
+    consumed lazily, so only the in-flight batches are held in memory.
+    """
+    batches = _batches(items, batch_size)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        in_flight = {}
+
+        def submit_next():
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            # Run in the caller's context so embedding spans nest under its span
+            future = pool.submit(
+                contextvars.copy_context().run, embed_texts, [key(item) for item in batch], model
+            )
+            in_flight[future] = batch
+            return True
+
+        for _ in range(max_concurrency):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                vectors = future.result()
+                submit_next()
+                for item, vector in zip(batch, vectors):
+                    yield item, vector
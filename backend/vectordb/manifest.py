@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+
+from ingest.utils import get_cache_path
+
+
+class IndexManifest:
+    """
+    Local record of which chunks of which document are in the vector store.
+
+    For every document we keep its point IDs together with the chunk content
+    hash and position, so a re-ingest can diff the new chunking against what
+    is already indexed and only touch the chunks that changed.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path or get_cache_path("manifest.db"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_id TEXT NOT NULL,
+                point_id TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                PRIMARY KEY (doc_id, point_id)
+            )
+            """
+        )
+
+    def get_document(self, doc_id):
+        """
+        Return {point_id: chunk_index} for the chunks indexed under `doc_id`.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT point_id, chunk_index FROM chunks WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def set_document(self, doc_id, chunks):
+        """
+        Replace the record for `doc_id` with `chunks`, a list of
+        (point_id, chunk_hash, chunk_index) tuples.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._db.executemany(
+                    "INSERT INTO chunks (doc_id, point_id, chunk_hash, chunk_index) VALUES (?, ?, ?, ?)",
+                    [(doc_id, *chunk) for chunk in chunks],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def documents(self):
+        """
+        Return the IDs of all indexed documents.
+        """
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT DISTINCT doc_id FROM chunks")]
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    """
+    Return the process-wide index manifest.
+    """
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = IndexManifest()
+        return _manifest
@@ -1,24 +1,133 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
-from ingest.utils import chunk_text
-from uuid import uuid4
-import openai
+from qdrant_client.http.models import (
+    Distance,
+    Filter,
+    HasIdCondition,
+    VectorParams,
+    PointStruct,
+    PointIdsList,
+    SetPayload,
+    SetPayloadOperation,
+)
+from ingest.utils import chunk_segments, content_hash
+from vectordb.embeddings import embed_stream, get_openai_embedding
+from vectordb.manifest import get_manifest
+from retrieval.keyword_search import get_keyword_index
+from retrieval.query_cache import invalidate_query_cache
+from clients import get_qdrant_client
+import telemetry
+from uuid import NAMESPACE_URL, uuid5
 import os
+import threading
+import time
 
-# Ensure the OpenAI API key is loaded
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-client = QdrantClient(host="localhost", port=6333)
+# The Qdrant client comes from clients.get_qdrant_client() at each call, so it
+# is only created when the "qdrant" backend is actually used.
 COLLECTION_NAME = "rag_chunks"
 VECTOR_DIM = 1536  # OpenAI text-embedding-3-small output dimension
+UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+
+# "qdrant" (server) or "local" (the in-process NumPy index in retrieval.vector_search)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+
+# Namespace for point IDs; changing it re-keys the whole collection.
+CHUNK_NAMESPACE = uuid5(NAMESPACE_URL, "aparavitask/rag_chunks")
+
+# Manifest records of documents added with commit=False. They are written by
+# `commit_indexes` only after the local indexes are persisted; otherwise a crash
+# in between would leave the manifest claiming chunks the indexes never saved.
+_pending_manifest = {}  # doc_id -> [(point_id, chunk_hash, chunk_index)]
+_pending_lock = threading.Lock()
+
+
+def source_key(path: str, root: str = None) -> str:
+    """
+    Canonical source of a file: its path relative to the ingest `root`,
+    "/"-separated. Without a root (a UI upload, a single file) it is the
+    base name, i.e. the key of a file of that name at the root, so ingesting
+    a file from the CLI and uploading it in the UI is one document, while
+    "a/report.pdf" and "b/report.pdf" stay two.
+    """
+    if root is None or os.path.isfile(root):
+        return os.path.basename(path)
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def make_doc_id(source: str) -> str:
+    """
+    Stable document ID for a `source_key`, so re-ingesting the same source
+    updates the same points.
+    """
+    return str(uuid5(CHUNK_NAMESPACE, source))
+
+
+def make_point_id(doc_id: str, chunk: str) -> str:
+    """
+    Deterministic Qdrant point ID for a chunk: a UUID derived from the
+    document ID and the chunk's content hash.
+    """
+    return str(uuid5(CHUNK_NAMESPACE, f"{doc_id}:{content_hash(chunk)}"))
 
 
-def get_openai_embedding(text):
+def _local_index():
+    from retrieval.vector_search import get_local_index
+
+    return get_local_index()
+
+
+def _upsert(points):
+    with telemetry.span("qdrant.upsert", points=len(points), backend=VECTOR_BACKEND):
+        if VECTOR_BACKEND == "local":
+            _local_index().upsert(
+                [p.id for p in points], [p.vector for p in points], [p.payload for p in points]
+            )
+        else:
+            telemetry.count("rag_external_calls_total", service="qdrant", op="upsert")
+            get_qdrant_client().upsert(collection_name=COLLECTION_NAME, points=points)
+    telemetry.count("rag_points_written_total", len(points))
+
+
+def _set_payloads(operations):
+    if VECTOR_BACKEND == "local":
+        for op in operations:
+            for point_id in op.set_payload.points:
+                _local_index().set_payload(point_id, op.set_payload.payload)
+    else:
+        get_qdrant_client().batch_update_points(
+            collection_name=COLLECTION_NAME, update_operations=operations
+        )
+
+
+def _delete(ids):
+    if VECTOR_BACKEND == "local":
+        _local_index().delete(ids)
+    else:
+        get_qdrant_client().delete(
+            collection_name=COLLECTION_NAME, points_selector=PointIdsList(points=ids)
+        )
+
+
+def commit_indexes():
     """
-    Get the OpenAI embedding for a given text using text-embedding-3-small model.
+    Persist the local indexes (BM25 and, with the local backend, vectors),
+    then record the documents added since the last commit in the manifest.
     """
-    response = openai.embeddings.create(model="text-embedding-3-small", input=text)
-    return response.data[0].embedding
+    global _pending_manifest
+    # Taken before committing: every record in it was buffered after its chunks
+    with _pending_lock:
+        pending, _pending_manifest = _pending_manifest, {}
+    try:
+        get_keyword_index().commit()
+        if VECTOR_BACKEND == "local":
+            _local_index().save()
+    except Exception:
+        with _pending_lock:
+            _pending_manifest = {**pending, **_pending_manifest}
+        raise
+    manifest = get_manifest()
+    for doc_id, rows in pending.items():
+        manifest.set_document(doc_id, rows)
+    if pending:
+        invalidate_query_cache()
 
 
 def init_collection():
@@ -26,53 +135,201 @@ def init_collection():
     Create the Qdrant collection with the correct vector dimension and distance,
     if it doesn't already exist.
     """
-    existing = client.get_collections().collections
+    if VECTOR_BACKEND == "local":
+        return
+    existing = get_qdrant_client().get_collections().collections
     names = [c.name for c in existing]
     if COLLECTION_NAME not in names:
-        client.create_collection(
+        get_qdrant_client().create_collection(
             collection_name=COLLECTION_NAME,
             vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
         )
 
 
-def add_document(id: str, text: str, metadata: dict):
+def document_chunks(id: str, text: str, segments=None):
     """
-    Chunk the text, embed each chunk with OpenAI, and upsert into Qdrant.
+    The chunks `add_document` stores for a document, in order, as
+    (point_id, {"text", "metadata"}, chunk_index); empty and duplicate
+    chunks are skipped. Lets other stages (e.g. graph extraction) refer to
+    chunks by point ID without a round trip to the vector store.
     """
-    chunks = chunk_text(text)
+    if segments is None:
+        segments = [{"text": text, "metadata": {}}]
+    emitted = set()
+    for i, chunk in enumerate(chunk_segments(segments)):
+        if not chunk["text"].strip():
+            continue
+        point_id = make_point_id(id, chunk["text"])
+        if point_id in emitted:
+            continue
+        emitted.add(point_id)
+        yield point_id, chunk, i
 
-    points = []
-    for i, chunk in enumerate(chunks):
-        embedding = get_openai_embedding(chunk)
-        chunk_meta = metadata.copy()
+
+def add_document(id: str, text: str, metadata: dict, segments=None, commit=True):
+    """
+    Chunk the text and incrementally sync it into Qdrant under document `id`.
+
+    If `segments` (an iterable of {"text", "metadata"} records such as the PDF
+    pages from `iter_pdf_pages`) is given, it is chunked lazily instead of
+    `text`, and each chunk's payload carries its segment metadata (e.g. page).
+    Chunks flow straight into embedding, so work starts before the input is
+    exhausted and only in-flight batches are held in memory.
+
+    Point IDs are derived from the document ID and chunk content, and the
+    local manifest records what is already indexed, so only new or changed
+    chunks are embedded and upserted (in concurrent batches, streamed in
+    fixed-size upserts), chunks that vanished are deleted, and chunks that
+    merely moved get their payload position updated.
+
+    The same chunk changes are applied to the local BM25 keyword index;
+    batch callers can pass commit=False and call `commit_indexes` once at the
+    end, which is also when the document's manifest record is written.
+    Cached query results are dropped whenever anything changed.
+    Returns stats: {"chunks", "embedded", "unchanged", "deleted", "seconds", "chunks_per_sec"}.
+    """
+    start = time.perf_counter()
+    manifest = get_manifest()
+    keyword_index = get_keyword_index()
+    with _pending_lock:
+        pending = _pending_manifest.get(id)
+    if pending is not None:
+        previous = {pid: i for pid, _, i in pending}
+    else:
+        previous = manifest.get_document(id)
+
+    seen = {}  # point_id -> (chunk_hash, chunk_index)
+    moved = []
+
+    def payload(chunk, i):
+        chunk_meta = {**metadata, **chunk["metadata"]}
         chunk_meta["chunk_index"] = i
-        points.append(
-            PointStruct(
-                id=i,
-                vector=embedding,
-                payload={"text": chunk, "metadata": chunk_meta},
-            )
-        )
+        chunk_meta["doc_id"] = id
+        return {"text": chunk["text"], "metadata": chunk_meta}
 
-    client.upsert(collection_name=COLLECTION_NAME, points=points)
+    moved_count = 0
 
+    def flush_moved():
+        nonlocal moved_count
+        if moved:
+            _set_payloads(moved)
+            moved_count += len(moved)
+            moved.clear()
 
-def search(query: str, top_k=5, filter_terms=None):
+    def new_chunks():
+        for point_id, chunk, i in document_chunks(id, text, segments):
+            seen[point_id] = (content_hash(chunk["text"]), i)
+            if point_id not in previous:
+                yield point_id, chunk, i
+            elif previous[point_id] != i:
+                moved.append(
+                    SetPayloadOperation(
+                        set_payload=SetPayload(payload=payload(chunk, i), points=[point_id])
+                    )
+                )
+                if len(moved) >= UPSERT_BATCH_SIZE:
+                    flush_moved()
+
+    points = []
+    count = 0
+    for (point_id, chunk, i), embedding in embed_stream(new_chunks(), key=lambda c: c[1]["text"]):
+        points.append(PointStruct(id=point_id, vector=embedding, payload=payload(chunk, i)))
+        keyword_index.add(point_id, chunk["text"])
+        if len(points) >= UPSERT_BATCH_SIZE:
+            _upsert(points)
+            count += len(points)
+            points = []
+
+    if points:
+        _upsert(points)
+        count += len(points)
+    flush_moved()
+
+    stale = [pid for pid in previous if pid not in seen]
+    if stale:
+        _delete(stale)
+        for point_id in stale:
+            keyword_index.remove(point_id)
+    rows = [(pid, chunk_hash, i) for pid, (chunk_hash, i) in seen.items()]
+    with _pending_lock:
+        _pending_manifest[id] = rows
+    if commit:
+        commit_indexes()
+    if count or moved_count or stale:
+        invalidate_query_cache()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    telemetry.event(
+        f"✅ Synced {len(seen)} chunks in {elapsed:.2f}s: {count} embedded "
+        f"({rate:.1f} chunks/sec), {len(seen) - count} unchanged, {len(stale)} deleted"
+    )
+    return {
+        "chunks": len(seen),
+        "embedded": count,
+        "unchanged": len(seen) - count,
+        "deleted": len(stale),
+        "seconds": elapsed,
+        "chunks_per_sec": rate,
+    }
+
+
+def search_by_vector(query_vector, top_k=5, filter_terms=None, query_filter=None, ids=None):
     """
-    Perform a semantic search in Qdrant using OpenAI embeddings and optional filtering.
+    Nearest-neighbour search in Qdrant for an already computed query vector.
+    `filter_terms` restricts hits to the given filenames and `ids` to the
+    given point IDs (a HasId filter, applied inside the index search);
+    `query_filter` is passed through as-is.
     """
-    query_vector = get_openai_embedding(query)
+    if VECTOR_BACKEND == "local":
+        return _local_index().search_by_vector(
+            query_vector, top_k=top_k, filter_terms=filter_terms, ids=ids
+        )
 
-    search_filter = None
+    search_filter = query_filter
     if filter_terms:
         search_filter = {
             "must": [{"key": "metadata.filename", "match": {"any": filter_terms}}]
         }
+    if ids is not None:
+        if not ids:
+            return []
+        has_id = HasIdCondition(has_id=list(ids))
+        if search_filter is None:
+            search_filter = Filter(must=[has_id])
+        elif isinstance(search_filter, dict):
+            search_filter = {**search_filter, "must": [*search_filter.get("must", []), has_id]}
+        else:
+            search_filter = Filter(
+                must=[*(search_filter.must or []), has_id],
+                should=search_filter.should,
+                must_not=search_filter.must_not,
+            )
 
-    results = client.search(
+    results = get_qdrant_client().search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
         limit=top_k,
         query_filter=search_filter,
     )
     return results
+
+
+def search(query: str, top_k=5, filter_terms=None):
+    """
+    Perform a semantic search in Qdrant using OpenAI embeddings and optional filtering.
+    """
+    query_vector = get_openai_embedding(query)
+    return search_by_vector(query_vector, top_k=top_k, filter_terms=filter_terms)
+
+
+def get_payloads(ids):
+    """
+    Fetch payloads for point IDs, returned as {id: payload}.
+    """
+    if VECTOR_BACKEND == "local":
+        return _local_index().get_payloads(ids)
+    points = get_qdrant_client().retrieve(
+        collection_name=COLLECTION_NAME, ids=list(ids), with_payload=True, with_vectors=False
+    )
+    return {str(p.id): p.payload for p in points}